@@ -0,0 +1,100 @@
+"""Compare the FileSystemUploader with the former cp and chmod based implementation
+
+Run it in the environment of the bot:
+
+    $ bin/python benchmarks/file_system_uploader.py --count 200 --size 2000000 --target /var/www/files
+
+Use a target on another file system than the temp directory to measure copying instead of hard linking.
+"""
+import argparse
+import importlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import time
+import types
+from tempfile import NamedTemporaryFile, TemporaryDirectory, gettempdir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_module_only(name: str):
+    """Import a module of the bot without running the __init__ of the bot packages
+
+    The package __init__ files need the settings and a MongoDB connection, which a benchmark of file copies does not.
+    """
+    for package_name in ['xenian', 'xenian.bot', 'xenian.bot.utils', 'xenian.bot.uploaders']:
+        if package_name not in sys.modules:
+            package = types.ModuleType(package_name)
+            package.__path__ = [os.path.join(ROOT, *package_name.split('.'))]
+            sys.modules[package_name] = package
+    return importlib.import_module(name)
+
+
+FileSystemUploader = import_module_only('xenian.bot.uploaders.file_system').FileSystemUploader
+
+
+def legacy_upload(file, filename: str, save_dir: str):
+    """The former implementation of FileSystemUploader.upload without removal scheduling"""
+    is_file_object = bool(getattr(file, 'read', False))
+    if is_file_object:
+        with NamedTemporaryFile(delete=False) as new_file:
+            file.seek(0)
+            new_file.write(file.read())
+            real_file = new_file.name
+    else:
+        real_file = file
+
+    save_path = os.path.realpath(os.path.join(save_dir, filename))
+    subprocess.call(['cp', os.path.realpath(real_file), save_path])
+    subprocess.call(['chmod', '644', save_path])
+
+    if is_file_object:
+        os.unlink(real_file)
+
+
+def measure(name: str, upload: callable, sources: list, count: int) -> float:
+    start = time.perf_counter()
+    for index in range(count):
+        upload(sources[index % len(sources)], f'{name}-{index}.bin')
+    duration = time.perf_counter() - start
+    print(f'{name:<32} {duration:8.3f}s {duration / count * 1000:8.3f}ms per file')
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200, help='Number of uploads per run')
+    parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help='Size of each file in bytes')
+    parser.add_argument('--target', default=None, help='Directory to upload to, defaults to a temp directory')
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size)
+    with TemporaryDirectory() as source_dir, TemporaryDirectory(dir=args.target or gettempdir()) as target_dir:
+        source_path = os.path.join(source_dir, 'source.bin')
+        with open(source_path, 'wb') as source_file:
+            source_file.write(payload)
+
+        uploader = FileSystemUploader({'path': target_dir})
+
+        def run(name: str, upload: callable, sources: list):
+            result = measure(name, upload, sources, args.count)
+            shutil.rmtree(target_dir)
+            os.makedirs(target_dir)
+            return result
+
+        print(f'{args.count} uploads of {args.size} bytes to {target_dir}')
+        legacy_path = run('legacy, path', lambda file, name: legacy_upload(file, name, target_dir), [source_path])
+        new_path = run('in process, path', lambda file, name: uploader.upload(file, name), [source_path])
+        legacy_object = run('legacy, file object', lambda file, name: legacy_upload(file, name, target_dir),
+                            [io.BytesIO(payload)])
+        new_object = run('in process, file object', lambda file, name: uploader.upload(file, name),
+                         [io.BytesIO(payload)])
+
+        print(f'Speedup for paths: {legacy_path / new_path:.1f}x, for file objects: {legacy_object / new_object:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
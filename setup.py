@@ -19,6 +19,7 @@ setup(name='XenianBot',
       zip_safe=False,
 
       install_requires=[
+          'boto3',
           'emoji',
           'googletrans',
           'gtts',
@@ -26,6 +27,7 @@ setup(name='XenianBot',
           'mako',
           'moviepy',
           'mr.developer',
+          'numpy',
           'paramiko',
           'pillow',
           'pybooru',
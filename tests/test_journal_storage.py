@@ -0,0 +1,30 @@
+from xenian.bot.utils.data import JournalStorage
+
+
+def test_append_after_incomplete_entry_survives_reload(tmp_path):
+    storage = JournalStorage(str(tmp_path))
+    storage.append('dataset', [{'op': 'set', 'path': ['first'], 'value': 1}])
+
+    # Crash while appending the second entry
+    with open(storage.get_path('dataset', '.journal'), mode='a', encoding='utf-8') as journal_file:
+        journal_file.write('{"op": "set", "path": ["sec')
+
+    data, replayed = storage.load('dataset')
+    assert data == {'first': 1}
+    assert replayed == 1
+
+    storage.append('dataset', [{'op': 'set', 'path': ['third'], 'value': 3}])
+    data, replayed = storage.load('dataset')
+    assert data == {'first': 1, 'third': 3}
+    assert replayed == 2
+
+
+def test_complete_entry_without_line_break_is_kept(tmp_path):
+    storage = JournalStorage(str(tmp_path))
+    with open(storage.get_path('dataset', '.journal'), mode='w', encoding='utf-8') as journal_file:
+        journal_file.write('{"op": "set", "path": ["first"], "value": 1}')
+
+    assert storage.load('dataset') == ({'first': 1}, 1)
+
+    storage.append('dataset', [{'op': 'set', 'path': ['second'], 'value': 2}])
+    assert storage.load('dataset') == ({'first': 1, 'second': 2}, 2)
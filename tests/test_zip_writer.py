@@ -0,0 +1,37 @@
+import zipfile
+
+from xenian.bot.utils.zip_writer import SplitZipWriter
+
+
+def collect_parts(parts):
+    def on_part(path, number):
+        with zipfile.ZipFile(path) as zip_file:
+            parts.append(zip_file.namelist())
+
+    return on_part
+
+
+def test_group_is_not_split_across_parts(tmp_path):
+    image = tmp_path / 'image.png'
+    image.write_bytes(b'0' * 600)
+    parts = []
+
+    with SplitZipWriter(collect_parts(parts), max_size=2000, reserved_size=0) as zip_writer:
+        for number in range(3):
+            assert zip_writer.write_group(files=[(str(image), f'{number}.png')],
+                                          strings=[(f'{number}.json', '{"id": %d}' % number)])
+
+    assert parts == [['0.png', '0.json', '1.png', '1.json'], ['2.png', '2.json']]
+
+
+def test_too_big_entries_are_skipped(tmp_path):
+    video = tmp_path / 'video.mp4'
+    video.write_bytes(b'0' * 3000)
+    parts = []
+
+    with SplitZipWriter(collect_parts(parts), max_size=2000, reserved_size=0) as zip_writer:
+        assert zip_writer.writestr('small.txt', 'small')
+        assert not zip_writer.write(str(video), 'video.mp4')
+        assert not zip_writer.write_group(files=[(str(video), 'video.mp4')], strings=[('video.json', '{}')])
+
+    assert parts == [['small.txt']]
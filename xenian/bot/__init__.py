@@ -1,7 +1,117 @@
-from pymongo import MongoClient
+import logging
+
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import PyMongoError
 from xenian.bot.settings import MONGODB_CONFIGURATION
 
+logger = logging.getLogger(__name__)
+
 job_queue = None
 
 mongodb_client = MongoClient(host=MONGODB_CONFIGURATION['host'], port=MONGODB_CONFIGURATION['port'])
 mongodb_database = mongodb_client[MONGODB_CONFIGURATION['db_name']]
+
+# Indexes the bot relies on, as collection name: [(keys, options)]
+INDEXES = {
+    'users': [
+        ([('id', ASCENDING)], {'unique': True}),
+    ],
+    'chats': [
+        ([('id', ASCENDING)], {'unique': True}),
+    ],
+    'messages': [
+        ([('message_id', ASCENDING)], {}),
+        ([('chat.id', ASCENDING), ('message_id', ASCENDING)], {}),
+    ],
+    'files': [
+        ([('file_id', ASCENDING)], {'unique': True}),
+    ],
+    'gifs': [
+        ([('file_id', ASCENDING)], {'unique': True}),
+    ],
+    'gif_save_mode': [
+        ([('chat_id', ASCENDING)], {'unique': True}),
+    ],
+    'custom_db_save_mode': [
+        ([('chat_id', ASCENDING)], {'unique': True}),
+    ],
+    'telegram_object_collection': [
+        ([('chat_id', ASCENDING), ('tag', ASCENDING), ('type', ASCENDING)], {}),
+    ],
+}
+
+# Queries the bot runs regularly, as collection name: [filter], used to check that they are covered by an index
+INDEXED_QUERIES = {
+    'users': [{'id': 0}],
+    'chats': [{'id': 0}],
+    'messages': [{'message_id': 0}],
+    'files': [{'file_id': ''}],
+    'gifs': [{'file_id': ''}],
+    'gif_save_mode': [{'chat_id': 0}],
+    'custom_db_save_mode': [{'chat_id': 0}],
+    'telegram_object_collection': [
+        {'chat_id': 0},
+        {'chat_id': 0, 'tag': ''},
+        {'chat_id': 0, 'tag': '', 'type': ''},
+    ],
+}
+
+
+def ensure_indexes() -> list:
+    """Create the indexes in :obj:`INDEXES` and verify that they exist
+
+    Creating an index which already exists does nothing, so this is safe to call on every start. Indexes which could
+    not be created, e.g. unique ones on collections which already contain duplicates, are logged but do not stop the
+    bot.
+
+    Returns:
+        :obj:`list`: Names of the indexes which are missing, as "collection.index"
+    """
+    missing = []
+    for collection_name, indexes in INDEXES.items():
+        collection = mongodb_database[collection_name]
+        for keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except PyMongoError as e:
+                logger.warning(f'Could not create index {keys} on {collection_name}: {e}')
+
+        try:
+            existing = [info['key'] for info in collection.index_information().values()]
+        except PyMongoError as e:
+            logger.warning(f'Could not read indexes of {collection_name}: {e}')
+            existing = []
+
+        for keys, options in indexes:
+            if [tuple(key) for key in keys] not in [[tuple(key) for key in index_keys] for index_keys in existing]:
+                name = '_'.join(f'{field}_{direction}' for field, direction in keys)
+                missing.append(f'{collection_name}.{name}')
+
+    if missing:
+        logger.warning(f'Missing MongoDB indexes: {", ".join(missing)}')
+    return missing
+
+
+def find_collection_scans() -> list:
+    """Explain the queries in :obj:`INDEXED_QUERIES` and return the ones which scan the whole collection
+
+    Returns:
+        :obj:`list`: Tuples of collection name and filter for every query which does a collection scan
+    """
+
+    def stages(plan: dict):
+        yield plan.get('stage')
+        for key in ('inputStage', 'outerStage', 'innerStage'):
+            if key in plan:
+                yield from stages(plan[key])
+        for sub_plan in plan.get('inputStages', []):
+            yield from stages(sub_plan)
+
+    scans = []
+    for collection_name, queries in INDEXED_QUERIES.items():
+        for query in queries:
+            explanation = mongodb_database[collection_name].find(query).explain()
+            plan = explanation.get('queryPlanner', {}).get('winningPlan', {})
+            if 'COLLSCAN' in stages(plan):
+                scans.append((collection_name, query))
+    return scans
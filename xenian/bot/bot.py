@@ -7,9 +7,11 @@ from telegram import Bot, TelegramError, Update
 from telegram.ext import CommandHandler, Filters, Updater
 
 import xenian.bot
-from xenian.bot.utils import get_self
+from xenian.bot.utils import data, get_self, send_scheduler
 from .commands import BaseCommand
+from .commands.database import database
 from .settings import ADMINS, LOG_LEVEL, MODE, TELEGRAM_API_TOKEN
+from .uploaders import content_store, upload_executor, uploader
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
@@ -34,6 +36,9 @@ def main():
     dispatcher = updater.dispatcher
 
     xenian.bot.job_queue = updater.job_queue
+    xenian.bot.ensure_indexes()
+    uploader.start_removal_sweeper(updater.job_queue)
+    content_store.start_pruning(updater.job_queue)
 
     def on_start():
         self = get_self(updater.bot)
@@ -44,6 +49,10 @@ def main():
         """
         logger.info('Restarting: stopping')
         updater.stop()
+        upload_executor.shutdown()
+        send_scheduler.shutdown()
+        data.flush()
+        database.flush()
         logger.info('Restarting: starting')
         os.execl(sys.executable, sys.executable, *sys.argv + [f'is_restart={chat_id}'])
 
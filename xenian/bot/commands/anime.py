@@ -1,5 +1,3 @@
-from random import choice
-
 from telegram import Bot, ParseMode, Update
 from telegram.ext import Filters, MessageHandler, run_async
 
@@ -59,11 +57,12 @@ class Anime(BaseCommand):
             update (:obj:`telegram.update.Update`): Telegram Api Update Object
         """
         chat_id = update.message.chat_id
-        data = self.gif_save_mode.find_one({'chat_id': chat_id})
+        data = filters.get_save_mode(self.gif_save_mode, chat_id)
         new_mode = not data['mode'] if data else True
         self.gif_save_mode.update({'chat_id': chat_id},
                                   {'chat_id': chat_id, 'mode': new_mode},
                                   upsert=True)
+        filters.save_mode_cache.invalidate((self.gif_save_mode.name, chat_id))
         update.message.reply_text('GIF save mode turned `%s`' % ('on' if new_mode else 'off'),
                                   parse_mode=ParseMode.MARKDOWN)
 
@@ -91,8 +90,14 @@ class Anime(BaseCommand):
             bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
             update (:obj:`telegram.update.Update`): Telegram Api Update Object
         """
-        videos = list(self.gif.find())
-        video = choice(videos)
+        videos = list(self.gif.aggregate([
+            {'$sample': {'size': 1}},
+            {'$project': {'_id': False, 'file_id': True, 'duration': True}},
+        ]))
+        if not videos:
+            update.message.reply_text('There are no GIFs saved yet.')
+            return
+        video = videos[0]
 
         if video.get('duration', None):
             bot.send_video(update.message.chat_id, video['file_id'])
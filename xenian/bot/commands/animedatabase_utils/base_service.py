@@ -1,13 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from xenian.bot.utils import TTLCache
+
+
 class BaseService:
     type = 'base'
 
-    def __init__(self, name: str, url: str, api: str = None, username: str = None, password: str = None):
+    def __init__(self, name: str, url: str, api: str = None, username: str = None, password: str = None,
+                 max_workers: int = 4, cache_timeout: int = 5 * 60, cache_size: int = 500):
         self.name = name
         self.url = url.lstrip('/') if url is not None else None
         self.api = api
         self.username = username
         self.password = password
 
+        # Posts of a search are resolved in parallel, but never more than max_workers at once per service
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{name}_posts')
+        # Results of post_list by normalized tags, page and limit
+        self.post_list_cache = TTLCache(timeout=cache_timeout, maxsize=cache_size)
+
         self.count_qualifiers_as_tag = False
         self.client = None
         self.session = None
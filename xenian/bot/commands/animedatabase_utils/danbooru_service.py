@@ -39,8 +39,11 @@ class DanbooruService(BaseService):
 
     type = 'danbooru'
 
-    def __init__(self, name: str, url: str, api: str = None, username: str = None, password: str = None) -> None:
-        super(DanbooruService, self).__init__(name=name, url=url, api=api, username=username, password=password)
+    def __init__(self, name: str, url: str, api: str = None, username: str = None, password: str = None,
+                 max_workers: int = 4, cache_timeout: int = 5 * 60, cache_size: int = 500) -> None:
+        super(DanbooruService, self).__init__(name=name, url=url, api=api, username=username, password=password,
+                                              max_workers=max_workers, cache_timeout=cache_timeout,
+                                              cache_size=cache_size)
         self.user_level = None
 
         self.init_client()
@@ -7,8 +7,11 @@ class MoebooruService(BaseService):
     type = 'moebooru'
 
     def __init__(self, name: str, url: str, username: str = None, password: str = None,
-                 hashed_string: str = None) -> None:
-        super(MoebooruService, self).__init__(name=name, url=url, username=username, password=password)
+                 hashed_string: str = None, max_workers: int = 4, cache_timeout: int = 5 * 60,
+                 cache_size: int = 500) -> None:
+        super(MoebooruService, self).__init__(name=name, url=url, username=username, password=password,
+                                              max_workers=max_workers, cache_timeout=cache_timeout,
+                                              cache_size=cache_size)
         self.tag_limit = 6
         self.hashed_string = hashed_string
         self.count_qualifiers_as_tag = True
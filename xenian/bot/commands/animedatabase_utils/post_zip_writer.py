@@ -0,0 +1,57 @@
+import json
+import os
+import zipfile
+from typing import Callable
+
+from xenian.bot.commands.animedatabase_utils.post import Post
+from xenian.bot.utils import SplitZipWriter
+
+
+class PostZipWriter(SplitZipWriter):
+    """Zip downloaded posts with their data as JSON, every part gets a Links.txt to the posts in it
+
+    The file and the JSON of a post always go into the same part. Posts which are too big for a part are skipped.
+
+    Attributes:
+        links (:obj:`dict`): Line for the Links.txt by file name, for the posts of the current part
+        skipped (:obj:`list`): Posts which were skipped because they are too big for a part
+
+    Args:
+        on_part (:obj:`Callable`): Called with the path and the number of every finished part
+        **kwargs: See :class:`xenian.bot.utils.zip_writer.SplitZipWriter`
+    """
+
+    def __init__(self, on_part: Callable[[str, int], None], **kwargs):
+        super(PostZipWriter, self).__init__(on_part, on_close_part=self.write_links, **kwargs)
+        self.links = {}
+        self.skipped = []
+
+    def add_post(self, post: Post) -> bool:
+        """Add the file and the data of a post
+
+        Args:
+            post (:obj:`Post`): The post, only posts which were downloaded to the file system are added
+
+        Returns:
+            :obj:`bool`: If the post was added, posts which are too big for a part are added to :attr:`skipped`
+        """
+        if not isinstance(post.media, str) or not os.path.isfile(post.media):
+            return False
+
+        filename = str(post.post['id']) + os.path.splitext(post.media)[1]
+        if not self.write_group(files=[(post.media, filename)],
+                                strings=[(filename + '.json', json.dumps(post.post, indent=4, sort_keys=True))]):
+            self.skipped.append(post)
+            return False
+        self.links[filename] = f'{filename} ({filename}.json) -> {post.post_url}\n'
+        return True
+
+    def write_links(self, zip_file: zipfile.ZipFile, names: list):
+        """Add the Links.txt to a part
+
+        Args:
+            zip_file (:obj:`zipfile.ZipFile`): The part
+            names (:obj:`list`): Names of the entries in the part
+        """
+        zip_file.writestr('Links.txt', ''.join(self.links.pop(name) for name in names if name in self.links),
+                          compress_type=zipfile.ZIP_DEFLATED)
@@ -1,13 +1,13 @@
-import json
+import logging
 import os
 import re
-import zipfile
 from collections import OrderedDict
+from concurrent.futures import as_completed
 from copy import deepcopy
-from typing import Any, Callable, Iterable
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator
 
-import requests
-from requests.exceptions import MissingSchema
+from requests.exceptions import MissingSchema, RequestException
 from telegram import Bot, ChatAction, InputFile, InputMediaPhoto, Update
 from telegram.ext import run_async
 
@@ -17,21 +17,35 @@ from xenian.bot.commands.animedatabase_utils.danbooru_service import DanbooruSer
 from xenian.bot.commands.animedatabase_utils.message_queue import MessageQueue
 from xenian.bot.commands.animedatabase_utils.moebooru_service import MoebooruService
 from xenian.bot.commands.animedatabase_utils.post import Post, PostError
+from xenian.bot.commands.animedatabase_utils.post_zip_writer import PostZipWriter
 from xenian.bot.settings import ANIME_SERVICES
-from xenian.bot.utils import CustomNamedTemporaryFile, TelegramProgressBar, download_file_from_url_and_upload
+from xenian.bot.utils import TTLCache, TelegramProgressBar, download_file_from_url_and_upload, http_client, \
+    send_scheduler, stats_registry
 from xenian.bot.utils.telegram import retry_command
 from . import BaseCommand
 
+logger = logging.getLogger(__name__)
+
 __all__ = ['animedatabases']
 
 
 class AnimeDatabases(BaseCommand):
     """The class for all danbooru related commands
+
+    Attributes:
+        files (:obj:`pymongo.collection.Collection`): Locations of downloaded posts by post id
+        location_cache (:obj:`xenian.bot.utils.cache.TTLCache`): If a location of a downloaded post still exists, by
+            location
     """
     group = 'Anime'
 
+    location_cache_timeout = 10 * 60
+    location_cache_size = 10000
+
     def __init__(self):
         self.files = mongodb_database.files
+        self.location_cache = TTLCache(timeout=self.location_cache_timeout, maxsize=self.location_cache_size)
+        stats_registry.register('Anime file location cache', self.location_cache.stats)
 
         self.services = {}
         self.init_services()
@@ -49,6 +63,7 @@ class AnimeDatabases(BaseCommand):
                 self.services[name] = DanbooruService(**service_information)
             if service['type'] == 'moebooru':
                 self.services[name] = MoebooruService(**service_information)
+            stats_registry.register(f'{name.capitalize()} search cache', self.services[name].post_list_cache.stats)
 
             self.commands.append({
                 'title': name.capitalize(),
@@ -135,29 +150,78 @@ class AnimeDatabases(BaseCommand):
 
         return text, out if out is not None else default
 
-    def get_image(self, post_id: int, image_url: str = None):
+    def check_location(self, location: str) -> bool or None:
+        """Check if a saved file still exists
+
+        Args:
+            location (:obj:`str`): Path or url of the file
+
+        Returns:
+            :obj:`bool`: If the file exists, :obj:`None` if the server could not be reached
+        """
+        if os.path.isfile(location):
+            return True
+
+        try:
+            return http_client.head(location).status_code == 200
+        except MissingSchema:
+            # This gets raised when a "location" is a local file but does not exist anymore
+            return False
+        except RequestException:
+            return None
+
+    def is_alive(self, db_entry: dict) -> bool:
+        """Check if the file of a files entry still exists, the result is cached for a while
+
+        Entries whose file is gone for sure are marked as dead, so they are not checked again.
+
+        Args:
+            db_entry (:obj:`dict`): The entry from the files collection
+
+        Returns:
+            :obj:`bool`: True if the file exists
+        """
+        location = db_entry['location']
+        alive = self.location_cache.get(location, lambda: self.check_location(location))
+        if alive is False:
+            self.files.update_one({'_id': db_entry['_id']}, {'$set': {'dead': True}})
+        return bool(alive)
+
+    def get_cached_images(self, post_ids: list, service: BaseService) -> dict:
+        """Get the locations of already downloaded posts
+
+        All entries are fetched with a single query and checked in the worker pool of the service at the same time.
+
+        Args:
+            post_ids (:obj:`list`): Ids of the posts
+            service (:obj:`BaseService`): The service the posts are from
+
+        Returns:
+            :obj:`dict`: Location of the file by post id, for posts whose file still exists
+        """
+        db_entries = list(self.files.find({'file_id': {'$in': post_ids}, 'dead': {'$ne': True}},
+                                          {'file_id': 1, 'location': 1}))
+        alive = service.executor.map(self.is_alive, db_entries)
+        return {db_entry['file_id']: db_entry['location'] for db_entry, is_alive in zip(db_entries, alive) if is_alive}
+
+    def get_image(self, post_id: int, image_url: str = None, cached_images: dict = None):
         """Save image to file and save in db
 
         Args:
             post_id (:obj:`int`): Post od as identification
             image_url (:obj:`str`, optional): Url to image which should be saved
+            cached_images (:obj:`dict`, optional): Result of :meth:`get_cached_images` for the posts of the search.
+                If given the files collection is not queried again.
 
         Returns:
            ( :obj:`str`): Location of saved file
         """
-        db_entry = self.files.find_one({'file_id': post_id})
-        if db_entry:
-            location = db_entry['location']
-            if os.path.isfile(location):
-                return location
-
-            try:
-                response = requests.head(location)
-                if response.status_code == 200:
-                    return location
-            except MissingSchema:
-                # This gets raised when a "location" is a local file but does not exist anymore
-                pass
+        if cached_images is None:
+            db_entry = self.files.find_one({'file_id': post_id, 'dead': {'$ne': True}})
+            if db_entry and self.is_alive(db_entry):
+                return db_entry['location']
+        elif post_id in cached_images:
+            return cached_images[post_id]
 
         if not image_url:
             return
@@ -166,6 +230,8 @@ class AnimeDatabases(BaseCommand):
         self.files.update({'file_id': post_id},
                           {'file_id': post_id, 'location': downloaded_image_location},
                           upsert=True)
+        # Files are saved under the hash of their content, so a location known to be missing can exist again now
+        self.location_cache.invalidate(downloaded_image_location)
         return downloaded_image_location
 
     @run_async
@@ -209,7 +275,7 @@ class AnimeDatabases(BaseCommand):
             message.reply_text('Some tags may be censored', reply_to_message_id=message.message_id)
 
         query = {
-            'page': page or 0,
+            'page': page or 1,
             'limit': limit if limit and limit <= 100 else 10,
             'tags': ' '.join(terms),
         }
@@ -222,92 +288,204 @@ class AnimeDatabases(BaseCommand):
 
         method(bot=bot, update=update, service=service, query=query, group_size=group_size, zip_it=zip_it)
 
-    @run_async
-    @MessageQueue.message_queue_exc_handler('queue')
-    @retry_command
+    def get_posts(self, service: BaseService, query: dict) -> list:
+        """Get the posts of a search, from the cache of the service if it was searched recently
+
+        The next page is loaded into the cache in the background, so paging through the results does not wait for the
+        service.
+
+        Args:
+            service (:obj:`BaseService`): The service to search on
+            query (:obj:`dict`): Query with keywords for post_list, its tags must be the output of :meth:`filter_terms`
+
+        Returns:
+            :obj:`list`: The found posts
+        """
+
+        def load(page_query: dict) -> list:
+            return service.client.post_list(**page_query)
+
+        def cache_key(page_query: dict) -> tuple:
+            # The terms are normalized by filter_terms already, only their order does not matter for the search
+            return tuple(sorted(page_query['tags'].split())), page_query['page'], page_query['limit']
+
+        posts = service.post_list_cache.get(cache_key(query), lambda: load(query))
+
+        if posts and len(posts) >= query['limit']:
+            next_query = dict(query, page=query['page'] + 1)
+            service.executor.submit(service.post_list_cache.get, cache_key(next_query), lambda: load(next_query))
+        return posts
+
+    def resolve_posts(self, service: BaseService, posts: list, resolve: Callable,
+                      progress_bar: TelegramProgressBar) -> Iterator[tuple]:
+        """Resolve posts in the worker pool of the service
+
+        Up to :attr:`BaseService.max_workers` posts are resolved at the same time. The progress bar advances whenever a
+        post is done, but the posts are yielded in their original order.
+
+        Args:
+            service (:obj:`BaseService`): The service the posts are from
+            posts (:obj:`list`): The post dicts returned by the service
+            resolve (:obj:`Callable`): Called with a post dict in a worker thread, returns a :obj:`Post`
+            progress_bar (:obj:`xenian.bot.utils.progress_bar.TelegramProgressBar`): Progress bar to advance
+
+        Yields:
+            :obj:`tuple`: Index of the post and a done :obj:`concurrent.futures.Future`, whose result is the resolved
+                post or which raises the error of resolve
+        """
+        progress_bar.start(items=posts)
+        futures = {service.executor.submit(resolve, post): index for index, post in enumerate(posts)}
+
+        done = {}
+        next_index = 0
+        for future in as_completed(futures):
+            done[futures[future]] = future
+            progress_bar.increase()
+            while next_index in done:
+                yield next_index, done.pop(next_index)
+                next_index += 1
+
     def send_group(self, bot: Bot, update: Update, group: Iterable[InputMediaPhoto], queue: MessageQueue):
+        """Queue a media group in the :obj:`xenian.bot.utils.send_scheduler.SendScheduler`
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+            group (:obj:`Iterable[telegram.InputMediaPhoto]`): The images of the group
+            queue (:obj:`MessageQueue`): Queue every image is reported to once it was sent
+        """
+        files = []
         for item in group:
             if os.path.isfile(item.media):
-                with open(item.media, 'rb') as file_:
-                    item.media = InputFile(file_, attach=True)
+                file_ = open(item.media, 'rb')
+                files.append(file_)
+                item.media = InputFile(file_, attach=True)
 
         message = update.message
-        bot.send_media_group(
-            chat_id=message.chat_id,
-            media=group,
+        future = send_scheduler.submit(
+            message.chat_id,
+            retry_command(bot.send_media_group, notify_user=False),
+            message.chat_id,
+            group,
+            cost=len(group),
             reply_to_message_id=message.message_id,
             disable_notification=True
         )
-        for image in group:
-            queue.report()
+        future.add_done_callback(partial(self.report_sent, queue, len(group), files))
 
-    @run_async
-    @MessageQueue.message_queue_exc_handler('queue')
-    @retry_command
     def send_image(self, update: Update, image: InputMediaPhoto, queue: MessageQueue):
+        """Queue an image as photo and as document in the :obj:`xenian.bot.utils.send_scheduler.SendScheduler`
+
+        Args:
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+            image (:obj:`telegram.InputMediaPhoto`): The image
+            queue (:obj:`MessageQueue`): Queue the image is reported to once it was sent
+        """
         file = None
         message = update.message
         if os.path.isfile(image.media):
             file = open(image.media, mode='rb')
 
-        sent_media = None
-        if image.media.endswith(('.png', '.jpg')):
-            sent_media = message.reply_photo(
+        # Every attempt, also retries, has to send the file from its start
+        def send_photo():
+            if file:
+                file.seek(0)
+            return message.reply_photo(
                 photo=file or image.media,
                 caption=image.caption,
                 disable_notification=True,
                 reply_to_message_id=message.message_id,
             )
 
-        if file:
-            file.seek(0)
+        sent_media = None
+        if image.media.endswith(('.png', '.jpg')):
+            sent_media = send_scheduler.submit(message.chat_id, retry_command(send_photo, notify_user=False))
+
+        def send_document():
+            # Messages to a chat are sent in order, so the photo is done already. It is None if the retries gave up.
+            sent_photo = sent_media.result() if sent_media else None
+            if file:
+                file.seek(0)
+            return message.chat.send_document(
+                document=file or image.media,
+                disable_notification=True,
+                caption=image.caption,
+                reply_to_message_id=sent_photo.message_id if sent_photo else None,
+            )
 
-        message.chat.send_document(
-            document=file or image.media,
-            disable_notification=True,
-            caption=image.caption,
-            reply_to_message_id=sent_media.message_id if sent_media else None,
-        )
-        queue.report()
+        future = send_scheduler.submit(message.chat_id, retry_command(send_document, notify_user=False))
+        future.add_done_callback(partial(self.report_sent, queue, 1, [file] if file else []))
+
+    def report_sent(self, queue: MessageQueue, count: int, files: list, future):
+        """Report sent images to the queue and close their files
+
+        Args:
+            queue (:obj:`MessageQueue`): Queue the images are reported to
+            count (:obj:`int`): Number of images which were sent
+            files (:obj:`list`): Opened files of the images
+            future (:obj:`concurrent.futures.Future`): The future of the send
+        """
+        for file in files:
+            file.close()
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if error:
+            logger.warning(f'Sending {count} images failed: {error}')
+        for _ in range(count):
+            queue.report(PostError(code=PostError.UNDEFINED_ERROR) if error else None)
+
+    def create_zip_writer(self, update: Update) -> PostZipWriter:
+        """Create a zip writer which sends every finished part of the archive to the user
+
+        Args:
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+
+        Returns:
+            :obj:`PostZipWriter`: The zip writer, posts are added with :meth:`PostZipWriter.add_post`
+        """
+        return PostZipWriter(on_part=lambda path, number: self.send_zip_part(update, path, number))
 
-    @run_async
     @retry_command
-    def send_zip(self, update: Update, posts=Iterable[Post]):
-        with CustomNamedTemporaryFile(prefix='xenian-', suffix='.zip') as zip_file:
-            zip = zipfile.ZipFile(zip_file.name, mode='w')
-
-            text_file_content = ''
-            for post in posts:
-                if os.path.isfile(post.media):
-                    filename = os.path.basename(str(post.post['id']) + os.path.splitext(post.media)[1])
-                    json_filename = filename + '.json'
-                    zip.write(post.media, filename)
-                    text_file_content += f'{filename} ({filename}.json) -> {post.post_url}\n'
-
-                    with CustomNamedTemporaryFile(mode='w') as json_file:
-                        json.dump(post.post, json_file, indent=4, sort_keys=True)
-                        json_file.close()
-                        zip.write(json_file.name, json_filename)
-
-            with CustomNamedTemporaryFile(mode='w') as text_file:
-                text_file.write(text_file_content)
-                text_file.close()
-                zip.write(text_file.name, 'Links.txt')
-
-            zip.close()
+    def send_zip_part(self, update: Update, path: str, number: int):
+        """Send a part of a zip archive
 
+        Args:
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+            path (:obj:`str`): Path to the part
+            number (:obj:`int`): Number of the part, starting at 1
+        """
+        with open(path, 'rb') as zip_file:
             update.message.chat.send_document(
                 document=zip_file,
+                filename=f'xenian-{update.message.message_id}-{number}.zip',
                 reply_to_message_id=update.message.message_id,
             )
 
+    def finish_zip(self, update: Update, zip_writer: PostZipWriter):
+        """Send the last part of a zip archive
+
+        Args:
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+            zip_writer (:obj:`PostZipWriter`): The zip writer
+        """
+        zip_writer.close()
+        if zip_writer.skipped:
+            update.message.reply_text('\n'.join(['Some files were too big to be zipped'] +
+                                                [f'- {post.post_url}' for post in zip_writer.skipped]),
+                                      reply_to_message_id=update.message.message_id, disable_web_page_preview=True)
+        if not zip_writer.parts:
+            update.message.reply_text('None of the files could be zipped.',
+                                      reply_to_message_id=update.message.message_id)
+
     # Danbooru API commands
 
-    def danbooru_get_image(self, post: dict, service: DanbooruService) -> Post:
+    def danbooru_get_image(self, post: dict, service: DanbooruService, cached_images: dict = None) -> Post:
         image_url = post.get('large_file_url', None)
         post_url = '{domain}/posts/{post_id}'.format(domain=service.url, post_id=post['id'])
 
-        image_url = self.get_image(post['id'], image_url) or image_url
+        image_url = self.get_image(post['id'], image_url, cached_images=cached_images) or image_url
 
         if not image_url and service.session:
             response = service.session.get(post_url)
@@ -315,7 +493,7 @@ class AnimeDatabases(BaseCommand):
 
             if img_tag:
                 img_tag = img_tag[0]
-                image_url = self.get_image(post['id'], img_tag.attrs['src'])
+                image_url = self.get_image(post['id'], img_tag.attrs['src'], cached_images=cached_images)
 
         if not image_url:
             raise PostError(code=PostError.IMAGE_NOT_FOUND, post=Post(post=post, post_url=post_url))
@@ -334,7 +512,7 @@ class AnimeDatabases(BaseCommand):
             group_size (:obj:`bool`): If the found items shall be grouped to a media group
         """
         message = update.message
-        posts = service.client.post_list(**query)
+        posts = self.get_posts(service, query)
 
         if not posts:
             message.reply_text('Nothing found on page {page}'.format(**query))
@@ -349,17 +527,24 @@ class AnimeDatabases(BaseCommand):
 
         message_queue = MessageQueue(total=len(posts), message=message, group_size=group_size)
 
-        parsed_posts = []
+        zip_writer = self.create_zip_writer(update) if zip_it else None
+        if not group_size and not zip_it:
+            bot.send_chat_action(chat_id=message.chat_id, action=ChatAction.UPLOAD_PHOTO)
         group = []
-        for index, post_dict in progress_bar.enumerate(posts):
+        cached_images = self.get_cached_images([post_dict['id'] for post_dict in posts], service)
+        resolved_posts = self.resolve_posts(
+            service, posts,
+            lambda post_dict: self.danbooru_get_image(post=post_dict, service=service, cached_images=cached_images),
+            progress_bar)
+        for index, resolved_post in resolved_posts:
             try:
-                post = self.danbooru_get_image(post=post_dict, service=service)
-                parsed_posts.append(post)
+                post = resolved_post.result()
             except PostError as error:
                 message_queue.report(error)
                 continue
 
             if zip_it:
+                zip_writer.add_post(post)
                 continue
 
             if group_size:
@@ -372,11 +557,10 @@ class AnimeDatabases(BaseCommand):
                 group.append(post.telegram)
                 continue
 
-            bot.send_chat_action(chat_id=message.chat_id, action=ChatAction.UPLOAD_PHOTO)
             self.send_image(update=update, image=post.telegram, queue=message_queue)
 
         if zip_it:
-            self.send_zip(update=update, posts=parsed_posts)
+            self.finish_zip(update, zip_writer)
             return
 
         if group:
@@ -384,19 +568,20 @@ class AnimeDatabases(BaseCommand):
 
     # Moebooru API commands
 
-    def moebooru_get_image(self, post: dict, service: MoebooruService, download: bool = False) -> Post:
+    def moebooru_get_image(self, post: dict, service: MoebooruService, download: bool = False,
+                           cached_images: dict = None) -> Post:
         post_url = '{domain}/posts/{post_id}'.format(domain=service.url, post_id=post['id'])
         image_path = post['file_url']
 
         if download:
-            image_path = self.get_image(post['id'], post['file_url'])
+            image_path = self.get_image(post['id'], post['file_url'], cached_images=cached_images)
 
         return Post(post=post, media=image_path, caption=f'@XenianBot - {post_url}', post_url=post_url)
 
     def moebooru_real_search(self, bot: Bot, update: Update, service: MoebooruService, query: dict,
                              group_size: bool = False, zip_it: bool = False):
         message = update.message
-        posts = service.client.post_list(**query)
+        posts = self.get_posts(service, query)
 
         if not posts:
             message.reply_text('Nothing found on page {page}'.format(**query))
@@ -411,13 +596,21 @@ class AnimeDatabases(BaseCommand):
 
         message_queue = MessageQueue(total=len(posts), message=message, group_size=group_size)
 
+        zip_writer = self.create_zip_writer(update) if zip_it else None
+        if not group_size and not zip_it:
+            bot.send_chat_action(chat_id=message.chat_id, action=ChatAction.UPLOAD_PHOTO)
         group = []
-        parsed_posts = []
-        for index, post_dict in progress_bar.enumerate(posts):
-            post = self.moebooru_get_image(post=post_dict, service=service, download=zip_it)
-            parsed_posts.append(post)
+        cached_images = self.get_cached_images([post_dict['id'] for post_dict in posts], service) if zip_it else None
+        resolved_posts = self.resolve_posts(
+            service, posts,
+            lambda post_dict: self.moebooru_get_image(post=post_dict, service=service, download=zip_it,
+                                                      cached_images=cached_images),
+            progress_bar)
+        for index, resolved_post in resolved_posts:
+            post = resolved_post.result()
 
             if zip_it:
+                zip_writer.add_post(post)
                 continue
 
             if group_size:
@@ -433,7 +626,7 @@ class AnimeDatabases(BaseCommand):
                 self.send_image(update=update, image=post.telegram, queue=message_queue)
 
         if zip_it:
-            self.send_zip(update=update, posts=parsed_posts)
+            self.finish_zip(update, zip_writer)
             return
 
         if group:
@@ -2,8 +2,9 @@ from telegram import Bot, Update
 from telegram.ext import CommandHandler, MessageHandler
 from telegram.parsemode import ParseMode
 
+from xenian.bot.commands import filters
 from xenian.bot.settings import ADMINS, SUPPORTER
-from xenian.bot.utils import data, get_user_link, render_template
+from xenian.bot.utils import data, get_user_link, render_template, stats_registry
 from .base import BaseCommand
 
 __all__ = ['builtins']
@@ -33,6 +34,12 @@ class Builtins(BaseCommand):
                 'description': 'If you have found an error please use this command.',
                 'args': ['text']
             },
+            {
+                'command': self.stats,
+                'description': 'Show statistics of caches, queues and clients',
+                'hidden': True,
+                'options': {'filters': filters.bot_admin},
+            },
         ]
 
         super(Builtins, self).__init__()
@@ -186,6 +193,21 @@ class Builtins(BaseCommand):
             for chat_id in builtin_data['supporter_chat_ids']:
                 bot.send_message(chat_id=chat_id, text=text)
 
+    def stats(self, bot: Bot, update: Update):
+        """Show the statistics registered in the :obj:`xenian.bot.utils.stats.stats_registry`
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+        """
+        lines = []
+        for name, values in stats_registry.collect().items():
+            lines.append(name)
+            lines.extend('- {}: {}'.format(key, value) for key, value in values.items())
+            lines.append('')
+
+        update.message.reply_text('\n'.join(lines).strip() or 'No statistics available.')
+
     def register(self, bot: Bot, update: Update):
         """Register the chat_id for admins and supporters
 
@@ -1,10 +1,15 @@
-from telegram import Audio, Bot, Chat, Document, InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, PhotoSize, \
-    Sticker, TelegramError, Update, Video, Voice
+from functools import partial
+from uuid import uuid4
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from telegram import Audio, Bot, Chat, Document, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, \
+    InputMediaVideo, ParseMode, PhotoSize, Sticker, TelegramError, Update, Video, Voice
 from telegram.ext import CallbackQueryHandler, Filters, MessageHandler, run_async
 
 from xenian.bot import mongodb_database
 from xenian.bot.commands import filters
-from xenian.bot.utils import render_template, user_is_admin_of_group
+from xenian.bot.utils import TTLCache, render_template, send_scheduler, stats_registry, user_is_admin_of_group
 from .base import BaseCommand
 
 __all__ = ['image_db']
@@ -12,10 +17,25 @@ __all__ = ['image_db']
 
 class CustomDB(BaseCommand):
     """Create Custom Databases by chat_id and tag
+
+    The tags of a chat and the content summary of a tag are counted by MongoDB and cached in :attr:`summary_cache`.
+    Every method changing the saved objects has to call :meth:`invalidate_summary`.
+
+    Attributes:
+        summary_cache (:obj:`xenian.bot.utils.cache.TTLCache`): Tag lists by ('tags', chat_id) and content summaries
+            by ('summary', chat_id, tag)
+        db_list_pages (:obj:`xenian.bot.utils.cache.TTLCache`): Db list pages which are too long for callback data by
+            their short key
     """
 
     group = 'Custom'
     ram_db = {}
+    summary_cache_timeout = 10 * 60
+    summary_cache_size = 10000
+    db_list_pages_timeout = 24 * 60 * 60
+    db_list_pages_size = 10000
+    db_list_page_size = 30
+    media_group_size = 10
 
     def __init__(self):
         self.commands = [
@@ -149,6 +169,10 @@ class CustomDB(BaseCommand):
         self.telegram_object_collection = mongodb_database.telegram_object_collection
         self.custom_db_save_mode = mongodb_database.custom_db_save_mode
 
+        self.summary_cache = TTLCache(timeout=self.summary_cache_timeout, maxsize=self.summary_cache_size)
+        stats_registry.register('Custom DB summary cache', self.summary_cache.stats)
+        self.db_list_pages = TTLCache(timeout=self.db_list_pages_timeout, maxsize=self.db_list_pages_size)
+
         super(CustomDB, self).__init__()
 
     def is_group_admin_if_group(self, update: Update):
@@ -176,7 +200,7 @@ class CustomDB(BaseCommand):
         if tags:
             return tags[0].lower()
 
-        chat = self.custom_db_save_mode.find_one({'chat_id': update.message.chat_id})
+        chat = filters.get_save_mode(self.custom_db_save_mode, update.message.chat_id)
         if chat and chat.get('tag', ''):
             return chat['tag'].lower()
         return ''
@@ -190,7 +214,7 @@ class CustomDB(BaseCommand):
             args (:obj:`list`, optional): List of sent arguments
         """
         tag = args[0] if args else None
-        data = self.custom_db_save_mode.find_one({'chat_id': update.effective_chat.id})
+        data = filters.get_save_mode(self.custom_db_save_mode, update.effective_chat.id)
         current_mode = data['mode'] if data else False
 
         if current_mode:
@@ -214,11 +238,12 @@ class CustomDB(BaseCommand):
             tag = update.callback_query.data.split(' ')[1]
 
         chat_id = update.effective_chat.id
-        data = self.custom_db_save_mode.find_one({'chat_id': chat_id})
+        data = filters.get_save_mode(self.custom_db_save_mode, chat_id)
         new_mode = not data['mode'] if data else True
         self.custom_db_save_mode.update({'chat_id': chat_id},
                                         {'chat_id': chat_id, 'mode': new_mode, 'tag': tag},
                                         upsert=True)
+        filters.save_mode_cache.invalidate((self.custom_db_save_mode.name, chat_id))
         if new_mode:
             text = 'Save mode turned on for `[%s]`. You can send me any type of Telegram object to save it.' % tag
             if getattr(update, 'callback_query', None):
@@ -245,8 +270,7 @@ class CustomDB(BaseCommand):
 
         message = message or 'Choose a tag:'
 
-        db_items = self.telegram_object_collection.find({'chat_id': update.message.chat_id})
-        tag_list = list(set([item['tag'] for item in db_items]))
+        tag_list = self.get_tags(update.effective_chat.id)
         if tag_list:
             button_list = [tag_list[i:i + 3] for i in range(0, len(tag_list), 3)]
             button_list = [
@@ -309,8 +333,13 @@ class CustomDB(BaseCommand):
         else:
             update.message.reply_text(message, reply_markup=buttons)
 
+    @run_async
     def real_db_list(self, bot: Bot, update: Update, method: str = None, message: str = None):
-        """List all items in db for
+        """List the items of a db page by page
+
+        A page contains at most :attr:`db_list_page_size` items, the next page is requested with the inline button
+        sent after the page. Pages are selected by the id of the last sent item, so no page has to skip over the
+        previous ones.
 
         Args:
             bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
@@ -324,39 +353,153 @@ class CustomDB(BaseCommand):
             return
 
         message_obj = callback_query.message
+        chat_id = update.effective_chat.id
 
-        tag, type_ = callback_query.data.split(' ')[1].split(':')
+        page = callback_query.data.split(' ')[1]
+        if ':' not in page:
+            page = self.db_list_pages.get(page)
+            if page is None:
+                message_obj.edit_text('Something went wrong, try again or contact an admin /error')
+                return
+        tag, type_, *last_id = page.split(':')
 
         query = {
-            'chat_id': update.effective_chat.id,
+            'chat_id': chat_id,
             'tag': tag
         }
         if type_ != 'all':
             query['type'] = type_
-        db_items = list(self.telegram_object_collection.find(query))
+        if last_id:
+            try:
+                query['_id'] = {'$gt': ObjectId(last_id[0])}
+            except InvalidId:
+                message_obj.edit_text('Something went wrong, try again or contact an admin /error')
+                return
+
+        db_items = list(self.telegram_object_collection.find(query).sort('_id', 1).limit(self.db_list_page_size + 1))
+        has_next_page = len(db_items) > self.db_list_page_size
+        db_items = db_items[:self.db_list_page_size]
 
         if not db_items:
             message_obj.edit_text(f'No entries for {tag}:{type_}')
             return
 
         message_obj.delete()
-        for item in db_items:
-            item_type = item['type']
-            reply_method = getattr(message_obj, f'reply_{item_type}', None)
-            if not reply_method:
-                message_obj.reply_text('An error occurred please contact an admin /error')
-                return
-            try:
-                if item_type == 'text':
-                    reply_method(item['text'])
-                elif item_type == 'sticker':
-                    reply_method(item['file_id'])
-                elif item_type in ['document', 'photo', 'video', 'voice', 'audio']:
-                    reply_method(item['file_id'], caption=item['text'])
-            except TelegramError:
-                message_obj.reply_text(f'Something went wrong for the item `{item["_id"]}`, please contact an admin '
-                                       f'/error', parse_mode=ParseMode.MARKDOWN)
-        message_obj.reply_text(f'{"#" * 20}\nAll content sent')
+        self.send_db_items(bot, chat_id, db_items)
+
+        if has_next_page:
+            next_page = self.get_page_callback_data(f'{tag}:{type_}:{db_items[-1]["_id"]}')
+            send_scheduler.submit(chat_id, bot.send_message, chat_id, f'{"#" * 20}\nPage sent',
+                                  reply_markup=InlineKeyboardMarkup([[
+                                      InlineKeyboardButton('Next page', callback_data=next_page),
+                                      InlineKeyboardButton('Cancel', callback_data='real_db_list cancel'),
+                                  ]]))
+        else:
+            send_scheduler.submit(chat_id, bot.send_message, chat_id, f'{"#" * 20}\nAll content sent')
+
+    def get_page_callback_data(self, page: str) -> str:
+        """Get the callback data for a db list page
+
+        Callback data is limited to 64 bytes by Telegram. Pages which do not fit, because of a long tag name, are kept
+        in :attr:`db_list_pages` and referenced by a short key.
+
+        Args:
+            page (:obj:`str`): The page as "tag:type:last_id"
+
+        Returns:
+            :obj:`str`: Callback data for the page
+        """
+        callback_data = f'real_db_list {page}'
+        if len(callback_data.encode()) <= 64:
+            return callback_data
+
+        key = uuid4().hex
+        self.db_list_pages.set(key, page)
+        return f'real_db_list {key}'
+
+    def send_db_items(self, bot: Bot, chat_id: int, db_items: list):
+        """Send db items, consecutive photos and videos are grouped into media groups
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            chat_id (:obj:`int`): Chat to send the items to
+            db_items (:obj:`list`): The db items
+        """
+        media_group = []
+        for item in db_items + [None]:
+            if item and item['type'] in ['photo', 'video'] and len(media_group) < self.media_group_size:
+                media_group.append(item)
+                continue
+
+            if len(media_group) > 1:
+                media = [
+                    (InputMediaPhoto if group_item['type'] == 'photo' else InputMediaVideo)(
+                        group_item['file_id'], caption=group_item['text'])
+                    for group_item in media_group
+                ]
+                self.send_db_item(bot, chat_id, media_group, bot.send_media_group, chat_id, media)
+            elif media_group:
+                self.send_single_db_item(bot, chat_id, media_group[0])
+
+            media_group = []
+            if item and item['type'] in ['photo', 'video']:
+                media_group.append(item)
+            elif item:
+                self.send_single_db_item(bot, chat_id, item)
+
+    def send_single_db_item(self, bot: Bot, chat_id: int, item: dict):
+        """Send a single db item with the send method for its type
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            chat_id (:obj:`int`): Chat to send the item to
+            item (:obj:`dict`): The db item
+        """
+        item_type = item['type']
+        send_method = bot.send_message if item_type == 'text' else getattr(bot, f'send_{item_type}', None)
+        if not send_method:
+            send_scheduler.submit(chat_id, bot.send_message, chat_id,
+                                  'An error occurred please contact an admin /error')
+            return
+
+        if item_type == 'text':
+            self.send_db_item(bot, chat_id, [item], send_method, chat_id, item['text'])
+        elif item_type == 'sticker':
+            self.send_db_item(bot, chat_id, [item], send_method, chat_id, item['file_id'])
+        elif item_type in ['document', 'photo', 'video', 'voice', 'audio']:
+            self.send_db_item(bot, chat_id, [item], send_method, chat_id, item['file_id'], caption=item['text'])
+
+    def send_db_item(self, bot: Bot, chat_id: int, items: list, send_method: callable, *args, **kwargs):
+        """Queue db items in the :obj:`xenian.bot.utils.send_scheduler.SendScheduler` and tell the user which failed
+
+        The scheduler keeps the order of the chat and paces the messages, so that listing a db does not hit Telegrams
+        flood limits.
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            chat_id (:obj:`int`): Chat to send the items to
+            items (:obj:`list`): The db items which are sent
+            send_method (:obj:`callable`): Bot method used to send the items
+            *args (:obj:`list`): Arguments for the send method
+            **kwargs (:obj:`dict`): Keyword arguments for the send method
+        """
+        future = send_scheduler.submit(chat_id, send_method, *args, cost=len(items), **kwargs)
+        future.add_done_callback(partial(self.report_failed_items, bot, chat_id, items))
+
+    def report_failed_items(self, bot: Bot, chat_id: int, items: list, future):
+        """Tell the user if sending db items failed
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            chat_id (:obj:`int`): Chat the items were sent to
+            items (:obj:`list`): The db items which were sent
+            future (:obj:`concurrent.futures.Future`): The future of the send
+        """
+        if not future.cancelled() and isinstance(future.exception(), TelegramError):
+            item_ids = ', '.join(f'`{item["_id"]}`' for item in items)
+            send_scheduler.submit(chat_id, bot.send_message, chat_id,
+                                  f'Something went wrong for the item {item_ids}, please contact an admin /error',
+                                  parse_mode=ParseMode.MARKDOWN)
 
     def save_command(self, bot: Bot, update: Update, args: list = None):
         """Save image in reply
@@ -477,6 +620,7 @@ class CustomDB(BaseCommand):
         message['chat_id'] = update.message.chat_id
         message['tag'] = tag
         self.telegram_object_collection.update(message, message, upsert=True)
+        self.invalidate_summary(message['chat_id'], tag)
 
         update.message.reply_text('{} was saved to `{}`!'.format(message['type'].title(), tag),
                                   parse_mode=ParseMode.MARKDOWN)
@@ -496,6 +640,30 @@ class CustomDB(BaseCommand):
         update.callback_query.message.edit_text(text=render_template('db_info.html.mako', info=data),
                                                 parse_mode=ParseMode.HTML)
 
+    def get_tags(self, chat_id: int) -> list:
+        """Get the tags of all databases of a chat
+
+        Args:
+            chat_id (:obj:`int`): Id of the chat
+
+        Returns:
+            :obj:`list`: Sorted list of the tags
+        """
+        return list(self.summary_cache.get(
+            ('tags', chat_id),
+            lambda: sorted(self.telegram_object_collection.distinct('tag', {'chat_id': chat_id}))
+        ))
+
+    def invalidate_summary(self, chat_id: int, tag: str):
+        """Invalidate the cached tags and content summary after a database of a chat was changed
+
+        Args:
+            chat_id (:obj:`int`): Id of the chat
+            tag (:obj:`str`): DB name
+        """
+        self.summary_cache.invalidate(('tags', chat_id))
+        self.summary_cache.invalidate(('summary', chat_id, tag))
+
     def get_db_content_summary(self, update, tag):
         """Get a summary with available number of available items in db by tag
 
@@ -506,7 +674,23 @@ class CustomDB(BaseCommand):
         Returns:
             :obj:`dict`: Dict with number of item of ech content type + tag name + total number of items
         """
-        db_items = self.telegram_object_collection.find({'chat_id': update.effective_chat.id, 'tag': tag})
+        chat_id = update.effective_chat.id
+        return dict(self.summary_cache.get(('summary', chat_id, tag), lambda: self.count_content_types(chat_id, tag)))
+
+    def count_content_types(self, chat_id: int, tag: str) -> dict:
+        """Count the items of each content type in a database
+
+        Args:
+            chat_id (:obj:`int`): Id of the chat
+            tag (:obj:`str`): DB name
+
+        Returns:
+            :obj:`dict`: Dict with number of item of ech content type + tag name + total number of items
+        """
+        counts = self.telegram_object_collection.aggregate([
+            {'$match': {'chat_id': chat_id, 'tag': tag}},
+            {'$group': {'_id': '$type', 'count': {'$sum': 1}}},
+        ])
         data = {
             'tag': tag,
             'video': 0,
@@ -518,9 +702,9 @@ class CustomDB(BaseCommand):
             'text': 0,
             'total': 0
         }
-        for item in db_items:
-            data[item['type']] += 1
-            data['total'] += 1
+        for item in counts:
+            data[item['_id']] = item['count']
+            data['total'] += item['count']
         return data
 
     def real_delete(self, bot: Bot, update: Update):
@@ -546,7 +730,9 @@ class CustomDB(BaseCommand):
             update.callback_query.message.delete()
         elif data.startswith('delete'):
             tag = data.split(' ')[1]
-            self.telegram_object_collection.delete_many({'chat_id': update.callback_query.message.chat_id, 'tag': tag})
+            chat_id = update.callback_query.message.chat_id
+            self.telegram_object_collection.delete_many({'chat_id': chat_id, 'tag': tag})
+            self.invalidate_summary(chat_id, tag)
             update.callback_query.message.edit_text('%s deleted!' % tag.title())
         else:
             update.callback_query.message.edit_text('Something went wrong, try again or contact admin via /error.')
@@ -1,8 +1,15 @@
-from pymongo import MongoClient
+import json
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha1
+from threading import Lock
+
 from telegram import Bot, Chat, Message, Update, User
-from telegram.ext import MessageHandler, run_async, Handler, Filters
+from telegram.ext import MessageHandler, run_async
 
-from xenian.bot import mongodb_database
+from xenian.bot import find_collection_scans, mongodb_database
+from xenian.bot.commands import filters
+from xenian.bot.utils import BulkUpsertWriter, LRUCache, stats_registry
 from .base import BaseCommand
 
 __all__ = ['database']
@@ -11,11 +18,21 @@ __all__ = ['database']
 class Database(BaseCommand):
     """A set of database commands
 
+    Users, messages and chats are not written directly, they are queued in a :class:`BulkUpsertWriter` which writes
+    them in batches. Users and chats are only written if they changed since they were last written, which is checked
+    with a fingerprint of their content.
+
     Attributes:
         users (:obj:`pymongo.collection.Collection`): Connection to the pymongo databased
+        writer (:obj:`xenian.bot.utils.bulk_writer.BulkUpsertWriter`): Writer batching the upserts
+        fingerprints (:obj:`xenian.bot.utils.cache.LRUCache`): Fingerprints of the last queued and the last written
+            version of users and chats
     """
 
     name = 'Bot Helpers'
+    batch_size = 500
+    flush_interval = 1
+    fingerprint_cache_size = 50000
 
     def __init__(self):
         self.commands = [
@@ -27,25 +44,136 @@ class Database(BaseCommand):
                 'group': 1,
                 'hidden': True,
             },
+            {
+                'command': self.index_report,
+                'description': 'Show database queries which are not covered by an index',
+                'hidden': True,
+                'options': {'filters': filters.bot_admin},
+            },
         ]
 
         self.users = mongodb_database.users
         self.chats = mongodb_database.chats
         self.messages = mongodb_database.messages
 
+        self.writer = BulkUpsertWriter(batch_size=self.batch_size, flush_interval=self.flush_interval)
+        stats_registry.register('Database ingestion', self.writer.stats)
+
+        self.fingerprints = LRUCache(maxsize=self.fingerprint_cache_size)
+        self.fingerprint_lock = Lock()
+        self.fingerprint_stats = OrderedDict([
+            ('users_written', 0),
+            ('users_skipped', 0),
+            ('chats_written', 0),
+            ('chats_skipped', 0),
+        ])
+        stats_registry.register('Database fingerprints', self.get_fingerprint_stats)
+
         super(Database, self).__init__()
 
     @run_async
     def add_to_database_command(self, bot: Bot, update: Update):
         """Add a user to the database if he is not already in it
 
+        This only queues the upserts. It still runs in its own thread, because queueing waits for the writer while its
+        buffer is full.
+
         Args:
             bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
             update (:obj:`telegram.update.Update`): Telegram Api Update Object
         """
-        self.upsert_chat(update.effective_chat)
-        self.upsert_message(update.effective_message)
-        self.upsert_user(update.effective_user)
+        if update.effective_chat:
+            self.upsert_chat(update.effective_chat)
+        if update.effective_message:
+            self.upsert_message(update.effective_message)
+        if update.effective_user:
+            self.upsert_user(update.effective_user)
+
+    def index_report(self, bot: Bot, update: Update):
+        """Report the regularly run queries which still do a collection scan
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+        """
+        scans = find_collection_scans()
+        if not scans:
+            update.message.reply_text('All queries are covered by an index.')
+            return
+
+        lines = ['These queries do a collection scan:']
+        lines.extend('- {}: {}'.format(collection_name, query) for collection_name, query in scans)
+        update.message.reply_text('\n'.join(lines))
+
+    def flush(self):
+        """Write all queued upserts now
+        """
+        self.writer.flush()
+
+    def get_fingerprint_stats(self) -> dict:
+        """Get the number of written and skipped users and chats
+
+        Returns:
+            :obj:`dict`: Written and skipped counts plus the number of cached fingerprints
+        """
+        stats = OrderedDict(self.fingerprint_stats)
+        stats['cached'] = len(self.fingerprints)
+        return stats
+
+    def upsert_if_changed(self, kind: str, collection, id_: int, document: dict):
+        """Queue an upsert unless the document is the same as the last one queued
+
+        For every user and chat the fingerprint of the last queued and of the last written version are kept. A document
+        is compared to the last queued one, which can still be pending. If writing it fails, the last queued
+        fingerprint is reset to the last written one, so the document is written again the next time it is seen.
+
+        Args:
+            kind (:obj:`str`): Kind of document, either user or chat
+            collection (:obj:`pymongo.collection.Collection`): Collection to write to
+            id_ (:obj:`int`): Id of the user or chat
+            document (:obj:`dict`): The document
+        """
+        fingerprint = sha1(json.dumps(document, sort_keys=True, default=str).encode()).digest()
+        key = (kind, id_)
+        with self.fingerprint_lock:
+            queued, written = self.fingerprints.get(key, (None, None))
+            if queued == fingerprint:
+                self.fingerprint_stats[f'{kind}s_skipped'] += 1
+                return
+            self.fingerprints.set(key, (fingerprint, written))
+
+        self.writer.upsert(collection, {'id': id_}, document,
+                           on_written=partial(self.fingerprint_written, kind, id_, fingerprint),
+                           on_failed=partial(self.fingerprint_failed, kind, id_, fingerprint))
+
+    def fingerprint_written(self, kind: str, id_: int, fingerprint: bytes):
+        """Remember the fingerprint of a written user or chat
+
+        Args:
+            kind (:obj:`str`): Kind of document, either user or chat
+            id_ (:obj:`int`): Id of the user or chat
+            fingerprint (:obj:`bytes`): Fingerprint of the written document
+        """
+        key = (kind, id_)
+        with self.fingerprint_lock:
+            queued, written = self.fingerprints.get(key, (fingerprint, None))
+            self.fingerprints.set(key, (queued, fingerprint))
+            self.fingerprint_stats[f'{kind}s_written'] += 1
+
+    def fingerprint_failed(self, kind: str, id_: int, fingerprint: bytes):
+        """Go back to the last written fingerprint of a user or chat whose write failed
+
+        Args:
+            kind (:obj:`str`): Kind of document, either user or chat
+            id_ (:obj:`int`): Id of the user or chat
+            fingerprint (:obj:`bytes`): Fingerprint of the document which was not written
+        """
+        key = (kind, id_)
+        with self.fingerprint_lock:
+            queued, written = self.fingerprints.get(key, (None, None))
+            # A newer version queued in the meantime is still pending
+            if queued == fingerprint:
+                self.fingerprints.set(key, (written, written))
 
     def upsert_user(self, user: User):
         """Insert or if existing update user
@@ -53,7 +181,7 @@ class Database(BaseCommand):
         Args:
             user (:obj:`telegram.user.User`): Telegram Api User Object
         """
-        self.users.update({'id': user.id}, user.to_dict(), upsert=True)
+        self.upsert_if_changed('user', self.users, user.id, user.to_dict())
 
     def upsert_message(self, message: Message):
         """Insert or if existing update message
@@ -61,7 +189,7 @@ class Database(BaseCommand):
         Args:
             message (:obj:`telegram.message.Message`): Telegram Api Message Object
         """
-        self.messages.update({'message_id': message.message_id}, message.to_dict(), upsert=True)
+        self.writer.upsert(self.messages, {'message_id': message.message_id}, message.to_dict())
 
     def upsert_chat(self, chat: Chat):
         """Insert or if existing update chat
@@ -69,7 +197,7 @@ class Database(BaseCommand):
         Args:
             chat (:obj:`telegram.chat.Chat`): Telegram Api Chat Object
         """
-        self.chats.update({'id': chat.id}, chat.to_dict(), upsert=True)
+        self.upsert_if_changed('chat', self.chats, chat.id, chat.to_dict())
 
 
 database = Database()
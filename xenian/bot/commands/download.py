@@ -3,9 +3,9 @@ import re
 import shutil
 
 from PIL import Image
+from concurrent.futures import wait
 from io import BufferedWriter
 from tempfile import NamedTemporaryFile, TemporaryDirectory
-from uuid import uuid4
 
 import youtube_dl
 from moviepy.video.io.VideoFileClip import VideoFileClip
@@ -15,9 +15,8 @@ from telegram.error import BadRequest, NetworkError, TimedOut
 from telegram.ext import CallbackQueryHandler, Filters, MessageHandler, run_async
 from youtube_dl import DownloadError
 
-from xenian.bot.settings import UPLOADER
-from xenian.bot.uploaders import uploader
-from xenian.bot.utils import CustomNamedTemporaryFile, TelegramProgressBar, save_file
+from xenian.bot.uploaders import content_store, get_url, upload_executor, uploader
+from xenian.bot.utils import CustomNamedTemporaryFile, SendScheduler, TelegramProgressBar, save_file, send_scheduler
 from . import BaseCommand
 from .filters.download_mode import download_mode_filter
 
@@ -165,11 +164,16 @@ class Download(BaseCommand):
             created_zip = shutil.make_archive(zip_path, format='zip', root_dir=zip_content_path, base_dir='.')
 
             if os.path.getsize(created_zip) > 52428800:
-                message.reply_text('File is too big, sorry!', reply_to_message_id=message.message_id)
+                send_scheduler.send(message.chat_id, message.reply_text, 'File is too big, sorry!',
+                                    reply_to_message_id=message.message_id, lane=SendScheduler.INTERACTIVE)
             else:
-                with open(created_zip, mode='br') as zip_file:
-                    message.reply_document(zip_file, filename=os.path.basename(created_zip), timeout=50,
-                                           reply_to_message_id=message.message_id)
+                def send_zip():
+                    # Opened for every attempt, a retried send would otherwise upload an already read file
+                    with open(created_zip, mode='br') as zip_file:
+                        return message.reply_document(zip_file, filename=os.path.basename(created_zip), timeout=50,
+                                                      reply_to_message_id=message.message_id)
+
+                send_scheduler.send(message.chat_id, send_zip, lane=SendScheduler.INTERACTIVE)
 
     def download_stickers_to_file(self, bot: Bot, sticker: Sticker, file_object: BufferedWriter):
         """Download Sticker as images to file_object
@@ -209,8 +213,12 @@ class Download(BaseCommand):
 
         with CustomNamedTemporaryFile(suffix='.png', prefix='xenian-') as image:
             self.download_stickers_to_file(bot, orig_sticker, image)
-            image.seek(0)
-            bot.send_photo(update.message.chat_id, photo=image)
+
+            def send_photo():
+                image.seek(0)
+                return bot.send_photo(update.message.chat_id, photo=image)
+
+            send_scheduler.send(update.message.chat_id, send_photo, lane=SendScheduler.INTERACTIVE)
 
     def download_video_to_file(self, bot: Bot, document: Document, file_object: BufferedWriter, file_object_path: str):
         """Download Sticker as images to file_object
@@ -221,6 +229,17 @@ class Download(BaseCommand):
             file_object (:obj:`io.BufferedWriter`): Actual existing file object
             file_object_path (:obj:`str`): The path to the file given in file_object
         """
+        self.convert_video_to_gif(bot, document, file_object_path)
+        return file_object, file_object_path, self.compress_gif(file_object_path)
+
+    def convert_video_to_gif(self, bot: Bot, document: Document, gif_path: str):
+        """Download a video and save it as gif
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            document (:obj:`telegram.document.Document`): A Telegram API Document object
+            gif_path (:obj:`str`): Where to save the gif
+        """
         video = bot.getFile(document.file_id)
 
         with CustomNamedTemporaryFile() as video_file:
@@ -228,16 +247,24 @@ class Download(BaseCommand):
             video_file.close()
             video_clip = VideoFileClip(video_file.name, audio=False)
 
-            video_clip.write_gif(file_object_path)
+            video_clip.write_gif(gif_path)
             video_clip.close()
 
-            dirname = os.path.dirname(file_object_path)
-            file_name = os.path.splitext(file_object_path)[0]
-            compressed_gif_path = os.path.join(dirname, file_name + '-min.gif')
+    def compress_gif(self, gif_path: str) -> str:
+        """Compress a gif with gifsicle
 
-            os.system('gifsicle -O3 --lossy=50 -o {dst} {src}'.format(dst=compressed_gif_path, src=file_object_path))
-            compressed_gif_path = compressed_gif_path if os.path.isfile(compressed_gif_path) else ''
-            return file_object, file_object_path, compressed_gif_path
+        Args:
+            gif_path (:obj:`str`): Path to the gif
+
+        Returns:
+            :obj:`str`: Path to the compressed gif or an empty string if it could not be compressed
+        """
+        dirname = os.path.dirname(gif_path)
+        file_name = os.path.splitext(gif_path)[0]
+        compressed_gif_path = os.path.join(dirname, file_name + '-min.gif')
+
+        os.system('gifsicle -O3 --lossy=50 -o {dst} {src}'.format(dst=compressed_gif_path, src=gif_path))
+        return compressed_gif_path if os.path.isfile(compressed_gif_path) else ''
 
     @run_async
     def download_gif(self, bot: Bot, update: Update):
@@ -259,21 +286,23 @@ class Download(BaseCommand):
             return
 
         with CustomNamedTemporaryFile(suffix='.gif') as video_file:
-            _, orig_path, compressed_path = self.download_video_to_file(bot, document, video_file, video_file.name)
-
-            uploader.connect()
-            upload_path = UPLOADER.get('url', None) or UPLOADER['configuration'].get('path', None) or ''
-
-            upload_orig_file_name = 'xenian-{}.gif'.format(str(uuid4())[:8])
-            uploader.upload(orig_path, upload_orig_file_name)
+            orig_path = video_file.name
+            self.convert_video_to_gif(bot, document, orig_path)
 
-            orig_host_path = upload_path + '/' + upload_orig_file_name
-
-            compressed_host_path = None
-            if os.path.isfile(compressed_path):
-                upload_compressed_file_name = 'xenian-{}-min.gif'.format(str(uuid4())[:8])
-                uploader.upload(compressed_path, upload_compressed_file_name)
-                compressed_host_path = upload_path + '/' + upload_compressed_file_name
+            # The original is uploaded while the compressed version is created
+            orig_host_path, orig_upload = upload_executor.store(orig_path, '.gif')
+            try:
+                compressed_path = self.compress_gif(orig_path)
+
+                compressed_host_path = None
+                if compressed_path:
+                    compressed_host_path = content_store.store(compressed_path, '.gif')
+            except BaseException:
+                # The upload reads the original, which is removed when leaving the with block
+                if not orig_upload.cancel():
+                    wait([orig_upload])
+                raise
+            orig_upload.result()
 
             # If the host path a local path we can't send it as an URL, so we send the gif just as a ZIP file.
             if os.path.isfile(orig_host_path):
@@ -288,20 +317,23 @@ class Download(BaseCommand):
                     os.chmod(zip_content_path, 0o40755)
                     created_zip = shutil.make_archive(zip_path, format='zip', root_dir=zip_content_path, base_dir='.')
                     if os.path.getsize(created_zip) > 52428800:
-                        message.reply_text('File is too big, sorry!', reply_to_message_id=message.message_id)
+                        send_scheduler.send(message.chat_id, message.reply_text, 'File is too big, sorry!',
+                                            reply_to_message_id=message.message_id, lane=SendScheduler.INTERACTIVE)
                     else:
-                        with open(created_zip, mode='br') as zip_file:
-                            message.reply_document(zip_file, filename=os.path.basename(created_zip),
-                                                   reply_to_message_id=message.message_id)
-                uploader.close()
+                        def send_zip():
+                            with open(created_zip, mode='br') as zip_file:
+                                return message.reply_document(zip_file, filename=os.path.basename(created_zip),
+                                                              reply_to_message_id=message.message_id)
+
+                        send_scheduler.send(message.chat_id, send_zip, lane=SendScheduler.INTERACTIVE)
                 return
-            uploader.close()
 
             downloadable_file = compressed_host_path or orig_host_path
 
             reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("Download GIF", url=downloadable_file), ], ])
-            message.reply_photo(downloadable_file, 'Instant GIF Download', reply_markup=reply_markup,
-                                reply_to_message_id=message.message_id)
+            send_scheduler.send(message.chat_id, message.reply_photo, downloadable_file, 'Instant GIF Download',
+                                reply_markup=reply_markup, reply_to_message_id=message.message_id,
+                                lane=SendScheduler.INTERACTIVE)
 
     @run_async
     def download(self, bot: Bot, update: Update):
@@ -526,20 +558,21 @@ class VideoDownloader(BaseCommand):
 
                         bot.send_message(chat_id=chat_id, text='Depending on the filesize the upload could take some '
                                                                'time')
-                        bot.send_document(chat_id=chat_id, document=open(file_path, mode='rb'), filename=filename,
-                                          timeout=60)
+
+                        def send_video():
+                            with open(file_path, mode='rb') as file:
+                                return bot.send_document(chat_id, file, filename=filename, timeout=60)
+
+                        send_scheduler.send(chat_id, send_video, lane=SendScheduler.INTERACTIVE)
                         sent = True
                     except (NetworkError, TimedOut, BadRequest):
                         pass
 
                 if not sent:
                     bot.send_chat_action(chat_id=chat_id, action=ChatAction.UPLOAD_VIDEO)
-                    uploader.connect()
                     uploader.upload(file_path, remove_after=1800)
-                    uploader.close()
 
-                    path = UPLOADER.get('url', None) or UPLOADER['configuration'].get('path', None) or ''
-                    url_path = os.path.join(path, filename)
+                    url_path = get_url(filename)
 
                     if os.path.isfile(url_path):
                         # Can not send a download link to the user if the file is stored locally without url config
@@ -1,3 +1,4 @@
+from .save_mode_cache import *
 from .admin import *
 from .anime import *
 from .download_mode import *
@@ -2,6 +2,7 @@ from telegram import Message
 from telegram.ext import BaseFilter
 
 from xenian.bot import mongodb_database
+from .save_mode_cache import get_save_mode
 
 __all__ = ['anime_save_mode']
 
@@ -24,7 +25,7 @@ class AnimeSaveModeFilter(BaseFilter):
         Returns:
             :obj:`bool`
         """
-        data = self.gif_save_mode.find_one({'chat_id': message.chat_id})
+        data = get_save_mode(self.gif_save_mode, message.chat_id)
         return data['mode'] if data else False
 
 
@@ -1,7 +1,8 @@
-from telegram import Message, Chat
+from telegram import Message
 from telegram.ext import BaseFilter
 
 from xenian.bot import mongodb_database
+from .save_mode_cache import get_save_mode
 
 __all__ = ['custom_db_save_mode']
 
@@ -24,7 +25,7 @@ class CustomDBSaveModeFilter(BaseFilter):
         Returns:
             :obj:`bool`
         """
-        data = self.custom_db_save_mode.find_one({'chat_id': message.chat.id})
+        data = get_save_mode(self.custom_db_save_mode, message.chat.id)
         return data['mode'] if data else False
 
 
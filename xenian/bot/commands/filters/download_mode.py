@@ -34,8 +34,7 @@ class DownloadMode(BaseFilter):
         Returns:
             :obj:`bool`: True if the user has download mode on, False otherwise
         """
-        mode_list = data.get(self.data_set_name)
-        user_config = mode_list.get(telegram_user, {})
+        user_config = data.get_key(self.data_set_name, telegram_user, {})
         if isinstance(user_config, bool):
             # Before user settings were a dict
             return user_config
@@ -50,8 +49,7 @@ class DownloadMode(BaseFilter):
         Returns:
             :obj:`bool`: True if the user has download mode and zip mode on, False otherwise
         """
-        mode_list = data.get(self.data_set_name)
-        user_config = mode_list.get(telegram_user, {})
+        user_config = data.get_key(self.data_set_name, telegram_user, {})
         if isinstance(user_config, bool):
             # Before user settings were a dict
             return False
@@ -65,9 +63,7 @@ class DownloadMode(BaseFilter):
             telegram_user (:obj:`str`): The telegram users user_id
             zip_mode: (:obj:`bool`): If the downloads shall be zipped
         """
-        mode_dict = data.get(self.data_set_name)
-        mode_dict[telegram_user] = {'on': True, 'zip': zip_mode}
-        data.save(self.data_set_name, mode_dict)
+        data.set_key(self.data_set_name, telegram_user, {'on': True, 'zip': zip_mode})
 
     def turn_off(self, telegram_user: str):
         """Turn download mode off
@@ -75,9 +71,7 @@ class DownloadMode(BaseFilter):
         Args:
             telegram_user (:obj:`str`): The telegram users user_id
         """
-        mode_dict = data.get(self.data_set_name)
-        mode_dict[telegram_user] = {'on': False, 'zip': False}
-        data.save(self.data_set_name, mode_dict)
+        data.set_key(self.data_set_name, telegram_user, {'on': False, 'zip': False})
 
     def toggle_mode(self, telegram_user: str, zip_mode: bool = False) -> bool:
         """Toggle download mode
@@ -0,0 +1,29 @@
+from pymongo.collection import Collection
+
+from xenian.bot.utils import TTLCache, stats_registry
+
+__all__ = ['save_mode_cache', 'get_save_mode']
+
+save_mode_cache = TTLCache(timeout=10 * 60, maxsize=10000)
+"""(:obj:`xenian.bot.utils.cache.TTLCache`): Save mode documents by (collection name, chat_id)
+
+Commands changing a save mode must invalidate the chats entry after writing it.
+"""
+
+stats_registry.register('Save mode cache', save_mode_cache.stats)
+
+
+def get_save_mode(collection: Collection, chat_id: int) -> dict or None:
+    """Get the save mode document of a chat from the cache or the database
+
+    Args:
+        collection (:obj:`pymongo.collection.Collection`): Collection containing the save mode documents
+        chat_id (:obj:`int`): Id of the chat
+
+    Returns:
+        :obj:`dict`: The save mode document or :obj:`None` if the chat has none
+    """
+    return save_mode_cache.get(
+        (collection.name, chat_id),
+        lambda: collection.find_one({'chat_id': chat_id}, {'_id': False})
+    )
@@ -196,21 +196,12 @@ class GroupManager(BaseCommand):
         from_user = update.message.from_user
         wanted_user = update.message.reply_to_message.from_user
 
-        group_data = data.get(self.group_data_set)
-
-        if not group_data.get(chat_id, None):
-            group_data[chat_id] = {}
-        if not group_data[chat_id].get(wanted_user.id, None):
-            group_data[chat_id][wanted_user.id] = 'banned'
-        else:
-            if group_data[chat_id][wanted_user.id] == 'banned':
-                bot.send_message(
-                    chat_id=chat_id,
-                    text='{wanted_user} was already banned.'.format(wanted_user=get_user_link(wanted_user)),
-                    parse_mode=ParseMode.MARKDOWN)
-                return
-            else:
-                group_data[chat_id][wanted_user.id] = 'banned'
+        if data.get_key(self.group_data_set, [chat_id, wanted_user.id]) == 'banned':
+            bot.send_message(
+                chat_id=chat_id,
+                text='{wanted_user} was already banned.'.format(wanted_user=get_user_link(wanted_user)),
+                parse_mode=ParseMode.MARKDOWN)
+            return
 
         now = datetime.datetime.now()
 
@@ -225,7 +216,7 @@ class GroupManager(BaseCommand):
                 wanted_user=get_user_link(wanted_user)),
             parse_mode=ParseMode.MARKDOWN)
 
-        data.save(self.group_data_set, group_data)
+        data.set_key(self.group_data_set, [chat_id, wanted_user.id], 'banned')
 
     def warn(self, bot: Bot, update: Update, wanted_user: User = None):
         """Strike a user
@@ -244,22 +235,17 @@ class GroupManager(BaseCommand):
         from_user = update.message.from_user
         wanted_user = wanted_user or update.message.reply_to_message.from_user
 
-        group_data = data.get(self.group_data_set)
-
-        if not group_data.get(chat_id, None):
-            group_data[chat_id] = {}
-        if not group_data[chat_id].get(wanted_user.id, None):
-            group_data[chat_id][wanted_user.id] = 1
-        else:
-            if group_data[chat_id][wanted_user.id] == 'banned':
-                bot.send_message(
-                    chat_id=chat_id,
-                    text='{wanted_user} was already banned.'.format(wanted_user=get_user_link(wanted_user)),
-                    parse_mode=ParseMode.MARKDOWN)
-                return
-            else:
-                group_data[chat_id][wanted_user.id] += 1
-        if group_data[chat_id][wanted_user.id] == 3:
+        try:
+            warns = data.incr(self.group_data_set, [chat_id, wanted_user.id])
+        except TypeError:
+            # The user is marked as 'banned'
+            bot.send_message(
+                chat_id=chat_id,
+                text='{wanted_user} was already banned.'.format(wanted_user=get_user_link(wanted_user)),
+                parse_mode=ParseMode.MARKDOWN)
+            return
+
+        if warns >= 3:
             self.ban(bot, update)
             return
 
@@ -269,11 +255,9 @@ class GroupManager(BaseCommand):
                   'gets banned.').format(
                 from_user=get_user_link(from_user),
                 wanted_user=get_user_link(wanted_user),
-                warns=group_data[chat_id][wanted_user.id]),
+                warns=warns),
             parse_mode=ParseMode.MARKDOWN)
 
-        data.save(self.group_data_set, group_data)
-
     def unwarn(self, bot: Bot, update: Update, wanted_user: User = None):
         """Remove all warnings from a user
 
@@ -289,9 +273,7 @@ class GroupManager(BaseCommand):
         from_user = update.message.from_user
         wanted_user = wanted_user or update.message.reply_to_message.from_user
 
-        group_data = data.get(self.group_data_set)
-
-        if not group_data.get(chat_id, None) or not group_data[chat_id].get(wanted_user.id, None):
+        if not data.get_key(self.group_data_set, [chat_id, wanted_user.id]):
             bot.send_message(
                 chat_id=chat_id,
                 text='{wanted_user} was never warned.'.format(
@@ -299,8 +281,7 @@ class GroupManager(BaseCommand):
                 parse_mode=ParseMode.MARKDOWN)
             return
 
-        group_data[chat_id][wanted_user.id] = 0
-        data.save(self.group_data_set, group_data)
+        data.set_key(self.group_data_set, [chat_id, wanted_user.id], 0)
         bot.send_message(
             chat_id=chat_id,
             text='{from_user} removed {wanted_user} warnings.'.format(
@@ -342,13 +323,7 @@ class GroupManager(BaseCommand):
         chat_id = update.message.chat_id
         from_user = update.message.from_user
 
-        group_data = data.get(self.group_data_set)
-
-        if not group_data.get(chat_id, None):
-            group_data[chat_id] = {}
-
-        group_data[chat_id]['rules'] = text
-        data.save(self.group_data_set, group_data)
+        data.set_key(self.group_data_set, [chat_id, 'rules'], text)
 
         bot.send_message(
             chat_id=chat_id,
@@ -365,16 +340,14 @@ class GroupManager(BaseCommand):
         """
         chat_id = update.message.chat_id
         from_user = update.message.from_user
-        group_data = data.get(self.group_data_set)
 
-        if not group_data.get(chat_id, None) or not group_data[chat_id].get('rules', None):
+        if not data.get_key(self.group_data_set, [chat_id, 'rules']):
             bot.send_message(
                 chat_id=chat_id,
                 text='This group has no rules defined, use /rules_define to add them.')
             return
 
-        group_data[chat_id]['rules'] = ''
-        data.save(self.group_data_set, group_data)
+        data.set_key(self.group_data_set, [chat_id, 'rules'], '')
         bot.send_message(
             chat_id=chat_id,
             text='{user} has set removed the groups rules.'.format(
@@ -391,9 +364,9 @@ class GroupManager(BaseCommand):
             update (:obj:`telegram.update.Update`): Telegram Api Update Object
         """
         chat_id = update.message.chat_id
-        group_data = data.get(self.group_data_set)
+        rules = data.get_key(self.group_data_set, [chat_id, 'rules'])
 
-        if not group_data.get(chat_id, None) or not group_data[chat_id].get('rules', None):
+        if not rules:
             bot.send_message(
                 chat_id=chat_id,
                 text='This group has no rules defined, use /rules_define to add them.')
@@ -401,7 +374,7 @@ class GroupManager(BaseCommand):
 
         bot.send_message(
             chat_id=chat_id,
-            text=group_data[chat_id]['rules'],
+            text=rules,
             parse_mode=ParseMode.MARKDOWN)
 
 
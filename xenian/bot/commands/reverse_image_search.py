@@ -1,7 +1,13 @@
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 from uuid import uuid4
-import os
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
-from telegram.ext import Filters, run_async
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Message, ParseMode, Update
+from telegram.error import TelegramError
+from telegram.ext import CallbackQueryHandler, Filters, run_async
 from telegram.ext.messagehandler import MessageHandler
 
 from xenian.bot.commands.filters import download_mode_filter
@@ -10,19 +16,57 @@ from xenian.bot.commands.reverse_image_search_engines.google import GoogleRevers
 from xenian.bot.commands.reverse_image_search_engines.iqdb import IQDBReverseImageSearchEngine
 from xenian.bot.commands.reverse_image_search_engines.tineye import TinEyeReverseImageSearchEngine
 from xenian.bot.commands.reverse_image_search_engines.yandex import YandexReverseImageSearchEngine
-from xenian.bot.utils import auto_download
+from xenian.bot.uploaders import upload_executor
+from xenian.bot.utils import ImageHashIndex, TTLCache, auto_download, image_hashes, preview_download, \
+    stats_registry
 from . import BaseCommand
 
 __all__ = ['reverse_image_search']
 
+logger = logging.getLogger(__name__)
+
 
 class ReverseImageSearch(BaseCommand):
     """Reverse Image Search integration for this bot
+
+    Searched images are remembered by the perceptual hash of their Telegram preview. When the same or a similar image
+    is sent again while its upload still exists, the links of the first search are sent without downloading,
+    converting and uploading it again.
+
+    The "Best Match" button searches the image on all engines which can find matches at the same time and sends their
+    matches ordered by similarity.
+
+    Attributes:
+        engines (:obj:`collections.OrderedDict`): Search engine classes by the name shown on their button
+        image_lifetime (:obj:`int`): Seconds until an uploaded image is removed
+        link_lifetime (:obj:`int`): Seconds the links of a remembered search must still work when they are sent again
+        match_timeout (:obj:`int`): Seconds to wait for all engines when searching the best match, engines which did
+            not answer by then are left out
+        search_index (:obj:`xenian.bot.utils.image_hash.ImageHashIndex`): Image url and search links of recent searches
+        searched_images (:obj:`xenian.bot.utils.cache.TTLCache`): Image urls by the token in the "Best Match" button
+        match_executor (:obj:`concurrent.futures.ThreadPoolExecutor`): Runs the requests to the search engines
     """
 
     group = 'Image'
 
+    engines = OrderedDict([
+        ('IQDB', IQDBReverseImageSearchEngine),
+        ('GOOGLE', GoogleReverseImageSearchEngine),
+        ('YANDEX', YandexReverseImageSearchEngine),
+        ('BING', BingReverseImageSearchEngine),
+        ('TINEYE', TinEyeReverseImageSearchEngine),
+    ])
+
+    image_lifetime = 3600
+    link_lifetime = 600
+    match_timeout = 20
+
     def __init__(self):
+        self.search_index = ImageHashIndex(maxsize=10000)
+        self.searched_images = TTLCache(timeout=self.image_lifetime, maxsize=10000)
+        self.match_executor = ThreadPoolExecutor(max_workers=4 * len(self.engines), thread_name_prefix='best_match')
+        stats_registry.register('Reverse search index', self.search_index.stats)
+
         self.commands = [
             {
                 'title': 'Auto Search',
@@ -43,7 +87,17 @@ class ReverseImageSearch(BaseCommand):
                 'description': 'Reply to media for reverse search',
                 'command': self.reply_search,
                 'command_name': 'search'
-            }
+            },
+            {
+                'title': 'Best match',
+                'description': 'Search the image on all search engines and send the best matches',
+                'command': self.best_match,
+                'handler': CallbackQueryHandler,
+                'hidden': True,
+                'options': {
+                    'pattern': r'^best_match\s\w+$',
+                },
+            },
         ]
 
         super(ReverseImageSearch, self).__init__()
@@ -70,33 +124,68 @@ class ReverseImageSearch(BaseCommand):
             update (:obj:`telegram.update.Update`): Telegram Api Update Object
         """
         message = update.message.reply_text('Please wait for the media file to be processed...')
-        with auto_download(bot, update, convert_video_to_gif=True) as file_path:
-            if file_path:
-                self.reverse_image_search(bot, update, file_path, message)
+
+        hashes = self.get_image_hashes(bot, update)
+        if hashes is not None:
+            known_search = self.search_index.find(hashes)
+            if known_search is not None:
+                self.send_search_links(bot, update, *known_search, message=message)
+                return
+
+        with auto_download(bot, update, convert_video_to_gif=True, in_memory=True) as media_file:
+            if media_file:
+                self.reverse_image_search(bot, update, media_file, message, hashes=hashes)
             else:
                 update.message.reply_text('Something went wrong contact and admin /error <TEXT> or try again later')
 
-    def reverse_image_search(self, bot: Bot, update: Update, media_file: str, message: Message = None):
-        """Send a reverse image search link for the image sent to us
+    def get_image_hashes(self, bot: Bot, update: Update) -> tuple or None:
+        """Get the hashes of the preview of the media in a message
 
         Args:
             bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
             update (:obj:`telegram.update.Update`): Telegram Api Update Object
-            media_file (:obj:`str`): Path to file to search for
-            message (:obj:`telegram.message.Message`, optional): An message object to update. Instead of sending a new
+
+        Returns:
+            :obj:`tuple`: The hashes, see :func:`xenian.bot.utils.image_hash.image_hashes`, or :obj:`None` if the
+                media has no preview or it could not be read
         """
+        try:
+            preview = preview_download(bot, update)
+            return image_hashes(preview) if preview is not None else None
+        except (TelegramError, IOError, ValueError) as e:
+            logger.warning(f'Could not hash the preview of message {update.message.message_id}: {e}')
+            return None
 
-        image_extension = os.path.splitext(media_file)[1]
-        image_name = 'irs-' + str(uuid4())[:8]
+    def get_search_links(self, image_url: str) -> OrderedDict:
+        """Get the links to search for an image on every search engine
 
-        iqdb_search, google_search, tineye_search, bing_search, yandex_search = (
-            IQDBReverseImageSearchEngine(), GoogleReverseImageSearchEngine(), TinEyeReverseImageSearchEngine(),
-            BingReverseImageSearchEngine(), YandexReverseImageSearchEngine()
+        Args:
+            image_url (:obj:`str`): Url of the image
+
+        Returns:
+            :obj:`collections.OrderedDict`: Search links by the name of the search engine
+        """
+        return OrderedDict(
+            (name, engine_class().get_search_link_by_url(image_url)) for name, engine_class in self.engines.items()
         )
 
-        image_url = iqdb_search.upload_image(media_file, image_name + image_extension, remove_after=3600)
+    def reverse_image_search(self, bot: Bot, update: Update, media_file: str, message: Message = None,
+                             hashes: tuple = None):
+        """Send a reverse image search link for the image sent to us
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+            media_file (:obj:`str` or :obj:`io.BytesIO`): Path to file to search for or the file itself with a name
+                attribute
+            message (:obj:`telegram.message.Message`, optional): An message object to update. Instead of sending a new
+            hashes (:obj:`tuple`, optional): Hashes of the image, the search is remembered under them if given
+        """
+        # The url is known before the upload is done, so the links are created while the image is uploaded
+        image_url, upload = upload_executor.store(media_file, remove_after=self.image_lifetime)
 
-        if os.path.isfile(image_url):
+        if not urlparse(image_url).scheme:
+            upload.cancel()
             reply = 'This bot is not configured for this functionality, contact an admin for more information /support.'
             if message:
                 message.edit_text(reply, reply_to_message_id=update.message.message_id)
@@ -104,26 +193,41 @@ class ReverseImageSearch(BaseCommand):
                 update.message.reply_text(reply, reply_to_message_id=update.message.message_id)
             return
 
-        iqdb_url, google_url, tineye_url, bing_url, yandex_url = (
-            iqdb_search.get_search_link_by_url(image_url), google_search.get_search_link_by_url(image_url),
-            tineye_search.get_search_link_by_url(image_url), bing_search.get_search_link_by_url(image_url),
-            yandex_search.get_search_link_by_url(image_url)
-        )
+        search_links = self.get_search_links(image_url)
+        self.send_search_links(bot, update, image_url, search_links, message=message, upload=upload)
+
+        if hashes is not None:
+            expires = time.time() + self.image_lifetime - self.link_lifetime
+            self.search_index.add(hashes, (image_url, search_links), expires)
 
-        button_list = [[
-            InlineKeyboardButton(text='Go To Image', url=image_url)
-        ], [
-            InlineKeyboardButton(text='IQDB', url=iqdb_url),
-            InlineKeyboardButton(text='GOOGLE', url=google_url),
-        ], [
-            InlineKeyboardButton(text='YANDEX', url=yandex_url),
-            InlineKeyboardButton(text='BING', url=bing_url),
-        ], [
-            InlineKeyboardButton(text='TINEYE', url=tineye_url),
-        ]]
+    def send_search_links(self, bot: Bot, update: Update, image_url: str, search_links: OrderedDict,
+                          message: Message = None, upload: Future = None):
+        """Send the links to the image and to the search engines
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+            image_url (:obj:`str`): Url of the image
+            search_links (:obj:`collections.OrderedDict`): Search links by the name of the search engine
+            message (:obj:`telegram.message.Message`, optional): An message object to update. Instead of sending a new
+            upload (:obj:`concurrent.futures.Future`, optional): Upload of the image, the links are only sent once it
+                is done
+        """
+        engine_buttons = [InlineKeyboardButton(text=name, url=url) for name, url in search_links.items()]
+        button_list = [[InlineKeyboardButton(text='Go To Image', url=image_url)]]
+        button_list.extend(engine_buttons[index:index + 2] for index in range(0, len(engine_buttons), 2))
+
+        token = uuid4().hex
+        self.searched_images.set(token, image_url)
+        button_list.append([InlineKeyboardButton(text='BEST MATCH', callback_data=f'best_match {token}')])
 
         reply = 'Tap on the search engine of your choice.'
         reply_markup = InlineKeyboardMarkup(button_list)
+
+        # The links must not be used before the image is uploaded
+        if upload is not None:
+            upload.result()
+
         if message:
             bot.edit_message_text(
                 chat_id=update.message.chat_id,
@@ -137,5 +241,93 @@ class ReverseImageSearch(BaseCommand):
                 reply_markup=reply_markup
             )
 
+    @run_async
+    def best_match(self, bot: Bot, update: Update):
+        """Send the best matches of all search engines for a searched image
+
+        Args:
+            bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+            update (:obj:`telegram.update.Update`): Telegram Api Update Object
+        """
+        query = update.callback_query
+        image_url = self.searched_images.get(query.data.split(' ', 1)[1])
+        if image_url is None:
+            query.answer('This search expired, send the image again.')
+            return
+        query.answer('Searching for the best match...')
+
+        matches = self.find_best_matches(image_url)
+        if not matches:
+            query.message.reply_text('No search engine found a match.')
+            return
+
+        reply = '*Best matches*\n\n'
+        for position, match in enumerate(matches, start=1):
+            reply += self.format_match(position, match)
+        query.message.reply_text(reply, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+
+    def find_best_matches(self, image_url: str) -> list:
+        """Ask all search engines which support it for their best match at the same time
+
+        Every engine has its own request timeout and no engine is waited for longer than :attr:`match_timeout`, so
+        this takes as long as the slowest engine and not as long as all of them together.
+
+        Args:
+            image_url (:obj:`str`): Url of the image
+
+        Returns:
+            :obj:`list`: The best match of every engine which found one, most similar first. Matches without a
+                similarity come last.
+        """
+        engines = [(name, engine_class()) for name, engine_class in self.engines.items()
+                   if engine_class.supports_best_match()]
+        futures = {self.match_executor.submit(engine.find_best_match, image_url): name for name, engine in engines}
+
+        done, not_done = wait(futures, timeout=self.match_timeout)
+        for future in not_done:
+            future.cancel()
+            logger.info(f'{futures[future]} did not answer within {self.match_timeout}s')
+
+        matches = []
+        for future in done:
+            try:
+                match = future.result()
+            except Exception as e:
+                logger.warning(f'{futures[future]} best match failed: {e}')
+                continue
+            if match:
+                match['engine'] = futures[future]
+                matches.append(match)
+
+        return sorted(matches, key=lambda match: match.get('similarity') or -1, reverse=True)
+
+    def format_match(self, position: int, match: dict) -> str:
+        """Format a best match as markdown
+
+        Args:
+            position (:obj:`int`): Rank of the match
+            match (:obj:`dict`): The match, see
+                :attr:`xenian.bot.commands.reverse_image_search_engines.base.ReverseImageSearchEngine.best_match`
+
+        Returns:
+            :obj:`str`: The formatted match
+        """
+        website_name = match.get('website_name') or match['engine']
+        for character in '*_`[]':
+            website_name = website_name.replace(character, '')
+
+        details = []
+        if match.get('similarity') is not None:
+            details.append(f'{match["similarity"]:g}% similar')
+        if match.get('size'):
+            details.append(f'{match["size"]["width"]}x{match["size"]["height"]}')
+
+        text = f'{position}. [{website_name}]({match["website"]})' if match.get('website') else \
+            f'{position}. {website_name}'
+        if details:
+            text += ' - ' + ', '.join(details)
+        text += f'\n    Provided by {match.get("provided by", match["engine"])}\n'
+        return text
+
 
 reverse_image_search = ReverseImageSearch()
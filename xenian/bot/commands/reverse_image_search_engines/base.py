@@ -2,10 +2,8 @@ import logging
 import os
 from urllib.parse import quote_plus
 
-import requests
-
-from xenian.bot.settings import UPLOADER
-from xenian.bot.uploaders import uploader
+from xenian.bot.uploaders import content_store
+from xenian.bot.utils.http_client import http_client
 
 __all__ = ['ReverseImageSearchEngine']
 
@@ -20,6 +18,9 @@ class ReverseImageSearchEngine:
         name (:obj:`str`): Name of thi search engine
         search_html (:obj:`str`): The html of the last searched image
         search_url (:obj:`str`): The image url of the last searched image
+        timeout (:obj:`int` or :obj:`float`): Seconds to wait for the search engine to connect and to answer
+        retry (:obj:`bool`): If failed requests to the search engine are retried. :meth:`find_best_match` turns
+            this off, because its caller waits only for a fixed time
 
     Args:
         url_base (:obj:`str`): The base url of the image search engine eg. `https://www.google.com`
@@ -33,6 +34,8 @@ class ReverseImageSearchEngine:
 
     search_html = None
     search_url = None
+    timeout = 10
+    retry = True
 
     def __init__(self, url_base, url_path, name=None):
         self.url_base = url_base
@@ -67,8 +70,10 @@ class ReverseImageSearchEngine:
         """Upload the given image to the in the settings specified place.
 
         Args:
-            image_file: File like object of an image or path to an image
-            file_name (:obj:`str`, optional): Name of the given file. Can be left empty if image_file is a file path
+            image_file: File like object of an image, its content as bytes or path to an image
+            file_name (:obj:`str`, optional): Name of the given file, only its extension is used, the image is saved
+                under the hash of its content. Can be left empty if image_file is a file path or a file like object
+                with a name
             remove_after (:obj:`int`, optional): After how much time to remove the file in sec. Defaults to None (do not remove)
 
         Returns:
@@ -76,6 +81,8 @@ class ReverseImageSearchEngine:
         Raises:
             ValueError: If the image_file is an file like object and the file_name has not been set.
         """
+        if not file_name and isinstance(getattr(image_file, 'name', None), str):
+            file_name = image_file.name
         if not file_name:
             if not isinstance(image_file, str):
                 error_message = 'When image_file is a file like object the file_name must be set.'
@@ -83,12 +90,7 @@ class ReverseImageSearchEngine:
                 raise ValueError(error_message)
             file_name = os.path.basename(image_file)
 
-        uploader.connect()
-        uploader.upload(image_file, file_name, remove_after=remove_after)
-        uploader.close()
-
-        path = UPLOADER.get('url', None) or UPLOADER['configuration'].get('path', None) or ''
-        return os.path.join(path, file_name)
+        return content_store.store(image_file, os.path.splitext(file_name)[1], remove_after=remove_after)
 
     def get_html(self, url=None) -> str:
         """Get the HTML of the image search site.
@@ -109,10 +111,35 @@ class ReverseImageSearchEngine:
         if url == self.search_url and self.search_html:
             return self.search_html
 
-        request = requests.get(self.get_search_link_by_url(url))
+        request = http_client.get(self.get_search_link_by_url(url), timeout=self.timeout, retry=self.retry)
         self.search_html = request.text
         return self.search_html
 
+    @classmethod
+    def supports_best_match(cls) -> bool:
+        """Check if this search engine implements :attr:`best_match`
+
+        Returns:
+            :obj:`bool`: True if the best match can be found with this search engine
+        """
+        return cls.best_match is not ReverseImageSearchEngine.best_match
+
+    def find_best_match(self, url: str) -> dict:
+        """Search for an image and get the best match
+
+        The requests are not retried, a retry or a Retry-After header would make this wait longer than the caller
+        does.
+
+        Args:
+            url (:obj:`str`): Link to the image
+
+        Returns:
+            :obj:`dict`: Dictionary of the found image, see :attr:`best_match`, or :obj:`None` if nothing was found
+        """
+        self.retry = False
+        self.get_html(url)
+        return self.best_match
+
     @property
     def best_match(self) -> dict:
         """Get info about the best matching image found
@@ -1,6 +1,7 @@
-import requests
 from bs4 import BeautifulSoup
+from requests import RequestException
 
+from xenian.bot.utils.http_client import http_client
 from . import ReverseImageSearchEngine
 
 __all__ = ['TinEyeReverseImageSearchEngine']
@@ -66,6 +67,6 @@ class TinEyeReverseImageSearchEngine(ReverseImageSearchEngine):
             :obj:`bool`: True if image is available, False if not
         """
         try:
-            return requests.head(url) == 200
-        except:
+            return http_client.head(url, timeout=self.timeout, retry=self.retry).status_code == 200
+        except RequestException:
             return False
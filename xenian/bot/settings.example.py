@@ -13,6 +13,9 @@ ANIME_SERVICES = [
         'api': None,
         'username': None,
         'password': None,
+        'max_workers': 4,  # Not mandatory, posts of a search which are downloaded at the same time, default: 4
+        'cache_timeout': 300,  # Not mandatory, seconds search results are cached, default: 300
+        'cache_size': 500,  # Not mandatory, number of cached search result pages, default: 500
     },
     {
         'name': 'safebooru',
@@ -21,6 +24,7 @@ ANIME_SERVICES = [
         'api': None,
         'username': None,
         'password': None,
+        'max_workers': 4,
     },
     {
         'name': 'konachan',
@@ -29,6 +33,7 @@ ANIME_SERVICES = [
         'hashed_string': None,
         'username': None,
         'password': None,
+        'max_workers': 4,
     }
 ]
 
@@ -60,9 +65,47 @@ UPLOADER = {
         'password': 'YOUR_PASSWORD',  # If the server does only accepts ssh key login this must be the ssh password
         'upload_dir': 'HOST_UPLOAD_DIRECTORY',
         'key_filename': 'PATH_TO_PUBLIC_SSH_KEY',  # This is not mandatory but some server configurations require it
+        'pool_size': 4,  # Not mandatory, maximum number of open ssh connections, default: 4
+        'keepalive': 30,  # Not mandatory, interval of keepalive packets in seconds, default: 30
+        'max_concurrent_uploads': 4,  # Not mandatory, parallel background uploads, default: pool_size
     }
 }
 
+# Uploader for an object store speaking the S3 API, e.g. a local MinIO server
+# UPLOADER = {
+#     'uploader': 'xenian.bot.uploaders.s3.S3Uploader',
+#     'url': 'YOUR_BUCKET_URL',
+#     'configuration': {
+#         'bucket': 'YOUR_BUCKET',
+#         'access_key': 'YOUR_ACCESS_KEY',
+#         'secret_key': 'YOUR_SECRET_KEY',
+#         'endpoint_url': 'http://localhost:9000',  # Not mandatory, leave away for AWS S3
+#         'region': 'us-east-1',  # Not mandatory
+#         'prefix': '',  # Not mandatory, prefix of all object keys
+#         'acl': 'public-read',  # Not mandatory, canned ACL of uploaded objects
+#         'multipart_threshold': 8 * 1024 * 1024,  # Not mandatory, upload files above in parts, default: 8MB
+#         'multipart_chunksize': 8 * 1024 * 1024,  # Not mandatory, size of the parts, default: 8MB
+#         'max_part_concurrency': 10,  # Not mandatory, parts uploaded at the same time, default: 10
+#         'expiry_days': [1, 7, 30, 365],  # Not mandatory, lifetimes of the lifecycle rules in days
+#     }
+# }
+
+# Not mandatory, options for all outgoing HTTP requests, see xenian.bot.utils.http_client.HttpClient
+HTTP_CLIENT = {
+    'timeout': (5, 30),  # Connect and read timeout in seconds, default: (5, 30)
+    'retries': 3,  # Retries of failed connections and 429 / 5xx answers, default: 3
+    'backoff_factor': 0.5,  # Retries wait 0.5s, 1s, 2s, ..., default: 0.5
+    'pool_maxsize': 20,  # Connections kept open per host, default: 20
+}
+
+# Not mandatory, rate limits for sending messages, see xenian.bot.utils.send_scheduler.SendScheduler
+SEND_SCHEDULER = {
+    'global_rate': 30,  # Messages per second to all chats together, default: 30
+    'chat_rate': 1,  # Messages per second to a private chat, default: 1
+    'group_rate': 20 / 60,  # Messages per second to a group, default: 20 per minute
+    'retries': 3,  # Retries after Telegram asks to wait (RetryAfter), default: 3
+}
+
 LOG_LEVEL = logging.INFO
 
 # These Instagram credentials are used for the centralized Instagram account which automatically follows private
@@ -1,10 +1,14 @@
 from importlib import import_module
 
 from xenian.bot.settings import UPLOADER
+from .content_store import ContentStore, get_url
+from .executor import UploadExecutor
 
 uploader_pkg_name, uploader_class_name = UPLOADER['uploader'].rsplit('.', 1)
 uploader_module = import_module(uploader_pkg_name)
 uploader_class = getattr(uploader_module, uploader_class_name)
 uploader = uploader_class(UPLOADER['configuration'])
+content_store = ContentStore(uploader)
+upload_executor = UploadExecutor(content_store)
 
-__all__ = ['uploader']
+__all__ = ['uploader', 'content_store', 'upload_executor', 'get_url']
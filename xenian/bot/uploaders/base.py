@@ -1,13 +1,69 @@
+import io
+import logging
+from threading import Lock
+from weakref import WeakValueDictionary
+
+from .expiry import ExpiryIndex
+
+__all__ = ['UploaderBase', 'IterableStream']
+
+
+class IterableStream(io.RawIOBase):
+    """Readable stream over an iterable of :obj:`bytes` chunks
+
+    Args:
+        iterable (:obj:`typing.Iterable`): Iterable yielding :obj:`bytes`
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._iterator)
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
 class UploaderBase:
     """Base class for other uploader's to inherit from, to ensure to use the same methods and attributes.
 
+    Besides paths to files, uploaders accept file like objects, :obj:`bytes` and iterables of :obj:`bytes`. These are
+    streamed to the server, use :meth:`to_stream` to read them.
+
+    Files uploaded with a ``remove_after`` are recorded in a persistent :class:`ExpiryIndex`. The sweeper started with
+    :meth:`start_removal_sweeper` removes them in batches with :meth:`remove_many` once they are due, this includes
+    files which got due while the bot was not running. The sweeper holds the :meth:`path_lock` of every file it removes
+    and checks again if it is still due, so a file uploaded again in the meantime is kept.
+
     Attributes:
         configuration (:obj:`dict`): Configuration of this uploader
+        expiry_index (:obj:`xenian.bot.uploaders.expiry.ExpiryIndex`): Files which have to be removed and when
+        removal_sweep_interval (:obj:`int`): Seconds between two runs of the removal sweeper
+        removal_batch_size (:obj:`int`): Maximum number of files removed in one run of the removal sweeper
+        max_concurrent_uploads (:obj:`int`): Maximum number of uploads the
+            :class:`xenian.bot.uploaders.executor.UploadExecutor` runs at the same time, configurable with the key
+            max_concurrent_uploads
     Args:
         configuration (:obj:`dict`): Configuration of this uploader
         connect (:obj:`bool`, optional): If the uploader should directly connect to the server
     """
 
+    removal_sweep_interval = 60
+    removal_batch_size = 500
+    max_concurrent_uploads = 4
+    logger = logging.getLogger(__name__)
+
     _mandatory_configuration = {}
     """(:obj:`dict`): Mandatory configuration settings.
 
@@ -25,6 +81,10 @@ class UploaderBase:
                 raise TypeError('Configuration key "%s" must be instance of "%s"' % (key, type_))
 
         self.configuration = configuration
+        self.max_concurrent_uploads = configuration.get('max_concurrent_uploads', self.max_concurrent_uploads)
+        self.expiry_index = ExpiryIndex(type(self).__name__)
+        self._path_locks = WeakValueDictionary()
+        self._path_locks_lock = Lock()
         if connect:
             self.connect()
 
@@ -42,7 +102,7 @@ class UploaderBase:
         """Upload a file to the server
 
         Args:
-            file: file like object or a path to a file
+            file: Path to a file, file like object, :obj:`bytes` like object or an iterable of :obj:`bytes`
             remove_after (:obj:`int`): After how much time to remove the file in sec
 
         Raises:
@@ -50,6 +110,40 @@ class UploaderBase:
         """
         raise NotImplementedError
 
+    @staticmethod
+    def to_stream(file):
+        """Turn the content given to :meth:`upload` into a readable stream, so it can be written without a temp file
+
+        File like objects are rewound and returned as they are.
+
+        Args:
+            file: File like object, :obj:`bytes` like object or an iterable of :obj:`bytes`
+
+        Returns:
+            A readable file like object
+        """
+        if getattr(file, 'read', False):
+            if not hasattr(file, 'seekable') or file.seekable():
+                file.seek(0)
+            return file
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            return io.BytesIO(file)
+        return io.BufferedReader(IterableStream(file))
+
+    def get_upload_path(self, filename: str) -> str:
+        """Get the path on the server a file is uploaded to, if no sub directory is given
+
+        Args:
+            filename (:obj:`str`): Filename on the server
+
+        Returns:
+            :obj:`str`: Path of the file on the server
+
+        Raises:
+            :obj:`NotImplementedError`: If you did not implement the function in your uploader.
+        """
+        raise NotImplementedError
+
     def remove(self, file_path: str, self_connect: bool):
         """Remove a file from the server
 
@@ -61,3 +155,96 @@ class UploaderBase:
             :obj:`NotImplementedError`: If you did not implement the function in your uploader.
         """
         raise NotImplementedError
+
+    def remove_many(self, file_paths: list) -> list:
+        """Remove multiple files from the server
+
+        Files which do not exist anymore count as removed. Override this if the uploader can remove multiple files
+        more efficiently than one by one.
+
+        Args:
+            file_paths (:obj:`list`): paths to the files
+
+        Returns:
+            :obj:`list`: The paths which were removed
+        """
+        removed = []
+        for file_path in file_paths:
+            try:
+                self.remove(file_path, True)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.logger.warning(f'Could not remove {file_path}: {e}')
+                continue
+            removed.append(file_path)
+        return removed
+
+    def schedule_removal(self, file_path: str, remove_after: int):
+        """Remove a file after the given time, even if the bot is restarted in between
+
+        Args:
+            file_path (:obj:`str`): path to a file
+            remove_after (:obj:`int`): After how much time to remove the file in sec
+        """
+        self.expiry_index.add(file_path, remove_after)
+
+    def cancel_removal(self, file_path: str):
+        """Keep a file whose removal has been scheduled
+
+        Args:
+            file_path (:obj:`str`): path to a file
+        """
+        self.expiry_index.discard(file_path)
+
+    def path_lock(self, file_path: str) -> Lock:
+        """Get a lock which is held while a file is uploaded or removed
+
+        Args:
+            file_path (:obj:`str`): Path of the file on the server, as returned by :meth:`get_upload_path`
+
+        Returns:
+            :obj:`threading.Lock`: The lock for this file
+        """
+        with self._path_locks_lock:
+            lock = self._path_locks.get(file_path)
+            if lock is None:
+                lock = self._path_locks[file_path] = Lock()
+            return lock
+
+    def remove_expired(self) -> int:
+        """Remove the files whose removal is due
+
+        Returns:
+            :obj:`int`: Number of removed files
+        """
+        due = self.expiry_index.due(limit=self.removal_batch_size)
+        if not due:
+            return 0
+
+        # Every other holder takes only one of these locks at a time, so taking many here cannot deadlock
+        locks = [self.path_lock(file_path) for file_path in due]
+        for lock in locks:
+            lock.acquire()
+        try:
+            # A file may have been uploaded again since it was found to be due
+            due = [file_path for file_path in due if self.expiry_index.is_due(file_path)]
+            removed = self.remove_many(due) if due else []
+            for file_path in removed:
+                self.expiry_index.discard(file_path)
+        finally:
+            for lock in locks:
+                lock.release()
+        return len(removed)
+
+    def start_removal_sweeper(self, job_queue):
+        """Start removing due files regularly, the first run is immediately to catch up on overdue files
+
+        Args:
+            job_queue (:obj:`telegram.ext.jobqueue.JobQueue`): The job queue to run the sweeper in
+        """
+        job_queue.run_repeating(
+            callback=lambda bot, job: self.remove_expired(),
+            interval=self.removal_sweep_interval,
+            first=0,
+            name='Remove expired uploads')
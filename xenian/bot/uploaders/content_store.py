@@ -0,0 +1,267 @@
+import hashlib
+import os
+import posixpath
+import time
+from collections import OrderedDict
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+
+from xenian.bot.settings import UPLOADER
+from xenian.bot.utils.data import data
+from xenian.bot.utils.stats import stats_registry
+from .base import UploaderBase
+
+__all__ = ['ContentStore', 'get_url']
+
+
+def get_url(filename: str) -> str:
+    """Get the public url of an uploaded file
+
+    Uploaders which put all files under a ``prefix``, like the S3 uploader, get the prefix in their url as well.
+
+    Args:
+        filename (:obj:`str`): Filename on the server
+
+    Returns:
+        :obj:`str`: Url of the file, or its local path if no url is configured
+    """
+    path = UPLOADER.get('url', None) or UPLOADER['configuration'].get('path', None) or ''
+    prefix = UPLOADER['configuration'].get('prefix', None)
+    if prefix:
+        filename = posixpath.join(prefix, filename)
+    return os.path.join(path, filename)
+
+
+class ContentStore:
+    """Upload every content only once, under the hash of its content
+
+    Files are saved as their SHA-256 digest plus extension. Uploading the same content again returns the url of the
+    existing file without transferring anything. Every upload of a file counts as a reference to it. A file is removed
+    when its last reference expired, which is when the longest ``remove_after`` of all its uploads passed. A single
+    upload without ``remove_after`` keeps the file forever.
+
+    Examples:
+        >>> content_store.store('/tmp/image.png', remove_after=3600)
+        >>> # 'https://example.com/files/5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6ef.png'
+
+    Attributes:
+        uploader (:obj:`xenian.bot.uploaders.base.UploaderBase`): The uploader used for new files
+        data_set_name (:obj:`str`): Name of the dataset the known files are saved in
+        chunk_size (:obj:`int`): Number of bytes read at once while hashing
+        spool_size (:obj:`int`): Number of bytes of content which can only be read once that are kept in memory
+        prune_interval (:obj:`int`): Seconds between two removals of expired files from the dataset
+
+    Args:
+        uploader (:obj:`xenian.bot.uploaders.base.UploaderBase`): The uploader used for new files
+    """
+
+    data_set_name = 'content_store'
+    chunk_size = 1024 * 1024
+    spool_size = 16 * 1024 * 1024
+    prune_interval = 60 * 60
+
+    def __init__(self, uploader: UploaderBase):
+        self.uploader = uploader
+        self.namespace = type(uploader).__name__
+
+        self._lock = Lock()
+        self._stats = OrderedDict([
+            ('uploaded', 0),
+            ('deduplicated', 0),
+            ('bytes_uploaded', 0),
+            ('bytes_saved', 0),
+        ])
+
+        stats_registry.register('Content store', self.stats)
+
+    def stats(self) -> OrderedDict:
+        """Get statistics about uploaded and deduplicated files
+
+        Returns:
+            :obj:`collections.OrderedDict`: Counts of uploaded and deduplicated files and bytes
+        """
+        return OrderedDict(self._stats)
+
+    def digest(self, file) -> tuple:
+        """Hash the content of a file
+
+        Content which cannot be read twice, like an iterable of :obj:`bytes`, is spooled while hashing, into memory
+        up to :attr:`spool_size` and into a temp file beyond that.
+
+        Args:
+            file: Path to a file, file like object, :obj:`bytes` like object or an iterable of :obj:`bytes`
+
+        Returns:
+            :obj:`tuple`: The hex digest, the size of the content in bytes and the content to upload, which is the path
+                or a rewound stream
+        """
+        hash_ = hashlib.sha256()
+        size = 0
+        if isinstance(file, str):
+            with open(file, 'rb') as file_:
+                for chunk in iter(lambda: file_.read(self.chunk_size), b''):
+                    hash_.update(chunk)
+                    size += len(chunk)
+            return hash_.hexdigest(), size, file
+
+        stream = UploaderBase.to_stream(file)
+        seekable = stream.seekable() if hasattr(stream, 'seekable') else True
+        spool = None if seekable else SpooledTemporaryFile(max_size=self.spool_size)
+        for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+            hash_.update(chunk)
+            size += len(chunk)
+            if spool is not None:
+                spool.write(chunk)
+
+        source = spool if spool is not None else stream
+        source.seek(0)
+        return hash_.hexdigest(), size, source
+
+    def get_filename(self, digest: str, extension: str = '') -> str:
+        """Get the filename content with the given digest is saved as
+
+        Args:
+            digest (:obj:`str`): Hex digest of the content
+            extension (:obj:`str`, optional): Extension of the file including the dot
+
+        Returns:
+            :obj:`str`: The filename
+        """
+        return digest + extension.lower()
+
+    def _name_lock(self, filename: str) -> Lock:
+        """Get a lock which is held while a file is checked and uploaded
+
+        This is the :meth:`xenian.bot.uploaders.base.UploaderBase.path_lock` of the file, so the removal sweeper of the
+        uploader cannot remove a file while it is uploaded again.
+
+        Args:
+            filename (:obj:`str`): Filename on the server
+
+        Returns:
+            :obj:`threading.Lock`: The lock for this file
+        """
+        return self.uploader.path_lock(self.uploader.get_upload_path(filename))
+
+    def prepare(self, file, extension: str = None) -> tuple:
+        """Hash a file and get the name it is saved as, without uploading it
+
+        The url of the file is known from here on with :func:`get_url`, so it can be used while the file is uploaded
+        with :meth:`store_prepared`.
+
+        Args:
+            file: Path to a file, file like object, :obj:`bytes` like object or an iterable of :obj:`bytes`
+            extension (:obj:`str`, optional): Extension of the file including the dot, defaults to the extension of the
+                file path or the name of the file like object
+
+        Returns:
+            :obj:`tuple`: The filename, the size of the content in bytes and the content to upload
+        """
+        if extension is None:
+            extension = os.path.splitext(file if isinstance(file, str) else getattr(file, 'name', None) or '')[1]
+        digest, size, source = self.digest(file)
+        return self.get_filename(digest, extension), size, source
+
+    def store(self, file, extension: str = None, remove_after: int = None) -> str:
+        """Upload a file unless the same content has been uploaded before
+
+        Args:
+            file: Path to a file, file like object, :obj:`bytes` like object or an iterable of :obj:`bytes`
+            extension (:obj:`str`, optional): Extension of the file including the dot, defaults to the extension of the
+                file path or the name of the file like object
+            remove_after (:obj:`int`, optional): After how much time in sec this reference expires. Defaults to None
+                (keep the file forever)
+
+        Returns:
+            :obj:`str`: Url of the file
+        """
+        return self.store_prepared(*self.prepare(file, extension), remove_after=remove_after)
+
+    def store_prepared(self, filename: str, size: int, source, remove_after: int = None) -> str:
+        """Upload a file prepared with :meth:`prepare` unless the same content has been uploaded before
+
+        Args:
+            filename (:obj:`str`): Filename on the server
+            size (:obj:`int`): Size of the content in bytes
+            source: The content to upload
+            remove_after (:obj:`int`, optional): After how much time in sec this reference expires. Defaults to None
+                (keep the file forever)
+
+        Returns:
+            :obj:`str`: Url of the file
+        """
+        path = [self.namespace, filename]
+
+        with self._name_lock(filename):
+            entry = data.get_key(self.data_set_name, path)
+            now = time.time()
+            # A file which is about to be removed by the sweeper is uploaded again
+            is_alive = entry is not None and (entry['expires'] is None or
+                                              entry['expires'] > now + self.uploader.removal_sweep_interval)
+
+            upload_path = self.uploader.get_upload_path(filename)
+            if is_alive:
+                expires = None if entry['expires'] is None or not remove_after else \
+                    max(entry['expires'], now + remove_after)
+                refs = entry['refs'] + 1
+                if expires is None and entry['expires'] is not None:
+                    self.uploader.cancel_removal(upload_path)
+                elif expires is not None and expires != entry['expires']:
+                    self.uploader.schedule_removal(upload_path, expires - now)
+                self._count('deduplicated', size)
+            else:
+                expires = now + remove_after if remove_after else None
+                refs = 1
+                self.uploader.upload(source, filename, remove_after=remove_after)
+                if expires is None and entry is not None:
+                    self.uploader.cancel_removal(upload_path)
+                self._count('uploaded', size)
+
+            data.set_key(self.data_set_name, path, {'refs': refs, 'expires': expires})
+
+        return get_url(filename)
+
+    def _count(self, kind: str, size: int):
+        """Count an uploaded or deduplicated file
+
+        Args:
+            kind (:obj:`str`): Either uploaded or deduplicated
+            size (:obj:`int`): Size of the file in bytes
+        """
+        with self._lock:
+            self._stats[kind] += 1
+            self._stats['bytes_uploaded' if kind == 'uploaded' else 'bytes_saved'] += size
+
+    def prune(self) -> int:
+        """Forget files whose last reference expired, they have been removed by the uploader by now
+
+        Returns:
+            :obj:`int`: Number of forgotten files
+        """
+        now = time.time()
+        expired = [
+            filename
+            for filename, entry in data.get_key(self.data_set_name, self.namespace, {}).items()
+            if entry['expires'] is not None and entry['expires'] < now
+        ]
+
+        pruned = 0
+        for filename in expired:
+            with self._name_lock(filename):
+                entry = data.get_key(self.data_set_name, [self.namespace, filename])
+                if entry and entry['expires'] is not None and entry['expires'] < now:
+                    data.delete_key(self.data_set_name, [self.namespace, filename])
+                    pruned += 1
+        return pruned
+
+    def start_pruning(self, job_queue):
+        """Start forgetting expired files regularly
+
+        Args:
+            job_queue (:obj:`telegram.ext.jobqueue.JobQueue`): The job queue to run the pruning in
+        """
+        job_queue.run_repeating(
+            callback=lambda bot, job: self.prune(),
+            interval=self.prune_interval,
+            first=self.prune_interval,
+            name='Forget expired content')
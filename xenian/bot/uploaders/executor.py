@@ -0,0 +1,150 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Callable
+
+from xenian.bot.utils.stats import stats_registry
+from .content_store import ContentStore, get_url
+
+__all__ = ['UploadExecutor']
+
+
+class UploadExecutor:
+    """Run uploads in background threads and return futures
+
+    At most ``max_concurrent_uploads`` of the uploader run at the same time, so a backend is never given more parallel
+    uploads than it can handle, e.g. more than the SSH connection pool holds. At most :attr:`max_queue` more uploads
+    wait for a free slot, submitting further uploads blocks until one finished.
+
+    Examples:
+        >>> url, future = upload_executor.store('/tmp/image.png', remove_after=3600)
+        >>> links = build_links(url)  # Runs while the image is uploaded
+        >>> future.result()  # The url is valid from here on
+
+    Attributes:
+        content_store (:obj:`xenian.bot.uploaders.content_store.ContentStore`): Store used to upload files
+        max_workers (:obj:`int`): Number of uploads running at the same time
+        max_queue (:obj:`int`): Number of uploads which can wait for a free slot
+
+    Args:
+        content_store (:obj:`xenian.bot.uploaders.content_store.ContentStore`): Store used to upload files
+        max_queue (:obj:`int`, optional): Number of uploads which can wait for a free slot
+    """
+
+    def __init__(self, content_store: ContentStore, max_queue: int = 100):
+        self.content_store = content_store
+        self.max_workers = content_store.uploader.max_concurrent_uploads
+        self.max_queue = max_queue
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='upload')
+        self._slots = BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = Lock()
+        self._stats = OrderedDict([
+            ('queued', 0),
+            ('running', 0),
+            ('completed', 0),
+            ('failed', 0),
+            ('blocked_submits', 0),
+            ('max_queue_depth', 0),
+            ('avg_wait_ms', 0),
+        ])
+        self._total_wait = 0
+
+        stats_registry.register('Upload executor', self.stats)
+
+    def stats(self) -> OrderedDict:
+        """Get statistics about the queue and the running uploads
+
+        Returns:
+            :obj:`collections.OrderedDict`: Queued, running, completed, failed uploads and the wait times
+        """
+        with self._lock:
+            stats = OrderedDict(self._stats)
+        stats['max_workers'] = self.max_workers
+        stats['max_queue'] = self.max_queue
+        return stats
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """Run a function in the upload threads
+
+        Blocks if :attr:`max_queue` uploads are already waiting.
+
+        Args:
+            function (:obj:`typing.Callable`): The function to run
+            *args (:obj:`list`): Arguments for the function
+            **kwargs (:obj:`dict`): Keyword arguments for the function
+
+        Returns:
+            :obj:`concurrent.futures.Future`: Future of the return value of the function
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['blocked_submits'] += 1
+            self._slots.acquire()
+
+        submitted = time.time()
+        with self._lock:
+            self._stats['queued'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._stats['queued'])
+
+        def run():
+            with self._lock:
+                self._stats['queued'] -= 1
+                self._stats['running'] += 1
+                self._total_wait += time.time() - submitted
+                started = self._stats['completed'] + self._stats['failed'] + self._stats['running']
+                self._stats['avg_wait_ms'] = round(self._total_wait / started * 1000, 2)
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self._stats['failed'] += 1
+                raise
+            else:
+                with self._lock:
+                    self._stats['completed'] += 1
+                return result
+            finally:
+                with self._lock:
+                    self._stats['running'] -= 1
+
+        def release(future: Future):
+            # Also called for uploads which were cancelled before they ran
+            if future.cancelled():
+                with self._lock:
+                    self._stats['queued'] -= 1
+            self._slots.release()
+
+        future = self._executor.submit(run)
+        future.add_done_callback(release)
+        return future
+
+    def store(self, file, extension: str = None, remove_after: int = None) -> tuple:
+        """Upload a file with the :class:`ContentStore` in the background
+
+        The file is hashed right away, so its url is known before it is uploaded. A file like object must stay open
+        until the future is done.
+
+        Args:
+            file: Path to a file, file like object, :obj:`bytes` like object or an iterable of :obj:`bytes`
+            extension (:obj:`str`, optional): Extension of the file including the dot, defaults to the extension of the
+                file path or the name of the file like object
+            remove_after (:obj:`int`, optional): After how much time in sec this reference expires. Defaults to None
+                (keep the file forever)
+
+        Returns:
+            :obj:`tuple`: The url the file will have and a :obj:`concurrent.futures.Future` which is done when the
+                file has been uploaded
+        """
+        filename, size, source = self.content_store.prepare(file, extension)
+        future = self.submit(self.content_store.store_prepared, filename, size, source, remove_after=remove_after)
+        return get_url(filename), future
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting uploads
+
+        Args:
+            wait (:obj:`bool`, optional): Wait until all submitted uploads are done
+        """
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,81 @@
+import time
+
+from xenian.bot.utils.data import data
+
+__all__ = ['ExpiryIndex']
+
+
+class ExpiryIndex:
+    """Persistent index of uploaded files and when they have to be removed
+
+    The index is saved in the :obj:`xenian.bot.utils.data.data` store, so scheduled removals survive restarts and
+    crashes, unlike jobs in the job queue.
+
+    Examples:
+        >>> index = ExpiryIndex('SSHUploader')
+        >>> index.add('/var/www/files/image.png', 3600)
+        >>> index.due()
+        >>> # [] or ['/var/www/files/image.png'] after an hour
+
+    Attributes:
+        namespace (:obj:`str`): Name under which the paths are saved, usually the name of the uploader class
+        data_set_name (:obj:`str`): Name of the dataset in the data store
+
+    Args:
+        namespace (:obj:`str`): Name under which the paths are saved, usually the name of the uploader class
+    """
+
+    data_set_name = 'upload_expiry'
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    def add(self, path: str, remove_after: int or float):
+        """Schedule the removal of a file, an already scheduled removal is only ever postponed
+
+        Args:
+            path (:obj:`str`): Path of the file on the server
+            remove_after (:obj:`int` or :obj:`float`): After how much time to remove the file in sec
+        """
+        deadline = time.time() + remove_after
+        with data.lock(self.data_set_name):
+            current = data.get_key(self.data_set_name, [self.namespace, path])
+            if current is None or current < deadline:
+                data.set_key(self.data_set_name, [self.namespace, path], deadline)
+
+    def discard(self, path: str):
+        """Remove a file from the index
+
+        Args:
+            path (:obj:`str`): Path of the file on the server
+        """
+        data.delete_key(self.data_set_name, [self.namespace, path])
+
+    def due(self, limit: int = None) -> list:
+        """Get the files whose removal is due, overdue ones first
+
+        Args:
+            limit (:obj:`int`, optional): Return at most this many paths
+
+        Returns:
+            :obj:`list`: Paths of the files which should be removed
+        """
+        now = time.time()
+        deadlines = data.get_key(self.data_set_name, self.namespace, {})
+        due = sorted((deadline, path) for path, deadline in deadlines.items() if deadline <= now)
+        return [path for deadline, path in due[:limit]]
+
+    def is_due(self, path: str) -> bool:
+        """Check if the removal of a file is due
+
+        Args:
+            path (:obj:`str`): Path of the file on the server
+
+        Returns:
+            :obj:`bool`: True if the file is in the index and its deadline passed
+        """
+        deadline = data.get_key(self.data_set_name, [self.namespace, path])
+        return deadline is not None and deadline <= time.time()
+
+    def __len__(self) -> int:
+        return len(data.get_key(self.data_set_name, self.namespace, {}))
@@ -1,44 +1,47 @@
+import errno
 import os
-import subprocess
-import warnings
+import shutil
+import stat
+from uuid import uuid4
 
-import xenian.bot
-from xenian.bot.utils.temp_file import CustomNamedTemporaryFile
 from .base import UploaderBase
 
 
 class FileSystemUploader(UploaderBase):
     """Save files on file system
+
+    Files are placed without spawning any processes. A file path is hard linked if the target is on the same file
+    system, otherwise it is copied in the kernel with ``copy_file_range`` or ``sendfile``. File like objects,
+    :obj:`bytes` and iterables of :obj:`bytes` are streamed to the target in chunks. Every file is first written under
+    a temporary name and then renamed, so nobody ever sees a half written file.
+
+    A hard linked file shares its content with the original, so a file path given to :meth:`upload` must not be
+    changed in place afterwards. Deleting or replacing it is fine.
     """
 
     _mandatory_configuration = {'path': str}
 
+    chunk_size = 1024 * 1024
+    file_mode = 0o644
+
     def upload(self, file, filename: str = None, save_path: str = None, remove_after: int = None):
         """Upload file to the ssh server
 
         Args:
-            file: Path to file on file system or file like object. If a file path is given the file is copied to the new
-                place not moved.
-            filename (:obj:`str`, optional): New filename, must be set if file is a file like object
+            file: Path to file on file system, file like object, :obj:`bytes` like object or iterable of :obj:`bytes`.
+                If a file path is given the file is copied to the new place not moved.
+            filename (:obj:`str`, optional): New filename, must be set if file is not a path
             save_path (:obj:`str`, optional): Directory where to save the file. Joins with the configurations path.
                 Creates directory if it does not exist yet.
             remove_after (:obj:`int`, optional): After how much time to remove the file in sec.
                 Defaults to None (do not remove)
         """
-        is_file_object = bool(getattr(file, 'read', False))
+        is_file_object = not isinstance(file, str)
         if is_file_object:
             if filename is None:
-                raise ValueError('filename must be set when file is a file like object')
-            with CustomNamedTemporaryFile(delete=False) as new_file:
-                file.seek(0)
-                new_file.write(file.read())
-                new_file.save()
-
-                real_file = new_file.name
-                filename = filename
+                raise ValueError('filename must be set when file is not a path')
         else:
-            real_file = file
-            filename = filename or os.path.basename(real_file)
+            filename = filename or os.path.basename(file)
 
         save_dir = os.path.join(self.configuration['path'], save_path) if save_path else \
             self.configuration['path']
@@ -46,28 +49,104 @@ class FileSystemUploader(UploaderBase):
         os.makedirs(save_dir, exist_ok=True)
 
         save_path = os.path.realpath(save_path)
-        real_file = os.path.realpath(real_file)
-        if os.name == 'nt':
-            copy_outcome = subprocess.call(['copy', real_file, save_path], shell=True)
-            chmod_outcome = 0
-        else:
-            copy_outcome = subprocess.call(['cp', real_file, save_path])
-            chmod_outcome = subprocess.call(['chmod', '644', save_path])
+        if os.path.isdir(save_path):
+            save_path = os.path.join(save_path, os.path.basename(file) if not is_file_object else filename)
+
+        temp_path = os.path.join(os.path.dirname(save_path), f'.{os.path.basename(save_path)}.{uuid4().hex}')
+        try:
+            if is_file_object:
+                self._write_file_object(self.to_stream(file), temp_path)
+            else:
+                self._place_file(os.path.realpath(file), temp_path)
+            os.replace(temp_path, save_path)
+        except BaseException:
+            if os.path.lexists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        if remove_after:
+            self.schedule_removal(save_path, remove_after)
 
-        if copy_outcome != 0:
-            raise IOError(f'Copying file from {real_file} to {save_path} did not work.')
+    def _write_file_object(self, file, target: str):
+        """Stream a file like object into a new file
 
-        if chmod_outcome != 0:
-            warnings.warn(f'Could not set permissions for "{save_path}".')
+        Args:
+            file: Readable file like object
+            target (:obj:`str`): Path of the new file
+        """
+        with open(target, 'wb') as target_file:
+            shutil.copyfileobj(file, target_file, self.chunk_size)
+        os.chmod(target, self.file_mode)
 
-        if remove_after:
-            xenian.bot.job_queue.run_once(
-                callback=lambda bot, job: self.remove(save_path, True),
-                when=remove_after,
-                name='Remove file locally: {}'.format(save_path))
+    def _place_file(self, source: str, target: str):
+        """Hard link a file if possible, copy it otherwise
 
-        if is_file_object:
-            os.unlink(real_file)
+        Only files which already have :attr:`file_mode` are hard linked, others are copied and the copy gets the mode.
+
+        Args:
+            source (:obj:`str`): Path of the existing file
+            target (:obj:`str`): Path of the new file
+        """
+        # A hard link shares the mode with the source, changing it would change the source as well
+        if stat.S_IMODE(os.stat(source).st_mode) == self.file_mode:
+            try:
+                os.link(source, target)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.ENOTSUP):
+                    raise
+
+        with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+            self._copy_data(source_file, target_file)
+        os.chmod(target, self.file_mode)
+
+    def _copy_data(self, source_file, target_file):
+        """Copy the content of one file to another, inside the kernel if the platform supports it
+
+        Args:
+            source_file: File opened for binary reading
+            target_file: File opened for binary writing
+        """
+        source_fd = source_file.fileno()
+        target_fd = target_file.fileno()
+        size = os.fstat(source_fd).st_size
+
+        for method_name in ('copy_file_range', 'sendfile'):
+            method = getattr(os, method_name, None)
+            if method is None:
+                continue
+            try:
+                offset = 0
+                while offset < size:
+                    if method_name == 'copy_file_range':
+                        copied = method(source_fd, target_fd, size - offset)
+                    else:
+                        copied = method(target_fd, source_fd, offset, size - offset)
+                    if not copied:
+                        break
+                    offset += copied
+                if offset >= size:
+                    return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP, errno.EBADF):
+                    raise
+            # Start over with the next method, the target file may already contain parts of the data
+            os.lseek(source_fd, 0, os.SEEK_SET)
+            os.lseek(target_fd, 0, os.SEEK_SET)
+            os.ftruncate(target_fd, 0)
+
+        shutil.copyfileobj(source_file, target_file, self.chunk_size)
+
+    def get_upload_path(self, filename: str) -> str:
+        """Get the path a file is saved to, if no sub directory is given
+
+        Args:
+            filename (:obj:`str`): Filename
+
+        Returns:
+            :obj:`str`: Path of the file
+        """
+        return os.path.realpath(os.path.join(self.configuration['path'], filename))
 
     def remove(self, file_path: str, self_connect: bool):
         """Remove a file from the server
@@ -0,0 +1,283 @@
+import math
+import mimetypes
+import os
+import posixpath
+from threading import Lock
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from .base import UploaderBase
+
+MB = 1024 * 1024
+
+
+class S3Uploader(UploaderBase):
+    """Upload files to an object store speaking the S3 API, like AWS S3 or locally MinIO https://min.io/
+
+    Files above ``multipart_threshold`` are uploaded in parts of ``multipart_chunksize``, ``max_part_concurrency``
+    parts at the same time.
+
+    Files are not removed by timers. Instead the bucket gets a lifecycle rule for every value in ``expiry_days`` which
+    expires objects tagged with this value. An uploaded file is tagged with the smallest value covering its
+    ``remove_after``, so the object store removes it by itself. Lifecycle rules work in days, so files live at least a
+    day. Files with a ``remove_after`` longer than the longest rule are kept.
+
+    Attributes:
+        configuration (:obj:`dict`): Configuration of this uploader
+        client (:obj:`botocore.client.S3`): Client for the object store, created on :meth:`connect`
+        transfer_config (:obj:`boto3.s3.transfer.TransferConfig`): Multipart settings
+        expiry_days (:obj:`tuple`): Available lifetimes in days
+    Args:
+        configuration (:obj:`dict`): Configuration of this uploader. Must contain these keys: bucket, access_key,
+            secret_key. Can contain endpoint_url, region, prefix, acl, create_bucket, multipart_threshold,
+            multipart_chunksize, max_part_concurrency and expiry_days.
+        connect (:obj:`bool`, optional): If the uploader should directly connect to the server
+    """
+
+    _mandatory_configuration = {'bucket': str, 'access_key': str, 'secret_key': str}
+
+    expiry_tag = 'xenian-expire-days'
+    expiry_rule_prefix = 'xenian-expire-'
+
+    def __init__(self, configuration: dict, connect: bool = False):
+        self.client = None
+        self.transfer_config = TransferConfig(
+            multipart_threshold=configuration.get('multipart_threshold', 8 * MB),
+            multipart_chunksize=configuration.get('multipart_chunksize', 8 * MB),
+            max_concurrency=configuration.get('max_part_concurrency', 10),
+            use_threads=True,
+        )
+        self.expiry_days = tuple(sorted(configuration.get('expiry_days', (1, 7, 30, 365))))
+        self._lock = Lock()
+
+        super().__init__(configuration, connect)
+
+    @property
+    def bucket(self) -> str:
+        return self.configuration['bucket']
+
+    def connect(self):
+        """Create the client and prepare the bucket and its lifecycle rules, this is only done once
+        """
+        with self._lock:
+            if self.client is not None:
+                return
+
+            client = boto3.client(
+                's3',
+                endpoint_url=self.configuration.get('endpoint_url', None),
+                region_name=self.configuration.get('region', None),
+                aws_access_key_id=self.configuration['access_key'],
+                aws_secret_access_key=self.configuration['secret_key'],
+            )
+            self._ensure_bucket(client)
+            self._ensure_lifecycle(client)
+            self.client = client
+
+    def close(self):
+        """Only here for compatibility, the client is thread safe and kept
+        """
+        pass
+
+    def _get_client(self):
+        """Get the client, connect if not done yet
+
+        Returns:
+            :obj:`botocore.client.S3`: Client for the object store
+        """
+        if self.client is None:
+            self.connect()
+        return self.client
+
+    def _ensure_bucket(self, client):
+        """Create the bucket if it does not exist and ``create_bucket`` is not disabled
+
+        Args:
+            client (:obj:`botocore.client.S3`): Client for the object store
+        """
+        try:
+            client.head_bucket(Bucket=self.bucket)
+            return
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchBucket'):
+                raise
+        if not self.configuration.get('create_bucket', True):
+            raise KeyError(f'Bucket {self.bucket} does not exist')
+
+        region = self.configuration.get('region', None)
+        if region and region != 'us-east-1':
+            client.create_bucket(Bucket=self.bucket, CreateBucketConfiguration={'LocationConstraint': region})
+        else:
+            client.create_bucket(Bucket=self.bucket)
+
+    def _ensure_lifecycle(self, client):
+        """Add the expiry rules to the lifecycle configuration of the bucket, other rules are kept
+
+        Args:
+            client (:obj:`botocore.client.S3`): Client for the object store
+        """
+        try:
+            rules = client.get_bucket_lifecycle_configuration(Bucket=self.bucket)['Rules']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchLifecycleConfiguration':
+                raise
+            rules = []
+
+        rules = [rule for rule in rules if not rule.get('ID', '').startswith(self.expiry_rule_prefix)]
+        rules.extend({
+            'ID': f'{self.expiry_rule_prefix}{days}d',
+            'Filter': {'Tag': {'Key': self.expiry_tag, 'Value': str(days)}},
+            'Status': 'Enabled',
+            'Expiration': {'Days': days},
+        } for days in self.expiry_days)
+        client.put_bucket_lifecycle_configuration(Bucket=self.bucket, LifecycleConfiguration={'Rules': rules})
+
+    def _get_expiry_days(self, remove_after: int) -> int or None:
+        """Get the lifetime rule for a file
+
+        Args:
+            remove_after (:obj:`int`): After how much time to remove the file in sec
+
+        Returns:
+            :obj:`int`: Lifetime in days or :obj:`None` if no rule is long enough
+        """
+        days = max(1, math.ceil(remove_after / (24 * 60 * 60)))
+        return next((rule_days for rule_days in self.expiry_days if rule_days >= days), None)
+
+    def _tag_for_removal(self, key: str, remove_after: int):
+        """Tag an object so it expires by the lifecycle rules
+
+        Args:
+            key (:obj:`str`): Key of the object
+            remove_after (:obj:`int`): After how much time to remove the file in sec
+        """
+        days = self._get_expiry_days(remove_after)
+        if days is None:
+            self.logger.warning(f'No lifecycle rule is long enough to remove {key} after {remove_after}s, keeping it')
+            return
+        self._get_client().put_object_tagging(
+            Bucket=self.bucket, Key=key, Tagging={'TagSet': [{'Key': self.expiry_tag, 'Value': str(days)}]})
+
+    def get_upload_path(self, filename: str) -> str:
+        """Get the key an object is uploaded to, if no sub directory is given
+
+        Args:
+            filename (:obj:`str`): Filename on the server
+
+        Returns:
+            :obj:`str`: Key of the object
+        """
+        prefix = self.configuration.get('prefix', '')
+        return posixpath.join(prefix, filename) if prefix else filename
+
+    def upload(self, file, filename: str = None, upload_dir: str = None, remove_after: int = None):
+        """Upload file to the object store
+
+        Args:
+            file: Path to file on file system, file like object, :obj:`bytes` like object or iterable of :obj:`bytes`.
+            filename (:obj:`str`, optional): Filename on the server. This is mandatory if your file is not a path.
+            upload_dir (:obj:`str`, optional): Directory in the bucket. Joins with the configurations prefix
+            remove_after (:obj:`int`, optional): After how much time to remove the file in sec, see the class
+                description. Defaults to None (do not remove)
+        """
+        is_path = isinstance(file, str)
+        if not is_path and filename is None:
+            raise ValueError('filename must be set when file is not a path')
+        filename = filename or os.path.basename(file)
+
+        key = self.get_upload_path(posixpath.join(upload_dir, filename) if upload_dir else filename)
+        extra_args = {'ContentType': mimetypes.guess_type(filename)[0] or 'application/octet-stream'}
+        if self.configuration.get('acl', None):
+            extra_args['ACL'] = self.configuration['acl']
+
+        client = self._get_client()
+        if is_path:
+            client.upload_file(file, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+        else:
+            client.upload_fileobj(self.to_stream(file), self.bucket, key, ExtraArgs=extra_args,
+                                  Config=self.transfer_config)
+
+        if remove_after:
+            self._tag_for_removal(key, remove_after)
+
+    def schedule_removal(self, file_path: str, remove_after: int):
+        """Let an existing object expire after the given time
+
+        Lifecycle rules count from the creation of an object, so the object is copied onto itself inside the object
+        store to restart its lifetime. The copy keeps the content type, metadata and the configured ACL of the object.
+
+        Args:
+            file_path (:obj:`str`): Key of the object
+            remove_after (:obj:`int`): After how much time to remove the file in sec
+        """
+        days = self._get_expiry_days(remove_after)
+        client = self._get_client()
+        head = client.head_object(Bucket=self.bucket, Key=file_path)
+        extra_args = {
+            header: head[header]
+            for header in ('CacheControl', 'ContentDisposition', 'ContentEncoding', 'ContentLanguage')
+            if head.get(header)
+        }
+        # Without an ACL the copy would be private again
+        if self.configuration.get('acl', None):
+            extra_args['ACL'] = self.configuration['acl']
+        client.copy_object(
+            Bucket=self.bucket,
+            Key=file_path,
+            CopySource={'Bucket': self.bucket, 'Key': file_path},
+            ContentType=head.get('ContentType', 'application/octet-stream'),
+            Metadata=head.get('Metadata', {}),
+            MetadataDirective='REPLACE',
+            TaggingDirective='REPLACE',
+            Tagging=f'{self.expiry_tag}={days}' if days else '',
+            **extra_args
+        )
+
+    def cancel_removal(self, file_path: str):
+        """Keep an object by removing its expiry tag
+
+        Args:
+            file_path (:obj:`str`): Key of the object
+        """
+        self._get_client().delete_object_tagging(Bucket=self.bucket, Key=file_path)
+
+    def start_removal_sweeper(self, job_queue):
+        """Nothing to do, the lifecycle rules of the bucket remove the files
+
+        Args:
+            job_queue (:obj:`telegram.ext.jobqueue.JobQueue`): Unused
+        """
+        pass
+
+    def remove(self, file_path: str, self_connect: bool = True):
+        """Remove an object
+
+        Args:
+            file_path (:obj:`str`): Key of the object
+            self_connect (:obj:`bool`, optional): Only here for compatibility
+        """
+        self._get_client().delete_object(Bucket=self.bucket, Key=file_path)
+
+    def remove_many(self, file_paths: list) -> list:
+        """Remove multiple objects with as few requests as possible
+
+        Args:
+            file_paths (:obj:`list`): Keys of the objects
+
+        Returns:
+            :obj:`list`: The keys which were removed
+        """
+        removed = []
+        client = self._get_client()
+        for start in range(0, len(file_paths), 1000):
+            keys = file_paths[start:start + 1000]
+            response = client.delete_objects(
+                Bucket=self.bucket, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+            failed = set()
+            for error in response.get('Errors', []):
+                self.logger.warning(f'Could not remove {error["Key"]}: {error.get("Message")}')
+                failed.add(error['Key'])
+            removed.extend(key for key in keys if key not in failed)
+        return removed
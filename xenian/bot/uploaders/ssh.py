@@ -1,109 +1,323 @@
+import atexit
 import os
-from tempfile import NamedTemporaryFile
+import socket
+from collections import OrderedDict
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from threading import Lock
 
 import paramiko
 
-import xenian.bot
+from xenian.bot.utils.stats import stats_registry
 from .base import UploaderBase
 
 
 class SSHUploader(UploaderBase):
     """Upload files to an ssh server via paramiko http://www.paramiko.org/
 
+    Connections are kept in a pool and shared by all threads. Every upload or removal borrows an authenticated SFTP
+    connection from the pool and returns it afterwards, so the SSH handshake is only done when the pool grows or a
+    connection broke.
+
     Attributes:
         configuration (:obj:`dict`): Configuration of this uploader
-        ssh (:obj:`paramiko.client.SSHClient`): Connection to the ssh server
-        sftp (:obj:`paramiko.sftp_client.SFTPClient`): Connection via sftp to the ssh server
+        pool_size (:obj:`int`): Maximum number of open connections, configurable with the key pool_size
+        keepalive (:obj:`int`): Interval in sec in which keepalive packets are sent, configurable with the key
+            keepalive
+        pool_timeout (:obj:`int`): How long to wait in sec for a free connection if the pool is exhausted
     Args:
         configuration (:obj:`dict`): Configuration of this uploader. Must contain these key: host, user, password,
-            key_filename, upload_dir, ssh_authentication
+            key_filename, upload_dir, ssh_authentication. Can contain pool_size and keepalive.
         connect (:obj:`bool`, optional): If the uploader should directly connect to the server
     """
 
     _mandatory_configuration = {'host': str, 'user': str, 'password': str, 'upload_dir': str}
 
+    connection_errors = (paramiko.SSHException, EOFError, ConnectionError, socket.timeout)
+    """(:obj:`tuple`): Errors which may mean that the connection broke"""
+
     def __init__(self, configuration: dict, connect: bool = False):
-        self.ssh = None
-        self.sftp = None
+        self.pool_size = configuration.get('pool_size', 4)
+        self.keepalive = configuration.get('keepalive', 30)
+        self.pool_timeout = 60
+
+        self._pool = LifoQueue()
+        self._lock = Lock()
+        self._stats = OrderedDict([
+            ('open', 0),
+            ('created', 0),
+            ('reconnects', 0),
+            ('borrowed', 0),
+            ('waited', 0),
+        ])
 
         super().__init__(configuration, connect)
+        # More parallel uploads than connections would only wait for the pool
+        self.max_concurrent_uploads = configuration.get('max_concurrent_uploads', self.pool_size)
+
+        stats_registry.register('SSH connection pool', self.stats)
+        atexit.register(self.shutdown)
 
     def connect(self):
-        """Connect to the server defined in the configuration
+        """Make sure there is at least one open connection in the pool
+
+        This is not needed before uploading, connections are opened on demand.
+        """
+        with self.connection():
+            pass
+
+    def close(self):
+        """Only here for compatibility, the connections stay open in the pool. Use :meth:`shutdown` to close them.
+        """
+        pass
+
+    def shutdown(self):
+        """Close all idle connections in the pool
+        """
+        while True:
+            try:
+                ssh, sftp = self._pool.get_nowait()
+            except Empty:
+                break
+            self._discard(ssh, sftp)
+
+    def stats(self) -> OrderedDict:
+        """Get statistics about the connection pool
+
+        Returns:
+            :obj:`collections.OrderedDict`: Open, idle, created, reconnected, borrowed and waited for connections
+        """
+        stats = OrderedDict(self._stats)
+        stats['idle'] = self._pool.qsize()
+        stats['pool_size'] = self.pool_size
+        return stats
+
+    def _open(self) -> tuple:
+        """Open a new connection
+
+        Returns:
+            :obj:`tuple`: The :obj:`paramiko.client.SSHClient` and its :obj:`paramiko.sftp_client.SFTPClient`
         """
-        self.ssh = paramiko.SSHClient()
-        self.ssh.load_host_keys(os.path.expanduser(os.path.join("~", ".ssh", "known_hosts")))
+        ssh = paramiko.SSHClient()
+        ssh.load_host_keys(os.path.expanduser(os.path.join("~", ".ssh", "known_hosts")))
 
         if self.configuration.get('key_filename', None):
-            self.ssh.connect(self.configuration['host'],
-                             username=self.configuration['user'],
-                             password=self.configuration['password'],
-                             key_filename=self.configuration['key_filename'])
+            ssh.connect(self.configuration['host'],
+                        username=self.configuration['user'],
+                        password=self.configuration['password'],
+                        key_filename=self.configuration['key_filename'])
         else:
-            self.ssh.connect(self.configuration['host'],
-                             username=self.configuration['user'],
-                             password=self.configuration['password'])
-        self.sftp = self.ssh.open_sftp()
+            ssh.connect(self.configuration['host'],
+                        username=self.configuration['user'],
+                        password=self.configuration['password'])
+        ssh.get_transport().set_keepalive(self.keepalive)
+        return ssh, ssh.open_sftp()
 
-    def close(self):
-        """Close connection to the server
+    def _discard(self, ssh: paramiko.SSHClient, sftp: paramiko.SFTPClient):
+        """Close a connection and remove it from the pool count
+
+        Args:
+            ssh (:obj:`paramiko.client.SSHClient`): Connection to the ssh server
+            sftp (:obj:`paramiko.sftp_client.SFTPClient`): Connection via sftp to the ssh server
+        """
+        with self._lock:
+            self._stats['open'] -= 1
+        try:
+            sftp.close()
+            ssh.close()
+        except self.connection_errors:
+            pass
+
+    @staticmethod
+    def _is_alive(ssh: paramiko.SSHClient) -> bool:
+        """Check if the transport of a connection is still active
+
+        Args:
+            ssh (:obj:`paramiko.client.SSHClient`): Connection to the ssh server
+
+        Returns:
+            :obj:`bool`: True if the connection can still be used
+        """
+        transport = ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _acquire(self) -> tuple:
+        """Borrow a healthy connection from the pool, open a new one if the pool is not full yet
+
+        Returns:
+            :obj:`tuple`: The :obj:`paramiko.client.SSHClient` and its :obj:`paramiko.sftp_client.SFTPClient`
+
+        Raises:
+            :obj:`TimeoutError`: If no connection got free within :attr:`pool_timeout`
+        """
+        while True:
+            try:
+                ssh, sftp = self._pool.get_nowait()
+            except Empty:
+                with self._lock:
+                    can_open = self._stats['open'] < self.pool_size
+                    if can_open:
+                        self._stats['open'] += 1
+                if can_open:
+                    try:
+                        connection = self._open()
+                    except Exception:
+                        with self._lock:
+                            self._stats['open'] -= 1
+                        raise
+                    with self._lock:
+                        self._stats['created'] += 1
+                    return connection
+
+                with self._lock:
+                    self._stats['waited'] += 1
+                try:
+                    ssh, sftp = self._pool.get(timeout=self.pool_timeout)
+                except Empty:
+                    raise TimeoutError('No SSH connection got free in time')
+
+            if self._is_alive(ssh):
+                return ssh, sftp
+            self._discard(ssh, sftp)
+            with self._lock:
+                self._stats['reconnects'] += 1
+
+    @contextmanager
+    def connection(self) -> paramiko.SFTPClient:
+        """Borrow an SFTP connection from the pool
+
+        If the connection broke while it was used, it is closed instead of returned to the pool.
+
+        Yields:
+            :obj:`paramiko.sftp_client.SFTPClient`: Connection via sftp to the ssh server
+        """
+        ssh, sftp = self._acquire()
+        with self._lock:
+            self._stats['borrowed'] += 1
+        try:
+            yield sftp
+        except BaseException:
+            if self._is_alive(ssh):
+                self._pool.put((ssh, sftp))
+            else:
+                self._discard(ssh, sftp)
+            raise
+        else:
+            self._pool.put((ssh, sftp))
+
+    def _run(self, method_name: str, *args):
+        """Run an sftp method on a pooled connection, retry once on a new connection if the connection broke
+
+        Args:
+            method_name (:obj:`str`): Name of the :obj:`paramiko.sftp_client.SFTPClient` method
+            *args (:obj:`list`): Arguments for the method
+
+        Returns:
+            :obj:`object`: Whatever the method returns
+        """
+        try:
+            with self.connection() as sftp:
+                return getattr(sftp, method_name)(*args)
+        except self.connection_errors:
+            with self._lock:
+                self._stats['reconnects'] += 1
+            with self.connection() as sftp:
+                return getattr(sftp, method_name)(*args)
+
+    def _put_stream(self, stream, upload_path: str):
+        """Stream a readable file like object to the server
+
+        If the connection breaks, the upload is retried once on a new connection, if the stream can be rewound.
+
+        Args:
+            stream: Readable file like object
+            upload_path (:obj:`str`): Path of the file on the server
         """
-        self.sftp.close()
-        self.ssh.close()
+        try:
+            with self.connection() as sftp:
+                sftp.putfo(stream, upload_path)
+        except self.connection_errors:
+            if not stream.seekable():
+                raise
+            stream.seek(0)
+            with self._lock:
+                self._stats['reconnects'] += 1
+            with self.connection() as sftp:
+                sftp.putfo(stream, upload_path)
 
     def upload(self, file, filename: str = None, upload_dir: str = None, remove_after: int = None):
         """Upload file to the ssh server
 
         Args:
-            file: Path to file on file system or a file like object
-            filename (:obj:`str`, optional): Filename on the server. This is mandatory if your file is a file like
-                object.
+            file: Path to file on file system, file like object, :obj:`bytes` like object or iterable of :obj:`bytes`.
+                Everything but a path is streamed to the server without a temp file.
+            filename (:obj:`str`, optional): Filename on the server. This is mandatory if your file is not a path.
             upload_dir (:obj:`str`, optional): Upload directory on server. Joins with the configurations upload_dir
             remove_after (:obj:`int`, optional): After how much time to remove the file in sec.
                 Defaults to None (do not remove)
         """
-        is_file_object = bool(getattr(file, 'read', False))
-        if is_file_object:
-            if filename is None:
-                raise ValueError('filename must be set when file is a file like object')
-            with NamedTemporaryFile(delete=False) as new_file:
-                file.seek(0)
-                new_file.write(file.read())
-
-                real_file = new_file.name
-                filename = filename
-        else:
-            real_file = file
-            filename = filename or os.path.basename(real_file)
+        is_path = isinstance(file, str)
+        if not is_path and filename is None:
+            raise ValueError('filename must be set when file is not a path')
+        filename = filename or os.path.basename(file)
 
         upload_dir = os.path.join(self.configuration['upload_dir'], upload_dir) if upload_dir else \
             self.configuration['upload_dir']
         upload_path = os.path.join(upload_dir, filename)
 
-        self.sftp.put(real_file, upload_path)
+        if is_path:
+            self._run('put', file, upload_path)
+        else:
+            self._put_stream(self.to_stream(file), upload_path)
 
         if remove_after:
-            xenian.bot.job_queue.run_once(
-                callback=lambda bot, job: self.remove(upload_path, True),
-                when=remove_after,
-                name='Remove on server: {}'.format(upload_path))
-        if is_file_object:
-            os.unlink(real_file)
-
-    def remove(self, file_path: str, self_connect: bool):
+            self.schedule_removal(upload_path, remove_after)
+
+    def get_upload_path(self, filename: str) -> str:
+        """Get the path on the server a file is uploaded to, if no sub directory is given
+
+        Args:
+            filename (:obj:`str`): Filename on the server
+
+        Returns:
+            :obj:`str`: Path of the file on the server
+        """
+        return os.path.join(self.configuration['upload_dir'], filename)
+
+    def remove(self, file_path: str, self_connect: bool = True):
         """Remove a file from the server
 
         Args:
             file_path (:obj:`str`): path to a file
-            self_connect (:obj:`bool`): If he method should connect to the server by itself
-
-        Raises:
-            :obj:`NotImplementedError`: If you did not implement the function in your uploader.
+            self_connect (:obj:`bool`, optional): Only here for compatibility, a pooled connection is always used
         """
-        if self_connect:
-            self.connect()
+        self._run('remove', file_path)
+
+    def remove_many(self, file_paths: list) -> list:
+        """Remove multiple files from the server over a single connection
 
-        self.sftp.remove(file_path)
+        Files which do not exist anymore count as removed.
 
-        if self_connect:
-            self.close()
+        Args:
+            file_paths (:obj:`list`): paths to the files
+
+        Returns:
+            :obj:`list`: The paths which were removed
+        """
+        removed = []
+        try:
+            with self.connection() as sftp:
+                for file_path in file_paths:
+                    try:
+                        sftp.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                    except self.connection_errors:
+                        raise
+                    except IOError as e:
+                        self.logger.warning(f'Could not remove {file_path}: {e}')
+                        continue
+                    removed.append(file_path)
+        except self.connection_errors as e:
+            self.logger.warning(f'Connection broke while removing files, {len(removed)} were removed: {e}')
+        return removed
@@ -1,8 +1,14 @@
 from .file import *
 from .temp_file import *
 from .cache import *
+from .stats import *
+from .http_client import *
+from .bulk_writer import *
 from .data import *
 from .progress_bar import *
 from .telegram import *
 from .template import *
 from .telegram_files import *
+from .image_hash import *
+from .zip_writer import *
+from .send_scheduler import *
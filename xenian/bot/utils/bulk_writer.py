@@ -0,0 +1,198 @@
+import atexit
+import logging
+import time
+from collections import OrderedDict
+from threading import Condition, Lock, Thread
+from typing import Callable
+
+from pymongo import ReplaceOne
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+__all__ = ['BulkUpsertWriter']
+
+
+class BulkUpsertWriter:
+    """Buffer upserts in memory and write them to MongoDB with unordered bulk writes
+
+    Every upsert replaces the whole document, fields missing in the new version are removed.
+
+    A background thread writes the buffer once :attr:`batch_size` upserts are pending or :attr:`flush_interval` seconds
+    have passed, whichever comes first. Upserts for the same document (same collection and filter) which are still
+    pending are merged, only the newest version is written.
+
+    If more than :attr:`max_pending` upserts are pending, callers wait up to :attr:`put_timeout` seconds for the
+    writer to catch up. If it does not, the upsert is dropped and counted, so a slow database never blocks the bot
+    completely.
+
+    Examples:
+        >>> writer = BulkUpsertWriter(batch_size=500, flush_interval=1)
+        >>> writer.upsert(mongodb_database.users, {'id': user.id}, user.to_dict())
+
+    Attributes:
+        batch_size (:obj:`int`): Number of pending upserts which trigger a write
+        flush_interval (:obj:`int` or :obj:`float`): Maximum seconds an upsert waits before it is written
+        max_pending (:obj:`int`): Number of pending upserts after which callers have to wait
+        put_timeout (:obj:`int` or :obj:`float`): Seconds a caller waits for free space before the upsert is dropped
+
+    Args:
+        batch_size (:obj:`int`, optional): Number of pending upserts which trigger a write
+        flush_interval (:obj:`int` or :obj:`float`, optional): Maximum seconds an upsert waits before it is written
+        max_pending (:obj:`int`, optional): Number of pending upserts after which callers have to wait
+        put_timeout (:obj:`int` or :obj:`float`, optional): Seconds a caller waits for free space before the upsert
+            is dropped
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, batch_size: int = 500, flush_interval: int or float = 1, max_pending: int = 10000,
+                 put_timeout: int or float = 1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+
+        self._pending = OrderedDict()
+        self._condition = Condition()
+        self._write_lock = Lock()
+        self._thread = None
+
+        self._stats = OrderedDict([
+            ('queued', 0),
+            ('merged', 0),
+            ('written', 0),
+            ('dropped', 0),
+            ('waited', 0),
+            ('batches', 0),
+            ('errors', 0),
+            ('max_pending', 0),
+            ('last_batch_ms', 0),
+        ])
+
+        atexit.register(self.flush)
+
+    def upsert(self, collection: Collection, filter_: dict, document: dict, on_written: Callable = None,
+               on_failed: Callable = None) -> bool:
+        """Queue an upsert
+
+        Args:
+            collection (:obj:`pymongo.collection.Collection`): Collection to write to
+            filter_ (:obj:`dict`): Filter to find the document, should match exactly one document
+            document (:obj:`dict`): The whole document, it replaces the existing one
+            on_written (:obj:`Callable`, optional): Called without arguments from the writer thread once the document
+                was written. It is not called if the write failed or a newer version of the document replaced this
+                one before it was written.
+            on_failed (:obj:`Callable`, optional): Called without arguments from the writer thread if writing the
+                document failed, or from the calling thread if the upsert was dropped
+
+        Returns:
+            :obj:`bool`: True if the upsert was queued, False if it was dropped
+        """
+        key = (collection.full_name, tuple(sorted(filter_.items())))
+        dropped = False
+        with self._condition:
+            if key in self._pending:
+                self._stats['merged'] += 1
+            else:
+                if len(self._pending) >= self.max_pending:
+                    self._stats['waited'] += 1
+                    self._condition.notify_all()
+                    self._condition.wait_for(lambda: len(self._pending) < self.max_pending, self.put_timeout)
+                    if len(self._pending) >= self.max_pending:
+                        self._stats['dropped'] += 1
+                        dropped = True
+
+            if not dropped:
+                self._pending[key] = collection, filter_, document, on_written, on_failed
+                self._stats['queued'] += 1
+            self._stats['max_pending'] = max(self._stats['max_pending'], len(self._pending))
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+
+        if dropped:
+            if on_failed is not None:
+                on_failed()
+            return False
+
+        self._ensure_thread()
+        return True
+
+    def flush(self):
+        """Write all pending upserts now
+        """
+        with self._write_lock:
+            self._flush()
+
+    def _flush(self):
+        """Write all pending upserts, must be called while holding the write lock
+        """
+        with self._condition:
+            batch = self._pending
+            self._pending = OrderedDict()
+            self._condition.notify_all()
+
+        if not batch:
+            return
+
+        operations = OrderedDict()
+        for collection, filter_, document, on_written, on_failed in batch.values():
+            collection_operations = operations.setdefault(collection.full_name, (collection, [], []))
+            collection_operations[1].append(ReplaceOne(filter_, document, upsert=True))
+            collection_operations[2].append((on_written, on_failed))
+
+        start = time.monotonic()
+        written = errors = 0
+        for collection, collection_operations, callbacks in operations.values():
+            try:
+                collection.bulk_write(collection_operations, ordered=False)
+            except PyMongoError:
+                errors += 1
+                self.logger.exception(f'Bulk write to {collection.full_name} failed')
+                succeeded = False
+            else:
+                written += len(collection_operations)
+                succeeded = True
+
+            for on_written, on_failed in callbacks:
+                callback = on_written if succeeded else on_failed
+                if callback is None:
+                    continue
+                try:
+                    callback()
+                except Exception:
+                    self.logger.exception('Callback of a written document failed')
+
+        with self._condition:
+            self._stats['written'] += written
+            self._stats['errors'] += errors
+            self._stats['batches'] += 1
+            self._stats['last_batch_ms'] = round((time.monotonic() - start) * 1000)
+
+    def stats(self) -> dict:
+        """Get statistics about the writer
+
+        Returns:
+            :obj:`dict`: Number of pending, queued, merged, written and dropped upserts and more
+        """
+        with self._condition:
+            stats = OrderedDict([('pending', len(self._pending))])
+            stats.update(self._stats)
+            return stats
+
+    def _ensure_thread(self):
+        """Start the background writer if it is not running yet
+        """
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='BulkUpsertWriter', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Write batches until the process ends
+        """
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.batch_size, self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception('Writing batch failed')
@@ -1,6 +1,9 @@
 import time
+from collections import OrderedDict
+from threading import RLock
+from typing import Callable, Hashable
 
-__all__ = ['MWT']
+__all__ = ['MWT', 'TTLCache', 'LRUCache']
 
 
 class MWT(object):
@@ -41,3 +44,180 @@ class MWT(object):
         func.func_name = f.__name__
 
         return func
+
+
+class TTLCache:
+    """Thread safe cache whose entries expire after a given time
+
+    :obj:`None` is a valid value to cache, so "nothing found in the database" is cached as well.
+
+    Examples:
+        >>> cache = TTLCache(timeout=60, maxsize=1000)
+        >>> cache.get(chat_id, lambda: collection.find_one({'chat_id': chat_id}))
+        >>> # After the data was changed in the database
+        >>> cache.invalidate(chat_id)
+
+    Attributes:
+        timeout (:obj:`int` or :obj:`float`): Seconds after which an entry expires
+        maxsize (:obj:`int`): Maximum number of entries, the oldest entries are dropped first. Unlimited if None
+        hits (:obj:`int`): Number of lookups answered from the cache
+        misses (:obj:`int`): Number of lookups which had to call the loader
+        invalidations (:obj:`int`): Number of invalidated entries
+
+    Args:
+        timeout (:obj:`int` or :obj:`float`): Seconds after which an entry expires
+        maxsize (:obj:`int`, optional): Maximum number of entries, the oldest entries are dropped first
+    """
+    _missing = object()
+
+    def __init__(self, timeout: int or float, maxsize: int = None):
+        self.timeout = timeout
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = RLock()
+
+    def get(self, key: Hashable, loader: Callable = None, default: object = None) -> object:
+        """Get a value from the cache
+
+        Args:
+            key (:obj:`Hashable`): Key of the entry
+            loader (:obj:`Callable`, optional): Called without arguments to get the value if it is not cached or has
+                expired. The result is cached.
+            default (:obj:`object`, optional): Returned if no loader was given and the entry is not cached
+
+        Returns:
+            :obj:`object`: The cached or loaded value
+        """
+        with self._lock:
+            value, expires = self._entries.get(key, (self._missing, 0))
+            if value is not self._missing and expires > time.monotonic():
+                self.hits += 1
+                return value
+            self.misses += 1
+            generation = self._generation
+
+        if loader is None:
+            return default
+
+        value = loader()
+        with self._lock:
+            # Do not cache the value if an invalidation happened while loading, as it could be outdated already
+            if generation == self._generation:
+                self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: object):
+        """Add or replace a value
+
+        Args:
+            key (:obj:`Hashable`): Key of the entry
+            value (:obj:`object`): The value
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value, time.monotonic() + self.timeout
+            while self.maxsize and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable = _missing):
+        """Remove an entry, or all entries if no key is given
+
+        Args:
+            key (:obj:`Hashable`, optional): Key of the entry
+        """
+        with self._lock:
+            self._generation += 1
+            if key is self._missing:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """:obj:`float`: Share of lookups answered from the cache between 0 and 1"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        """Get statistics about the usage of this cache
+
+        Returns:
+            :obj:`dict`: Number of entries, hits, misses, invalidations and the hit rate in percent
+        """
+        with self._lock:
+            return OrderedDict([
+                ('entries', len(self._entries)),
+                ('hits', self.hits),
+                ('misses', self.misses),
+                ('invalidations', self.invalidations),
+                ('hit_rate', f'{self.hit_rate * 100:.1f}%'),
+            ])
+
+
+class LRUCache:
+    """Thread safe mapping which drops the least recently used entries once it is full
+
+    Attributes:
+        maxsize (:obj:`int`): Maximum number of entries
+
+    Args:
+        maxsize (:obj:`int`): Maximum number of entries
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key: Hashable, default: object = None) -> object:
+        """Get a value and mark it as recently used
+
+        Args:
+            key (:obj:`Hashable`): Key of the entry
+            default (:obj:`object`, optional): Returned if the key does not exist
+
+        Returns:
+            :obj:`object`: The value or default
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: Hashable, value: object):
+        """Add or replace a value
+
+        Args:
+            key (:obj:`Hashable`): Key of the entry
+            value (:obj:`object`): The value
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: object = None) -> object:
+        """Remove an entry
+
+        Args:
+            key (:obj:`Hashable`): Key of the entry
+            default (:obj:`object`, optional): Returned if the key does not exist
+
+        Returns:
+            :obj:`object`: The removed value or default
+        """
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,37 +1,309 @@
+import atexit
 import json
+import logging
 import os
+import time
 from codecs import open as copen
+from copy import deepcopy
+from threading import Event, RLock, Thread
 
-__all__ = ['data']
+__all__ = ['data', 'JournalStorage']
+
+
+class JournalStorage:
+    """Crash safe storage of datasets as a JSON snapshot and an append only journal
+
+    Every dataset consists of a snapshot ``<name>.json`` and a journal ``<name>.journal``. Changes are appended to the
+    journal as one JSON object per line:
+
+        {"op": "set", "path": ["1--int", "rules"], "value": "Be nice"}
+        {"op": "del", "path": ["1--int", "2--int"]}
+
+    A path always starts at the root of the dataset, so replaying an operation twice has the same outcome as replaying
+    it once. When loading, the journal is replayed on top of the snapshot. :meth:`compact` writes the current state to
+    a temporary file, atomically renames it over the snapshot and then empties the journal. If the process dies between
+    those steps the journal is simply replayed again. An incomplete last line of the journal (crash while appending) is
+    cut off when loading, so later entries are not appended to it.
+
+    Attributes:
+        data_dir (:obj:`str`): Directory where the data files are saved
+
+    Args:
+        data_dir (:obj:`str`): Directory where the data files are saved
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+
+    def get_path(self, name: str, extension: str = '.json') -> str:
+        """Get the path to a file of a dataset
+
+        Args:
+            name (:obj:`str`): Name of data object
+            extension (:obj:`str`, optional): Extension of the file, ``.json`` for the snapshot (default) or
+                ``.journal`` for the journal
+
+        Returns:
+            :obj:`str`: Absolute path to the file
+        """
+        return os.path.join(self.data_dir, name + extension)
+
+    def stamp(self, name: str) -> tuple:
+        """Get the modification times of the snapshot and the journal
+
+        Args:
+            name (:obj:`str`): Name of data object
+
+        Returns:
+            :obj:`tuple`: Modification time in ns of the snapshot and of the journal, :obj:`None` for missing files
+        """
+        stamp = []
+        for extension in ['.json', '.journal']:
+            try:
+                stamp.append(os.stat(self.get_path(name, extension)).st_mtime_ns)
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def load(self, name: str) -> tuple:
+        """Load the snapshot and replay the journal
+
+        Args:
+            name (:obj:`str`): Name of data object
+
+        Returns:
+            :obj:`tuple`: The loaded data and the number of replayed journal entries
+        """
+        content = ''
+        snapshot_path = self.get_path(name)
+        if os.path.isfile(snapshot_path):
+            with copen(snapshot_path, encoding='utf-8') as snapshot_file:
+                content = snapshot_file.read()
+        data = json.loads(content or '{}')
+
+        replayed = 0
+        journal_path = self.get_path(name, '.journal')
+        if os.path.isfile(journal_path):
+            with open(journal_path, mode='r+b') as journal_file:
+                valid_length = 0
+                for line in journal_file:
+                    try:
+                        operation = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        break
+                    data = self.apply(data, operation)
+                    replayed += 1
+                    valid_length += len(line)
+                    if not line.endswith(b'\n'):
+                        # The entry is complete but its line break is missing, the next entry needs its own line
+                        journal_file.write(b'\n')
+                        valid_length += 1
+
+                journal_file.seek(0, os.SEEK_END)
+                if journal_file.tell() > valid_length:
+                    self.logger.warning(f'Cutting off incomplete entry at the end of {journal_path}')
+                    journal_file.truncate(valid_length)
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+        return data, replayed
+
+    def append(self, name: str, operations: list):
+        """Append operations to the journal
+
+        Args:
+            name (:obj:`str`): Name of data object
+            operations (:obj:`list` of :obj:`dict`): Operations as created by :meth:`diff`
+        """
+        lines = ''.join(json.dumps(operation, ensure_ascii=False) + '\n' for operation in operations)
+        with open(self.get_path(name, '.journal'), mode='a', encoding='utf-8') as journal_file:
+            journal_file.write(lines)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def compact(self, name: str, data: object):
+        """Replace the snapshot with the given data and empty the journal
+
+        Args:
+            name (:obj:`str`): Name of data object
+            data (:obj:`object`): JSON serializable data object, the complete state of the dataset
+        """
+        snapshot_path = self.get_path(name)
+        temp_path = snapshot_path + '.tmp'
+        with copen(temp_path, mode='w', encoding='utf-8') as snapshot_file:
+            json.dump(data, snapshot_file, ensure_ascii=False, indent=4, sort_keys=True)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temp_path, snapshot_path)
+
+        with open(self.get_path(name, '.journal'), mode='w', encoding='utf-8') as journal_file:
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    @staticmethod
+    def diff(old: object, new: object, path: list = None) -> list:
+        """Create the operations needed to get from old to new
+
+        Args:
+            old (:obj:`object`): Previous state
+            new (:obj:`object`): New state
+            path (:obj:`list`, optional): Path of old and new inside the dataset
+
+        Returns:
+            :obj:`list` of :obj:`dict`: Operations for the journal
+        """
+        path = path or []
+        if not isinstance(old, dict) or not isinstance(new, dict):
+            return [] if old == new else [{'op': 'set', 'path': path, 'value': new}]
+
+        operations = [{'op': 'del', 'path': path + [key]} for key in old if key not in new]
+        for key, value in new.items():
+            if key not in old:
+                operations.append({'op': 'set', 'path': path + [key], 'value': value})
+            else:
+                operations.extend(JournalStorage.diff(old[key], value, path + [key]))
+        return operations
+
+    @staticmethod
+    def apply(data: object, operation: dict) -> object:
+        """Apply a journal operation
+
+        Args:
+            data (:obj:`object`): The data to change in place
+            operation (:obj:`dict`): Operation as created by :meth:`diff`
+
+        Returns:
+            :obj:`object`: The changed data, only a different object if the root itself was replaced
+        """
+        path = operation['path']
+        if not path:
+            return operation['value'] if operation['op'] == 'set' else {}
+
+        if not isinstance(data, dict):
+            data = {}
+
+        parent = data
+        for key in path[:-1]:
+            if not isinstance(parent.get(key), dict):
+                if operation['op'] == 'del':
+                    return data
+                parent[key] = {}
+            parent = parent[key]
+
+        if operation['op'] == 'set':
+            parent[path[-1]] = operation['value']
+        else:
+            parent.pop(path[-1], None)
+        return data
 
 
 class Data:
     """Class for managing simple persistent data
+
+    Datasets are loaded once and then kept in memory. :meth:`save` only updates the in memory copy and remembers what
+    changed, a background thread appends the changes to the datasets journal after :attr:`flush_interval` seconds.
+    Like this a burst of changes results in one single write, whose size only depends on what changed and not on the
+    size of the dataset. Once a journal has more than :attr:`compact_after` entries it is compacted into the snapshot
+    (see :class:`JournalStorage`). Files changed by hand are picked up again by comparing their modification time,
+    which is checked at most every :attr:`stat_interval` seconds.
+
+    Single values can be read and changed with :meth:`get_key`, :meth:`set_key`, :meth:`incr` and :meth:`delete_key`.
+    They only touch the given path and hold the lock of the dataset while doing so, so two threads changing the same
+    dataset do not overwrite each others changes.
+
+    Examples:
+        >>> data.incr('group_management', [chat_id, user_id])
+        >>> # 1
+        >>> data.set_key('group_management', [chat_id, 'rules'], 'Be nice')
+        >>> data.get_key('group_management', [chat_id, 'rules'])
+        >>> # 'Be nice'
+
+    Attributes:
+        data_dir (:obj:`str`): Directory where the data files are saved
+        storage (:obj:`JournalStorage`): Storage backend writing the snapshots and journals
+        flush_interval (:obj:`int` or :obj:`float`): Seconds to wait for more changes before writing to disk
+        stat_interval (:obj:`int` or :obj:`float`): Seconds between checks if a file has been changed on disk
+        compact_after (:obj:`int`): Number of journal entries after which the journal is compacted
     """
+    flush_interval = 2
+    stat_interval = 1
+    compact_after = 500
+    logger = logging.getLogger(__name__)
 
     def __init__(self):
         dir_path = os.path.dirname(os.path.realpath(__file__))
         self.data_dir = os.path.join(dir_path, 'data')
         os.makedirs(self.data_dir, exist_ok=True)
+        self.storage = JournalStorage(self.data_dir)
+
+        self._cache = {}
+        self._locks = {}
+        self._lock = RLock()
+        self._write_lock = RLock()
+        self._flush_requested = Event()
+        self._flusher = None
+
+        atexit.register(self.flush)
+
+    def get_path(self, name: str) -> str:
+        """Get the path to the snapshot file of a data object
+
+        Args:
+            name (:obj:`str`): Name of data object
+
+        Returns:
+            :obj:`str`: Absolute path to the JSON file
+        """
+        return self.storage.get_path(self.normalize_name(name))
+
+    def normalize_name(self, name: str) -> str:
+        """Strip directories and extensions from a dataset name
+
+        Args:
+            name (:obj:`str`): Name of data object
+
+        Returns:
+            :obj:`str`: The name used for the files and the cache
+        """
+        return os.path.splitext(os.path.basename(name))[0]
+
+    def lock(self, name: str) -> RLock:
+        """Get the lock of a dataset
+
+        Hold it to run multiple operations on the same dataset without other threads interfering.
+
+        Args:
+            name (:obj:`str`): Name of data object
+
+        Returns:
+            :obj:`threading.RLock`: The lock of the dataset
+        """
+        name = self.normalize_name(name)
+        with self._lock:
+            return self._locks.setdefault(name, RLock())
 
     def save(self, name: str, data: object):
         """Save object to json
 
+        The changes are written to disk by the background flusher, use :meth:`flush` to write them immediately.
+
         Args:
             name (:obj:`str`): Name of data object
             data (:obj:`object`): JSON serializable data object
         """
-        name = os.path.splitext(os.path.basename(name))[0]
-        path = os.path.join(self.data_dir, name + '.json')
         try:
             data = self.serialize(dict(data))
         except TypeError:
-            pass
+            data = deepcopy(data)
 
-        with copen(path, mode='w', encoding='utf-8') as data_file:
-            json.dump(data, data_file, ensure_ascii=False, indent=4, sort_keys=True, )
+        with self.lock(name):
+            entry = self._load(name)
+            entry['pending'].extend(self.storage.diff(entry['data'], data))
+            entry['data'] = data
 
-    def get(self, name: object) -> object:
+        self._request_flush()
+
+    def get(self, name: str) -> object:
         """Get data by name
 
         Args:
@@ -40,20 +312,270 @@ class Data:
         Returns:
             Object saved in the data file
         """
-        name = os.path.splitext(os.path.basename(name))[0]
-        path = os.path.join(self.data_dir, name + '.json')
-        if not os.path.isfile(path):
-            file = copen(path, encoding='utf-8', mode='w')
-            file.close()
+        with self.lock(name):
+            data = deepcopy(self._load(name)['data'])
+
+        if isinstance(data, dict):
+            data = self.deserialize(data)
+        return data
+
+    def get_key(self, name: str, path: list or str or int or float, default: object = None) -> object:
+        """Get a single value of a dataset
+
+        Args:
+            name (:obj:`str`): Name of data object
+            path (:obj:`list` or :obj:`str` or :obj:`int` or :obj:`float`): Keys leading to the value, a single key
+                can be given directly
+            default (:obj:`object`, optional): Returned if the path does not exist
+
+        Returns:
+            The value found at path or default
+        """
+        path = self.serialize_path(path)
+        with self.lock(name):
+            value = self._load(name)['data']
+            for key in path:
+                if not isinstance(value, dict) or key not in value:
+                    return default
+                value = value[key]
+            value = deepcopy(value)
+
+        if isinstance(value, dict):
+            value = self.deserialize(value)
+        return value
+
+    def set_key(self, name: str, path: list or str or int or float, value: object):
+        """Set a single value of a dataset, missing dicts on the way are created
+
+        Args:
+            name (:obj:`str`): Name of data object
+            path (:obj:`list` or :obj:`str` or :obj:`int` or :obj:`float`): Keys leading to the value, a single key
+                can be given directly
+            value (:obj:`object`): JSON serializable value
+        """
+        path = self.serialize_path(path)
+        if not path:
+            raise ValueError('Path must contain at least one key, use save to replace the whole dataset')
+        value = self.serialize(value) if isinstance(value, dict) else deepcopy(value)
+
+        with self.lock(name):
+            self._set(name, path, value)
+
+        self._request_flush()
+
+    def incr(self, name: str, path: list or str or int or float, by: int or float = 1) -> int or float:
+        """Increment a number in a dataset, missing or empty values count as 0
+
+        Args:
+            name (:obj:`str`): Name of data object
+            path (:obj:`list` or :obj:`str` or :obj:`int` or :obj:`float`): Keys leading to the value, a single key
+                can be given directly
+            by (:obj:`int` or :obj:`float`, optional): Amount to add, defaults to 1
+
+        Returns:
+            :obj:`int` or :obj:`float`: The new value
+
+        Raises:
+            TypeError: If the current value is not a number
+        """
+        path = self.serialize_path(path)
+        if not path:
+            raise ValueError('Path must contain at least one key')
+
+        with self.lock(name):
+            current = self.get_key(name, path) or 0
+            if isinstance(current, bool) or not isinstance(current, (int, float)):
+                raise TypeError(f'Value at {path} in {name} is not a number: {current}')
+            new_value = current + by
+            self._set(name, path, new_value)
+
+        self._request_flush()
+        return new_value
+
+    def delete_key(self, name: str, path: list or str or int or float) -> bool:
+        """Remove a single value from a dataset
+
+        Args:
+            name (:obj:`str`): Name of data object
+            path (:obj:`list` or :obj:`str` or :obj:`int` or :obj:`float`): Keys leading to the value, a single key
+                can be given directly
+
+        Returns:
+            :obj:`bool`: True if the value existed, False otherwise
+        """
+        path = self.serialize_path(path)
+        if not path:
+            raise ValueError('Path must contain at least one key')
+
+        with self.lock(name):
+            entry = self._load(name)
+            parent = entry['data']
+            for key in path[:-1]:
+                if not isinstance(parent, dict) or key not in parent:
+                    return False
+                parent = parent[key]
+            if not isinstance(parent, dict) or path[-1] not in parent:
+                return False
+
+            del parent[path[-1]]
+            entry['pending'].append({'op': 'del', 'path': path})
+
+        self._request_flush()
+        return True
+
+    def flush(self, name: str = None):
+        """Write pending changes to the journals and compact journals which have grown too big
+
+        Args:
+            name (:obj:`str`, optional): Only write this dataset, by default all datasets with changes are written
+        """
+        with self._write_lock:
+            names = [self.normalize_name(name)] if name else list(self._cache)
+            for dataset_name in names:
+                with self.lock(dataset_name):
+                    entry = self._cache.get(dataset_name)
+                    if not entry or not entry['pending']:
+                        continue
+                    operations = entry['pending']
+                    entry['pending'] = []
+                    entry['flushing'] = True
+
+                try:
+                    self.storage.append(dataset_name, operations)
+                except OSError:
+                    self.logger.exception(f'Could not write journal of {dataset_name}')
+                    with self.lock(dataset_name):
+                        entry['pending'] = operations + entry['pending']
+                        entry['flushing'] = False
+                    continue
+
+                with self.lock(dataset_name):
+                    entry['journal_length'] += len(operations)
+                    compact = entry['journal_length'] > self.compact_after
+                    snapshot = deepcopy(entry['data']) if compact else None
+
+                if compact:
+                    try:
+                        self.storage.compact(dataset_name, snapshot)
+                    except OSError:
+                        self.logger.exception(f'Could not compact journal of {dataset_name}')
+                    else:
+                        with self.lock(dataset_name):
+                            entry['journal_length'] = 0
+
+                with self.lock(dataset_name):
+                    entry['stamp'] = self.storage.stamp(dataset_name)
+                    entry['flushing'] = False
+
+    def _set(self, name: str, path: list, value: object):
+        """Set an already serialized value in the cache and remember the change
+
+        Must be called while holding the lock of the dataset.
+
+        Args:
+            name (:obj:`str`): Name of data object
+            path (:obj:`list`): Serialized keys leading to the value
+            value (:obj:`object`): Serialized value
+        """
+        entry = self._load(name)
+        if not isinstance(entry['data'], dict):
+            entry['data'] = {}
+
+        parent = entry['data']
+        for key in path[:-1]:
+            if not isinstance(parent.get(key), dict):
+                parent[key] = {}
+            parent = parent[key]
+
+        parent[path[-1]] = value
+        entry['pending'].append({'op': 'set', 'path': path, 'value': deepcopy(value)})
+
+    def _load(self, name: str) -> dict:
+        """Get the cache entry of a dataset and (re)load it from disk if necessary
+
+        Must be called while holding the lock of the dataset.
+
+        Args:
+            name (:obj:`str`): Name of data object
+
+        Returns:
+            :obj:`dict`: The cache entry with the keys data, pending, flushing, journal_length, stamp and checked
+        """
+        name = self.normalize_name(name)
+        entry = self._cache.get(name)
+        now = time.monotonic()
+        if entry and (entry['pending'] or entry['flushing'] or now - entry['checked'] < self.stat_interval):
+            return entry
 
-        with copen(path, encoding='utf-8') as data_file:
-            content = data_file.read()
-            content = content or '{}'
+        stamp = self.storage.stamp(name)
+        if entry and entry['stamp'] == stamp:
+            entry['checked'] = now
+            return entry
 
-            data = json.loads(content)
-            if isinstance(data, dict):
-                data = self.deserialize(data)
-            return data
+        data, journal_length = self.storage.load(name)
+        entry = self._cache[name] = {
+            'data': data,
+            'pending': [],
+            'flushing': False,
+            'journal_length': journal_length,
+            'stamp': stamp,
+            'checked': now,
+        }
+        return entry
+
+    def _request_flush(self):
+        """Wake up the background flusher, start it if it is not running yet
+        """
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = Thread(target=self._flush_loop, name='DataFlusher', daemon=True)
+                self._flusher.start()
+        self._flush_requested.set()
+
+    def _flush_loop(self):
+        """Write changes in batches, waits :attr:`flush_interval` after the first change to collect more
+        """
+        while True:
+            self._flush_requested.wait()
+            time.sleep(self.flush_interval)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception('Flushing data failed')
+
+    def serialize_key(self, key: str or int or float) -> str:
+        """Serialize a single key
+
+        Args:
+            key (:obj:`str` or :obj:`int` or :obj:`float`): The key
+
+        Returns:
+            :obj:`str`: The key as it is saved in the JSON file
+
+        Raises:
+            ValueError: If key is not str, int or float
+        """
+        if isinstance(key, int):
+            return '{}--int'.format(key)
+        elif isinstance(key, float):
+            return '{}--float'.format(key)
+        elif not isinstance(key, str):
+            raise ValueError('Key must be either str, int or float: {}'.format(key))
+        return key
+
+    def serialize_path(self, path: list or str or int or float) -> list:
+        """Serialize a list of keys
+
+        Args:
+            path (:obj:`list` or :obj:`str` or :obj:`int` or :obj:`float`): List of keys or a single key
+
+        Returns:
+            :obj:`list`: List of serialized keys
+        """
+        if not isinstance(path, (list, tuple)):
+            path = [path]
+        return [self.serialize_key(key) for key in path]
 
     def serialize(self, data: dict) -> dict:
         """Serialize a dict recursively
@@ -69,18 +591,12 @@ class Data:
         """
         new_dict = {}
         for key, value in data.items():
-            new_key = key
-            if isinstance(key, int):
-                new_key = '{}--int'.format(key)
-            elif isinstance(key, float):
-                new_key = '{}--float'.format(key)
-            elif not isinstance(key, str):
-                raise ValueError('Key must be either str, int or float: {} {}'.format(key, value))
+            new_key = self.serialize_key(key)
 
             if isinstance(value, dict):
                 new_dict[new_key] = self.serialize(value)
             else:
-                new_dict[new_key] = value
+                new_dict[new_key] = deepcopy(value)
         return new_dict
 
     def deserialize(self, data: dict) -> dict:
@@ -1,9 +1,7 @@
 import os
 
-import requests
-
-from xenian.bot.settings import UPLOADER
-from xenian.bot.uploaders import uploader
+from xenian.bot.uploaders import content_store
+from xenian.bot.utils.http_client import http_client
 from xenian.bot.utils.temp_file import CustomNamedTemporaryFile
 
 __all__ = ['download_file_from_url', 'download_file_from_url_and_upload', 'upload_image']
@@ -12,9 +10,13 @@ __all__ = ['download_file_from_url', 'download_file_from_url_and_upload', 'uploa
 def upload_image(image_file, target_file_name: str = None, remove_after: int = None) -> str:
     """Upload the given image to the in the settings specified place.
 
+    The image is saved under the hash of its content, so the same image is only uploaded once, see
+    :class:`xenian.bot.uploaders.content_store.ContentStore`.
+
     Args:
-        image_file: File like object of an image or path to an image
-        target_file_name (:obj:`str`, optional): Name of the given file. Can be left empty if image_file is a file path
+        image_file: File like object of an image, its content as bytes or path to an image
+        target_file_name (:obj:`str`, optional): Name of the given file, only its extension is used. Can be left empty
+            if image_file is a file path or a file like object with a name
         remove_after (:obj:`int`, optional): After how much time to remove the file in sec. Do not remove by default
 
     Returns:
@@ -22,18 +24,15 @@ def upload_image(image_file, target_file_name: str = None, remove_after: int = N
     Raises:
         ValueError: If the image_file is an file like object and the file_name has not been set.
     """
+    if not target_file_name and isinstance(getattr(image_file, 'name', None), str):
+        target_file_name = image_file.name
     if not target_file_name:
         if not isinstance(image_file, str):
             error_message = 'When image_file is a file like object the file_name must be set.'
             raise ValueError(error_message)
         target_file_name = os.path.basename(image_file)
 
-    uploader.connect()
-    uploader.upload(image_file, target_file_name, remove_after=remove_after)
-    uploader.close()
-
-    path = UPLOADER.get('url', None) or UPLOADER['configuration'].get('path', None) or ''
-    return os.path.join(path, target_file_name)
+    return content_store.store(image_file, os.path.splitext(target_file_name)[1], remove_after=remove_after)
 
 
 def download_file_from_url(url: str) -> str:
@@ -47,8 +46,9 @@ def download_file_from_url(url: str) -> str:
 
     """
     with CustomNamedTemporaryFile(delete=False, mode='wb') as file_:
-        response = requests.get(url, allow_redirects=True)
-        file_.write(response.content)
+        with http_client.get(url, stream=True) as response:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                file_.write(chunk)
         file_.close()
         return file_.name
 
@@ -0,0 +1,173 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from xenian.bot import settings
+from .stats import stats_registry
+
+__all__ = ['HttpClient', 'http_client']
+
+
+class HttpClient:
+    """Shared HTTP client for all outgoing requests
+
+    All requests go through one :class:`requests.Session`, so connections are kept alive and reused per host instead
+    of opening a new TCP and TLS connection for every request. Failed connections, and answers with a status which
+    usually goes away again (429, 500, 502, 503, 504), are retried with an exponential backoff. This respects the
+    Retry-After header. Callers with a deadline of their own can send a request with ``retry=False``, it then goes
+    through a second session which never retries. Every request gets a timeout if the caller did not set one.
+
+    Examples:
+        >>> response = http_client.get('https://example.com')
+        >>> http_client.head('https://example.com/image.png', timeout=5).status_code
+        200
+
+    Attributes:
+        session (:obj:`requests.Session`): The shared session
+        no_retry_session (:obj:`requests.Session`): The shared session for requests which must not be retried
+        timeout (:obj:`tuple`): Default connect and read timeout in seconds
+
+    Args:
+        timeout (:obj:`int`, :obj:`float` or :obj:`tuple`, optional): Default timeout in seconds, or a tuple of
+            connect and read timeout
+        retries (:obj:`int`, optional): How often a request is retried
+        backoff_factor (:obj:`float`, optional): Retries wait backoff_factor * 2 ^ (retry number - 1) seconds
+        pool_connections (:obj:`int`, optional): Number of hosts connections are kept for
+        pool_maxsize (:obj:`int`, optional): Number of connections kept per host
+        user_agent (:obj:`str`, optional): User agent sent with every request
+    """
+
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, timeout: int or float or tuple = (5, 30), retries: int = 3, backoff_factor: float = 0.5,
+                 pool_connections: int = 20, pool_maxsize: int = 20, user_agent: str = None):
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.retry_statuses,
+            raise_on_status=False,
+        )
+        self.session = self._create_session(pool_connections, pool_maxsize, retry, user_agent)
+        self.no_retry_session = self._create_session(pool_connections, pool_maxsize, Retry(0, read=False), user_agent)
+
+        self._hosts = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _create_session(pool_connections: int, pool_maxsize: int, retry: Retry,
+                        user_agent: str = None) -> requests.Session:
+        """Create a session with a pooled adapter for http and https
+
+        Args:
+            pool_connections (:obj:`int`): Number of hosts connections are kept for
+            pool_maxsize (:obj:`int`): Number of connections kept per host
+            retry (:obj:`urllib3.util.retry.Retry`): When and how often requests are retried
+            user_agent (:obj:`str`, optional): User agent sent with every request
+
+        Returns:
+            :obj:`requests.Session`: The new session
+        """
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if user_agent:
+            session.headers['User-Agent'] = user_agent
+        return session
+
+    def request(self, method: str, url: str, retry: bool = True, **kwargs) -> requests.Response:
+        """Send a request
+
+        Args:
+            method (:obj:`str`): HTTP method like GET or HEAD
+            url (:obj:`str`): The url
+            retry (:obj:`bool`, optional): If failed requests are retried. Turn this off when the caller has a deadline
+                which a retry, or waiting for a Retry-After header, would overrun
+            **kwargs: Passed on to :meth:`requests.Session.request`
+
+        Returns:
+            :obj:`requests.Response`: The response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+        session = self.session if retry else self.no_retry_session
+
+        start = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(host, time.monotonic() - start, failed=True)
+            raise
+        self._record(host, time.monotonic() - start, failed=response.status_code >= 400)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request, redirects are followed
+
+        Args:
+            url (:obj:`str`): The url
+            **kwargs: Passed on to :meth:`request`
+
+        Returns:
+            :obj:`requests.Response`: The response
+        """
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        """Send a HEAD request, redirects are not followed
+
+        Args:
+            url (:obj:`str`): The url
+            **kwargs: Passed on to :meth:`request`
+
+        Returns:
+            :obj:`requests.Response`: The response
+        """
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+    def _record(self, host: str, duration: float, failed: bool):
+        """Count a request to a host
+
+        Args:
+            host (:obj:`str`): The host
+            duration (:obj:`float`): Seconds the request took including retries
+            failed (:obj:`bool`): If the request raised an error or was answered with an error status
+        """
+        with self._lock:
+            counters = self._hosts.setdefault(host, {'requests': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0})
+            counters['requests'] += 1
+            counters['errors'] += int(failed)
+            counters['total_time'] += duration
+            counters['max_time'] = max(counters['max_time'], duration)
+
+    def stats(self) -> OrderedDict:
+        """Get the number of requests, errors and the latency per host
+
+        Returns:
+            :obj:`collections.OrderedDict`: A summary by host, busiest hosts first
+        """
+        with self._lock:
+            hosts = sorted(self._hosts.items(), key=lambda item: item[1]['requests'], reverse=True)
+            return OrderedDict(
+                (host, '{requests} requests, {errors} errors, avg {average:.0f}ms, max {maximum:.0f}ms'.format(
+                    requests=counters['requests'],
+                    errors=counters['errors'],
+                    average=counters['total_time'] / counters['requests'] * 1000,
+                    maximum=counters['max_time'] * 1000,
+                ))
+                for host, counters in hosts
+            )
+
+
+http_client = HttpClient(**getattr(settings, 'HTTP_CLIENT', {}))
+stats_registry.register('HTTP client', http_client.stats)
@@ -0,0 +1,208 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from PIL import Image
+
+__all__ = ['dhash', 'phash', 'image_hashes', 'ImageHashIndex']
+
+
+def _grayscale(image: Image.Image, size: tuple) -> np.ndarray:
+    """Downscale an image and convert it to grayscale
+
+    Transparent parts are put onto a white background first, otherwise the hidden colour of transparent pixels would
+    change the hash.
+
+    Args:
+        image (:obj:`PIL.Image.Image`): The image, for animations the current frame is used
+        size (:obj:`tuple`): Width and height of the result
+
+    Returns:
+        :obj:`numpy.ndarray`: Array of the shape (height, width) with the brightness of every pixel
+    """
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    image = image.convert('L').resize(size, Image.LANCZOS)
+    return np.asarray(image, dtype=np.float64)
+
+
+def _to_int(bits: np.ndarray) -> int:
+    """Pack 64 booleans into an integer
+
+    Args:
+        bits (:obj:`numpy.ndarray`): 64 booleans, the first is the most significant bit
+
+    Returns:
+        :obj:`int`: The packed bits
+    """
+    return int(np.packbits(bits.ravel()).view('>u8')[0])
+
+
+def dhash(image: Image.Image) -> int:
+    """Difference hash of an image
+
+    The image is reduced to 9x8 pixels and every bit says if a pixel is brighter than its right neighbour.
+
+    Args:
+        image (:obj:`PIL.Image.Image`): The image
+
+    Returns:
+        :obj:`int`: 64 bit hash
+    """
+    pixels = _grayscale(image, (9, 8))
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+_DCT_SIZE = 32
+_DCT_MATRIX = np.cos(
+    np.pi * np.outer(np.arange(_DCT_SIZE), 2 * np.arange(_DCT_SIZE) + 1) / (2 * _DCT_SIZE)
+)
+
+
+def phash(image: Image.Image) -> int:
+    """Perceptual hash of an image
+
+    The image is reduced to 32x32 pixels and transformed with a two dimensional DCT. Every bit of the hash says if one
+    of the 8x8 lowest frequencies is above their median.
+
+    Args:
+        image (:obj:`PIL.Image.Image`): The image
+
+    Returns:
+        :obj:`int`: 64 bit hash
+    """
+    pixels = _grayscale(image, (_DCT_SIZE, _DCT_SIZE))
+    frequencies = (_DCT_MATRIX @ pixels @ _DCT_MATRIX.T)[:8, :8]
+    # The first coefficient is the average brightness, which says nothing about the structure of the image
+    return _to_int(frequencies > np.median(frequencies.ravel()[1:]))
+
+
+def image_hashes(file) -> tuple:
+    """Get the difference and perceptual hash of an image
+
+    Args:
+        file: Path or file like object of an image. Of animations the first frame is used.
+
+    Returns:
+        :obj:`tuple`: The :func:`dhash` and :func:`phash` of the image
+    """
+    with Image.open(file) as image:
+        image.load()
+        return dhash(image), phash(image)
+
+
+class ImageHashIndex:
+    """Find values saved for images which look like a given one
+
+    Images are compared by their :func:`dhash` and :func:`phash`. Two images are considered the same if the number
+    of bits which differ is at most ``max_dhash_distance`` and ``max_phash_distance``. Every entry has an expiry time.
+    Once the index is full the oldest entries are overwritten.
+
+    The hashes are kept in NumPy arrays, so a lookup compares against all entries at once.
+
+    Examples:
+        >>> index = ImageHashIndex(maxsize=1000)
+        >>> hashes = image_hashes('/tmp/image.png')
+        >>> index.add(hashes, 'https://example.com/image.png', expires=time.time() + 3600)
+        >>> index.find(image_hashes('/tmp/resized_image.jpg'))
+        'https://example.com/image.png'
+
+    Attributes:
+        maxsize (:obj:`int`): Maximum number of entries
+        max_dhash_distance (:obj:`int`): Maximum number of differing bits of the difference hash
+        max_phash_distance (:obj:`int`): Maximum number of differing bits of the perceptual hash
+        hits (:obj:`int`): Number of lookups which found a value
+        misses (:obj:`int`): Number of lookups which found nothing
+
+    Args:
+        maxsize (:obj:`int`): Maximum number of entries
+        max_dhash_distance (:obj:`int`, optional): Maximum number of differing bits of the difference hash
+        max_phash_distance (:obj:`int`, optional): Maximum number of differing bits of the perceptual hash
+    """
+
+    def __init__(self, maxsize: int, max_dhash_distance: int = 5, max_phash_distance: int = 8):
+        self.maxsize = maxsize
+        self.max_dhash_distance = max_dhash_distance
+        self.max_phash_distance = max_phash_distance
+
+        self.hits = 0
+        self.misses = 0
+
+        self._dhashes = np.zeros(maxsize, dtype=np.uint64)
+        self._phashes = np.zeros(maxsize, dtype=np.uint64)
+        self._expires = np.zeros(maxsize, dtype=np.float64)
+        self._values = [None] * maxsize
+        self._next = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def _distances(hashes: np.ndarray, hash_: int) -> np.ndarray:
+        """Count the differing bits between many hashes and one hash
+
+        Args:
+            hashes (:obj:`numpy.ndarray`): Array of 64 bit hashes
+            hash_ (:obj:`int`): The hash to compare to
+
+        Returns:
+            :obj:`numpy.ndarray`: Number of differing bits for every hash
+        """
+        differences = np.bitwise_xor(hashes, np.uint64(hash_))
+        return np.unpackbits(differences.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+    def add(self, hashes: tuple, value: object, expires: float):
+        """Add a value for an image
+
+        Args:
+            hashes (:obj:`tuple`): The :func:`dhash` and :func:`phash` of the image, see :func:`image_hashes`
+            value (:obj:`object`): The value to save
+            expires (:obj:`float`): Unix time after which the entry is not found anymore
+        """
+        with self._lock:
+            position = self._next
+            self._dhashes[position], self._phashes[position] = hashes
+            self._expires[position] = expires
+            self._values[position] = value
+            self._next = (position + 1) % self.maxsize
+
+    def find(self, hashes: tuple) -> object:
+        """Find the value of the most similar image which did not expire yet
+
+        Args:
+            hashes (:obj:`tuple`): The :func:`dhash` and :func:`phash` of the image, see :func:`image_hashes`
+
+        Returns:
+            :obj:`object`: The value or :obj:`None` if no similar image is known
+        """
+        dhash_, phash_ = hashes
+        with self._lock:
+            dhash_distances = self._distances(self._dhashes, dhash_)
+            phash_distances = self._distances(self._phashes, phash_)
+            matches = ((self._expires > time.time())
+                       & (dhash_distances <= self.max_dhash_distance)
+                       & (phash_distances <= self.max_phash_distance))
+            if not matches.any():
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            distances = np.where(matches, dhash_distances + phash_distances, np.iinfo(np.int64).max)
+            return self._values[int(distances.argmin())]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int((self._expires > time.time()).sum())
+
+    def stats(self) -> OrderedDict:
+        """Get statistics about the usage of this index
+
+        Returns:
+            :obj:`collections.OrderedDict`: Number of valid entries, hits and misses
+        """
+        return OrderedDict([
+            ('entries', len(self)),
+            ('hits', self.hits),
+            ('misses', self.misses),
+        ])
@@ -0,0 +1,351 @@
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from threading import Condition, Thread
+from typing import Callable
+
+from telegram.error import RetryAfter
+
+from xenian.bot import settings
+from .stats import stats_registry
+
+__all__ = ['TokenBucket', 'SendScheduler', 'send_scheduler']
+
+
+class TokenBucket:
+    """Rate limit which allows short bursts
+
+    The bucket holds up to ``capacity`` tokens and gains ``rate`` tokens per second. Every message takes tokens out.
+    This class is not thread safe, :class:`SendScheduler` only uses it while holding its lock.
+
+    Attributes:
+        rate (:obj:`float`): Tokens gained per second
+        capacity (:obj:`float`): Maximum number of tokens
+        tokens (:obj:`float`): Number of tokens available right now
+
+    Args:
+        rate (:obj:`float`): Tokens gained per second
+        capacity (:obj:`float`): Maximum number of tokens, the bucket starts full
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Get how long to wait until enough tokens are available
+
+        Args:
+            cost (:obj:`float`): Number of tokens needed, more than the capacity only needs a full bucket
+            now (:obj:`float`): Current :func:`time.monotonic`
+
+        Returns:
+            :obj:`float`: Seconds to wait, 0 if the tokens are available right now
+        """
+        self._refill(now)
+        missing = min(cost, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, cost: float, now: float):
+        """Take tokens out of the bucket
+
+        Args:
+            cost (:obj:`float`): Number of tokens to take, at most the capacity is taken
+            now (:obj:`float`): Current :func:`time.monotonic`
+        """
+        self._refill(now)
+        self.tokens -= min(cost, self.capacity)
+
+
+class _Job:
+    __slots__ = ('future', 'method', 'args', 'kwargs', 'cost', 'lane', 'sequence', 'tries')
+
+    def __init__(self, method: Callable, args: tuple, kwargs: dict, cost: int, lane: int, sequence: int):
+        self.future = Future()
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.cost = cost
+        self.lane = lane
+        self.sequence = sequence
+        self.tries = 0
+
+
+class _Chat:
+    __slots__ = ('bucket', 'busy', 'blocked_until')
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.busy = False
+        self.blocked_until = 0.0
+
+
+class SendScheduler:
+    """Send all outgoing Telegram messages through rate limits
+
+    Every send is queued and sent by a pool of workers as soon as the limits allow it:
+
+    - A global token bucket for all chats, Telegram allows about 30 messages per second
+    - A token bucket per chat, about one message per second for private chats and 20 per minute for groups
+    - Messages to the same chat are sent one after the other in the order they were submitted
+    - The interactive lane, for answers a user waits for, goes before the bulk lane, for long lists of media. Both lanes
+      keep their own order per chat.
+    - When Telegram answers with :class:`telegram.error.RetryAfter` the chat is paused for the given time and the
+      message is sent again, up to ``retries`` times
+
+    Examples:
+        >>> future = send_scheduler.submit(chat_id, bot.send_photo, chat_id, photo)
+        >>> future.add_done_callback(lambda future: print('sent'))
+        >>> message = send_scheduler.send(chat_id, bot.send_message, chat_id, 'Hi', lane=SendScheduler.INTERACTIVE)
+
+    Args:
+        global_rate (:obj:`float`, optional): Messages per second to all chats together
+        global_burst (:obj:`int`, optional): Messages which can be sent at once to all chats together
+        chat_rate (:obj:`float`, optional): Messages per second to a private chat
+        chat_burst (:obj:`int`, optional): Messages which can be sent at once to a private chat
+        group_rate (:obj:`float`, optional): Messages per second to a group, which has a negative chat id
+        group_burst (:obj:`int`, optional): Messages which can be sent at once to a group
+        max_workers (:obj:`int`, optional): Number of messages sent at the same time, to different chats
+        retries (:obj:`int`, optional): How often a message is sent again after a RetryAfter
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, global_rate: float = 30, global_burst: int = 30, chat_rate: float = 1, chat_burst: int = 3,
+                 group_rate: float = 20 / 60, group_burst: int = 5, max_workers: int = 8, retries: int = 3):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.retries = retries
+
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._queues = OrderedDict()
+        self._chats = {}
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='send')
+        self._thread = None
+        self._running = True
+        self._stats = OrderedDict([
+            ('sent', 0),
+            ('retried', 0),
+            ('failed', 0),
+        ])
+
+    def submit(self, chat_id: int, send_method: Callable, *args, lane: int = BULK, cost: int = 1,
+               **kwargs) -> Future:
+        """Queue a message
+
+        Args:
+            chat_id (:obj:`int`): Chat the message goes to, used for its limit and order. Because of this name the
+                chat id has to be passed to the send method as positional argument.
+            send_method (:obj:`Callable`): Bot method which sends the message, or any callable which sends messages to
+                this chat only. It is called again with the same arguments when Telegram asks to retry, so files have
+                to be opened or rewound inside a callable and not passed as arguments
+            *args (:obj:`list`): Arguments for the send method
+            lane (:obj:`int`, optional): :attr:`INTERACTIVE` or :attr:`BULK`, defaults to :attr:`BULK`
+            cost (:obj:`int`, optional): Number of messages this send counts as, e.g. the size of a media group
+            **kwargs (:obj:`dict`): Keyword arguments for the send method
+
+        Returns:
+            :obj:`concurrent.futures.Future`: Resolves to the result of the send method or its error
+        """
+        with self._condition:
+            if not self._running:
+                raise RuntimeError('The send scheduler was shut down')
+
+            job = _Job(send_method, args, kwargs, cost, lane, next(self._sequence))
+            self._queues.setdefault((lane, chat_id), deque()).append(job)
+            if chat_id not in self._chats:
+                self._chats[chat_id] = _Chat(
+                    TokenBucket(self.group_rate, self.group_burst) if chat_id < 0 else
+                    TokenBucket(self.chat_rate, self.chat_burst)
+                )
+
+            if self._thread is None:
+                self._thread = Thread(target=self._dispatch, name='send_scheduler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return job.future
+
+    def send(self, chat_id: int, send_method: Callable, *args, lane: int = BULK, cost: int = 1, **kwargs):
+        """Queue a message and wait until it is sent
+
+        Args:
+            chat_id (:obj:`int`): Chat the message goes to
+            send_method (:obj:`Callable`): Bot method which sends the message
+            *args (:obj:`list`): Arguments for the send method
+            lane (:obj:`int`, optional): :attr:`INTERACTIVE` or :attr:`BULK`, defaults to :attr:`BULK`
+            cost (:obj:`int`, optional): Number of messages this send counts as
+            **kwargs (:obj:`dict`): Keyword arguments for the send method
+
+        Returns:
+            :obj:`object`: Whatever the send method returns
+
+        Raises:
+            :obj:`Exception`: Whatever the send method raised, RetryAfter only after all retries
+        """
+        return self.submit(chat_id, send_method, *args, lane=lane, cost=cost, **kwargs).result()
+
+    def _next_job(self, now: float) -> tuple:
+        """Find the message to send next, must be called with the lock held
+
+        Returns:
+            :obj:`tuple`: The chat id and the job which can be sent right now, or None and None and the seconds until a
+                message can be sent, which is None if nothing can be sent before a running send finished
+        """
+        ready = None
+        wait = None
+        for (lane, chat_id), queue in self._queues.items():
+            chat = self._chats[chat_id]
+            if chat.busy:
+                continue
+            job = queue[0]
+            job_wait = max(chat.blocked_until - now, chat.bucket.wait_time(job.cost, now))
+            if job_wait <= 0:
+                if ready is None or (job.lane, job.sequence) < (ready[1].lane, ready[1].sequence):
+                    ready = chat_id, job
+            elif wait is None or job_wait < wait:
+                wait = job_wait
+
+        if ready is None:
+            return None, None, wait
+
+        global_wait = self._global_bucket.wait_time(ready[1].cost, now)
+        if global_wait > 0:
+            return None, None, global_wait
+        return ready[0], ready[1], 0
+
+    def _dispatch(self):
+        """Hand messages to the workers whenever the limits allow it
+        """
+        while True:
+            with self._condition:
+                while True:
+                    # Sends which are running could still be put back by a RetryAfter
+                    if not self._running and not self._queues and not any(
+                            chat.busy for chat in self._chats.values()):
+                        return
+                    chat_id, job, wait = self._next_job(time.monotonic())
+                    if job is not None:
+                        break
+                    self._condition.wait(timeout=wait)
+
+                now = time.monotonic()
+                queue = self._queues[(job.lane, chat_id)]
+                queue.popleft()
+                if not queue:
+                    del self._queues[(job.lane, chat_id)]
+
+                # A job which is retried after a RetryAfter is running already
+                if not job.tries and not job.future.set_running_or_notify_cancel():
+                    continue
+
+                chat = self._chats[chat_id]
+                chat.busy = True
+                chat.bucket.take(job.cost, now)
+                self._global_bucket.take(job.cost, now)
+
+            self._executor.submit(self._run, chat_id, job)
+
+    def _run(self, chat_id: int, job: _Job):
+        """Send a message in a worker
+
+        Args:
+            chat_id (:obj:`int`): Chat the message goes to
+            job (:obj:`_Job`): The message
+        """
+        try:
+            result = job.method(*job.args, **job.kwargs)
+        except RetryAfter as error:
+            with self._condition:
+                chat = self._chats[chat_id]
+                chat.busy = False
+                chat.blocked_until = time.monotonic() + error.retry_after
+                # After a shutdown bulk messages are not waited for anymore
+                if job.tries < self.retries and (self._running or job.lane == self.INTERACTIVE):
+                    job.tries += 1
+                    self._stats['retried'] += 1
+                    # Put it back in front, so the order of the chat is kept
+                    self._queues.setdefault((job.lane, chat_id), deque()).appendleft(job)
+                    self._condition.notify()
+                    return
+                self._stats['failed'] += 1
+                self._condition.notify()
+            job.future.set_exception(error)
+            return
+        except BaseException as error:
+            self._finish(chat_id, 'failed')
+            self.logger.debug(f'Sending to {chat_id} failed: {error}')
+            job.future.set_exception(error)
+            return
+
+        self._finish(chat_id, 'sent')
+        job.future.set_result(result)
+
+    def _finish(self, chat_id: int, outcome: str):
+        with self._condition:
+            self._chats[chat_id].busy = False
+            self._stats[outcome] += 1
+            self._condition.notify()
+
+    def stats(self) -> OrderedDict:
+        """Get statistics about queued and sent messages
+
+        Returns:
+            :obj:`collections.OrderedDict`: Queued messages per lane, waiting chats, sent, retried and failed messages
+        """
+        with self._condition:
+            queued = [0, 0]
+            for (lane, chat_id), queue in self._queues.items():
+                queued[lane] += len(queue)
+            stats = OrderedDict([
+                ('queued_interactive', queued[self.INTERACTIVE]),
+                ('queued_bulk', queued[self.BULK]),
+                ('waiting_chats', len(set(chat_id for lane, chat_id in self._queues))),
+            ])
+            stats.update(self._stats)
+            return stats
+
+    def shutdown(self, wait: bool = True, cancel_bulk: bool = True):
+        """Stop accepting messages
+
+        Messages in the interactive lane and messages which are being sent right now are still sent. Queued messages in
+        the bulk lane are cancelled, at the rate limit of a group they could otherwise take minutes.
+
+        Args:
+            wait (:obj:`bool`, optional): Wait until all remaining messages are sent
+            cancel_bulk (:obj:`bool`, optional): Cancel the queued messages of the bulk lane
+        """
+        cancelled = []
+        with self._condition:
+            self._running = False
+            if cancel_bulk:
+                for key in [key for key in self._queues if key[0] == self.BULK]:
+                    cancelled.extend(self._queues.pop(key))
+            self._condition.notify()
+            thread = self._thread
+
+        for job in cancelled:
+            # Jobs put back after a RetryAfter are running already and cannot be cancelled the usual way
+            if not job.future.cancel():
+                job.future.set_exception(CancelledError())
+        if wait and thread is not None:
+            thread.join()
+        self._executor.shutdown(wait=wait)
+
+
+send_scheduler = SendScheduler(**getattr(settings, 'SEND_SCHEDULER', {}))
+stats_registry.register('Send scheduler', send_scheduler.stats)
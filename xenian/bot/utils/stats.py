@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from typing import Callable
+
+__all__ = ['stats_registry']
+
+
+class StatsRegistry:
+    """Collect runtime statistics of various parts of the bot
+
+    Caches, queues and clients register a callable returning a dict of their current numbers. Bot admins can see all
+    of them with the /stats command.
+
+    Examples:
+        >>> cache = TTLCache(timeout=60)
+        >>> stats_registry.register('Some cache', cache.stats)
+
+    Attributes:
+        providers (:obj:`OrderedDict`): Registered providers by name
+    """
+
+    def __init__(self):
+        self.providers = OrderedDict()
+
+    def register(self, name: str, provider: Callable[[], dict]):
+        """Register a statistics provider
+
+        Args:
+            name (:obj:`str`): Name shown in the output
+            provider (:obj:`Callable`): Called without arguments, must return a :obj:`dict`
+        """
+        self.providers[name] = provider
+
+    def collect(self) -> OrderedDict:
+        """Get the current statistics of all providers
+
+        Returns:
+            :obj:`OrderedDict`: Statistics dict by provider name
+        """
+        collected = OrderedDict()
+        for name, provider in self.providers.items():
+            try:
+                collected[name] = provider()
+            except Exception as error:
+                collected[name] = {'error': str(error)}
+        return collected
+
+
+stats_registry = StatsRegistry()
@@ -1,5 +1,7 @@
 import os
 from contextlib import contextmanager
+from functools import partial
+from io import BytesIO
 from tempfile import NamedTemporaryFile
 
 from PIL import Image
@@ -18,7 +20,7 @@ except NeedDownloadError as error:
         raise error
 
 __all__ = ['image_download', 'sticker_download', 'video_download', 'video_to_gif', 'video_to_gif_download',
-           'auto_download']
+           'auto_download', 'preview_download']
 
 
 @contextmanager
@@ -88,19 +90,33 @@ def video_download(bot: Bot, message: Message):
 
 
 @contextmanager
-def sticker_download(bot: Bot, message: Message):
+def sticker_download(bot: Bot, message: Message, in_memory: bool = False):
     """Download a sticker
 
 
     Args:
         bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
         message (:obj:`telegram.message.Message`): Telegram Api Message Object
+        in_memory (:obj:`bool`, optional): Convert the sticker in memory and return a file like object instead of a
+            path
 
     Returns:
-        :obj:`str`: Path to image file
+        :obj:`str` or :obj:`io.BytesIO`: Path to image file or the image with a name attribute
     """
     sticker_image = bot.getFile(message.sticker.file_id)
 
+    if in_memory:
+        sticker_file = BytesIO()
+        sticker_image.download(out=sticker_file)
+        sticker_file.seek(0)
+
+        image_file = BytesIO()
+        image_file.name = 'sticker.png'
+        Image.open(sticker_file).convert("RGBA").save(image_file, 'png')
+        image_file.seek(0)
+        yield image_file
+        return
+
     with CustomNamedTemporaryFile(suffix='.png') as image_file:
         sticker_image.download(out=image_file)
         image_file.close()
@@ -111,25 +127,79 @@ def sticker_download(bot: Bot, message: Message):
 
 
 @contextmanager
-def image_download(bot: Bot, message: Message):
+def image_download(bot: Bot, message: Message, in_memory: bool = False):
     """Download an image
 
 
     Args:
         bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
         message (:obj:`telegram.message.Message`): Telegram Api Message Object
+        in_memory (:obj:`bool`, optional): Download the image into memory and return a file like object instead of a
+            path
 
     Returns:
-        :obj:`str`: Path to image file
+        :obj:`str` or :obj:`io.BytesIO`: Path to image file or the image with a name attribute
     """
     photo = bot.getFile(message.photo[-1].file_id)
+    if in_memory:
+        image_file = BytesIO()
+        image_file.name = 'image' + (os.path.splitext(photo.file_path or '')[1] or '.jpg')
+        photo.download(out=image_file)
+        image_file.seek(0)
+        yield image_file
+        return
+
     with NamedTemporaryFile(suffix='.png') as image_file:
         photo.download(out=image_file)
         yield image_file.name
 
 
+def get_media_message(update: Update) -> Message:
+    """Get the message whose media should be used, which is the replied to message if there is one
+
+    Args:
+        update (:obj:`telegram.update.Update`): Telegram Api Update Object
+
+    Returns:
+        :obj:`telegram.message.Message`: The message with the media
+    """
+    msg = update.message
+    return msg.reply_to_message if getattr(msg, 'reply_to_message') else msg
+
+
+def preview_download(bot: Bot, update: Update) -> BytesIO or None:
+    """Download the smallest preview Telegram has of the media in a message
+
+    Telegram creates small previews of photos, stickers, videos and documents. They are enough to recognise an image
+    and much cheaper than downloading and converting the file itself. The message is chosen like in
+    :func:`auto_download`.
+
+    Args:
+        bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
+        update (:obj:`telegram.update.Update`): Telegram Api Update Object
+
+    Returns:
+        :obj:`io.BytesIO`: The preview image or :obj:`None` if the media has no preview
+    """
+    msg = get_media_message(update)
+
+    if msg.photo:
+        preview = min(msg.photo, key=lambda size: size.width * size.height)
+    else:
+        media = msg.sticker or msg.document or msg.video
+        preview = getattr(media, 'thumb', None)
+
+    if preview is None:
+        return None
+
+    preview_file = BytesIO()
+    bot.getFile(preview.file_id).download(out=preview_file)
+    preview_file.seek(0)
+    return preview_file
+
+
 @contextmanager
-def auto_download(bot: Bot, update: Update, convert_video_to_gif: bool = False):
+def auto_download(bot: Bot, update: Update, convert_video_to_gif: bool = False, in_memory: bool = False):
     """Auto download the correct file with the given message
 
     How the file to download is chosen:
@@ -154,19 +224,16 @@ def auto_download(bot: Bot, update: Update, convert_video_to_gif: bool = False):
         bot (:obj:`telegram.bot.Bot`): Telegram Api Bot Object.
         update (:obj:`telegram.update.Update`): Telegram Api Update Object
         convert_video_to_gif (:obj:`bool`, optional): If the file is a video should it be converted to an gif
+        in_memory (:obj:`bool`, optional): Return images and stickers as file like objects with a name attribute
+            instead of writing them to a temp file. Videos are always returned as a path.
     """
     generator = None
-
-    msg = update.message
-    reply_to_msg = msg.reply_to_message if getattr(msg, 'reply_to_message') else msg
-
-    if reply_to_msg is not msg:
-        msg = reply_to_msg
+    msg = get_media_message(update)
 
     if msg.photo:
-        generator = image_download
+        generator = partial(image_download, in_memory=in_memory)
     elif msg.sticker:
-        generator = sticker_download
+        generator = partial(sticker_download, in_memory=in_memory)
     elif msg.document or msg.video:
         if convert_video_to_gif:
             generator = video_to_gif_download
@@ -0,0 +1,185 @@
+import os
+import zipfile
+from tempfile import NamedTemporaryFile
+from typing import Callable
+
+__all__ = ['SplitZipWriter']
+
+
+class SplitZipWriter:
+    """Write files into zip archives, which are split into parts of a maximum size
+
+    Entries are written as soon as they are added, so nothing has to be collected first. Before an entry would make the
+    current part larger than ``max_size``, the part is finished and handed to ``on_part`` and a new part is started.
+    Entries which belong together are added with :meth:`write_group`, so they always end up in the same part. Entries
+    which would not even fit into an empty part are skipped. Files which are compressed already, like images and
+    videos, are stored as they are instead of deflating them again.
+
+    Examples:
+        >>> def send(path, number):
+        >>>     bot.send_document(chat_id, open(path, 'rb'), filename=f'part{number}.zip')
+        >>> with SplitZipWriter(on_part=send) as zip_writer:
+        >>>     zip_writer.write('/tmp/image.png', '1.png')
+        >>>     zip_writer.write_group(files=[('/tmp/image.png', '2.png')], strings=[('2.json', json.dumps(post))])
+
+    Attributes:
+        max_size (:obj:`int`): Maximum size of a part in bytes
+        on_part (:obj:`Callable`): Called with the path and the number of every finished part, starting at 1. The file
+            is removed after it returns.
+        on_close_part (:obj:`Callable`): Called with the :obj:`zipfile.ZipFile` of a part and the names of its entries
+            before the part is finished, to add a last entry like an index. The entry must be smaller than
+            ``reserved_size``.
+        parts (:obj:`int`): Number of finished parts
+
+    Args:
+        on_part (:obj:`Callable`): Called with the path and the number of every finished part
+        max_size (:obj:`int`, optional): Maximum size of a part in bytes, defaults to somewhat less than the 50MB
+            Telegram accepts
+        on_close_part (:obj:`Callable`, optional): Called with the :obj:`zipfile.ZipFile` of a part and the names of
+            its entries before the part is finished
+        reserved_size (:obj:`int`, optional): Bytes kept free in every part for the entry of ``on_close_part``
+    """
+
+    stored_extensions = {
+        '.jpg', '.jpeg', '.png', '.gif', '.webp', '.webm', '.mp4', '.mkv', '.mp3', '.ogg', '.zip', '.gz', '.7z',
+    }
+
+    # Bytes per entry for the local header and the central directory record, without the file name
+    entry_overhead = 30 + 46 + 24
+    end_record_size = 22
+
+    def __init__(self, on_part: Callable[[str, int], None], max_size: int = 45 * 1024 * 1024,
+                 on_close_part: Callable[[zipfile.ZipFile, list], None] = None, reserved_size: int = 64 * 1024):
+        self.on_part = on_part
+        self.max_size = max_size
+        self.on_close_part = on_close_part
+        self.reserved_size = reserved_size
+        self.parts = 0
+
+        self._file = None
+        self._zip = None
+        self._names = []
+        self._directory_size = 0
+
+    def _compression(self, name: str) -> int:
+        """Get the compression for an entry
+
+        Args:
+            name (:obj:`str`): Name of the entry
+
+        Returns:
+            :obj:`int`: :obj:`zipfile.ZIP_STORED` for files which are compressed already, otherwise
+                :obj:`zipfile.ZIP_DEFLATED`
+        """
+        return zipfile.ZIP_STORED if os.path.splitext(name)[1].lower() in self.stored_extensions \
+            else zipfile.ZIP_DEFLATED
+
+    def _make_room(self, entries: list) -> bool:
+        """Finish the current part if entries do not fit into it anymore and make sure a part is open
+
+        Args:
+            entries (:obj:`list`): Tuples of the name and the uncompressed size of every entry, which is the most it
+                can take in the archive
+
+        Returns:
+            :obj:`bool`: False if the entries do not even fit into an empty part, then nothing is changed
+        """
+        entries_size = sum(size + self.entry_overhead + 2 * len(name.encode()) for name, size in entries)
+        if entries_size + self.end_record_size + self.reserved_size > self.max_size:
+            return False
+
+        if self._zip is not None and self._names:
+            used = self._file.tell() + self._directory_size + self.end_record_size + self.reserved_size
+            if used + entries_size > self.max_size:
+                self._finish_part()
+
+        if self._zip is None:
+            self._file = NamedTemporaryFile(prefix='xenian-', suffix='.zip', delete=False)
+            self._zip = zipfile.ZipFile(self._file, mode='w')
+            self._names = []
+            self._directory_size = 0
+
+        for name, _ in entries:
+            self._names.append(name)
+            self._directory_size += 46 + len(name.encode())
+        return True
+
+    def _finish_part(self):
+        """Close the current part and hand it to :attr:`on_part`
+        """
+        if self._zip is None:
+            return
+
+        try:
+            if self.on_close_part is not None:
+                self.on_close_part(self._zip, list(self._names))
+            self._zip.close()
+            self._file.close()
+            self.parts += 1
+            self.on_part(self._file.name, self.parts)
+        finally:
+            self._zip = None
+            self._file.close()
+            os.unlink(self._file.name)
+
+    def write(self, path: str, name: str) -> bool:
+        """Add a file
+
+        Args:
+            path (:obj:`str`): Path to the file
+            name (:obj:`str`): Name of the entry in the archive
+
+        Returns:
+            :obj:`bool`: False if the file was skipped because it is too big for a part
+        """
+        return self.write_group(files=[(path, name)])
+
+    def writestr(self, name: str, data: str or bytes) -> bool:
+        """Add an entry from memory
+
+        Args:
+            name (:obj:`str`): Name of the entry in the archive
+            data (:obj:`str` or :obj:`bytes`): Content of the entry, text is encoded as UTF-8
+
+        Returns:
+            :obj:`bool`: False if the entry was skipped because it is too big for a part
+        """
+        return self.write_group(strings=[(name, data)])
+
+    def write_group(self, files: list = (), strings: list = ()) -> bool:
+        """Add entries which have to end up in the same part
+
+        Args:
+            files (:obj:`list`, optional): Tuples of the path to a file and the name of its entry, like :meth:`write`
+            strings (:obj:`list`, optional): Tuples of the name of an entry and its content, like :meth:`writestr`
+
+        Returns:
+            :obj:`bool`: False if the entries were skipped because together they are too big for a part
+        """
+        strings = [(name, data.encode() if isinstance(data, str) else data) for name, data in strings]
+        entries = [(name, os.path.getsize(path)) for path, name in files] + \
+                  [(name, len(data)) for name, data in strings]
+        if not self._make_room(entries):
+            return False
+
+        for path, name in files:
+            self._zip.write(path, name, compress_type=self._compression(name))
+        for name, data in strings:
+            self._zip.writestr(name, data, compress_type=self._compression(name))
+        return True
+
+    def close(self):
+        """Finish the last part
+        """
+        self._finish_part()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        elif self._zip is not None:
+            self._zip = None
+            self._file.close()
+            os.unlink(self._file.name)